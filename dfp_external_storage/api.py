@@ -1,24 +1,143 @@
+import mimetypes
+
 import frappe
 from frappe import _
+from frappe.utils import cint, get_datetime
+
+from dfp_external_storage import bulk_offload, direct_upload, reconcile, relocate
+from dfp_external_storage.presigned_url_cache import (
+    get_presigned_url as get_presigned_url_cached,
+    get_presigned_urls as get_presigned_urls_cached,
+)
+from dfp_external_storage.storage_settings import get_storage_settings
+
+
+# Media library page size limits
+MEDIA_LIBRARY_PAGE_SIZE = 50
+MEDIA_LIBRARY_MAX_PAGE_SIZE = 200
+# Total count stops counting at this many rows (then it is an estimate)
+MEDIA_LIBRARY_COUNT_CAP = 10000
+
+
+def escape_like(text):
+    "Text matched literally within a LIKE pattern (`%`, `_` and `\\` escaped)"
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _file_types_for_mimetype(mimetype):
+    "File `file_type` values (upper case extensions) matching a mimetype prefix"
+    return sorted(
+        {
+            ext.lstrip(".").upper()
+            for ext, type_ in mimetypes.types_map.items()
+            if type_.startswith(mimetype)
+        }
+    )
 
 
 @frappe.whitelist()
-def get_media_library():
-    """Get S3 file library"""
-    files = frappe.get_all(
+def get_media_library(
+    storage=None, folder=None, mimetype=None, name=None, cursor=None, page_size=None
+):
+    """
+    Get a page of files stored externally, newest first
+
+    Pages are keyset paginated on (creation, name), so every page costs the
+    same whatever its depth. Total count is only computed for the first page
+    and stops at `MEDIA_LIBRARY_COUNT_CAP`.
+
+    Args:
+        storage (str): DFP External Storage name
+        folder (str): File folder
+        mimetype (str): Mimetype or mimetype prefix (e.g. "image/")
+        name (str): Text within file name
+        cursor (str): `next_cursor` of previous page
+        page_size (int): Files per page
+
+    Returns:
+        dict: {"files", "next_cursor", "total", "total_is_estimate"}
+    """
+    frappe.has_permission("File", "read", throw=True)
+    page_size = min(cint(page_size) or MEDIA_LIBRARY_PAGE_SIZE, MEDIA_LIBRARY_MAX_PAGE_SIZE)
+
+    # frappe.get_list applies File row permissions (private files of others)
+    filters = [
+        ["is_folder", "=", 0],
+        ["dfp_external_storage", "is", "set"],
+    ]
+    if storage:
+        filters.append(["dfp_external_storage", "=", storage])
+    if folder:
+        filters.append(["folder", "=", folder])
+    if mimetype:
+        file_types = _file_types_for_mimetype(mimetype)
+        if not file_types:
+            return {"files": [], "next_cursor": None, "total": 0, "total_is_estimate": False}
+        filters.append(["file_type", "in", file_types])
+    if name:
+        filters.append(["file_name", "like", f"%{escape_like(name)}%"])
+
+    total = total_is_estimate = None
+    or_filters = None
+    if not cursor:
+        total = len(
+            frappe.get_list(
+                "File",
+                filters=filters,
+                pluck="name",
+                limit_page_length=MEDIA_LIBRARY_COUNT_CAP + 1,
+            )
+        )
+        total_is_estimate = total > MEDIA_LIBRARY_COUNT_CAP
+        total = min(total, MEDIA_LIBRARY_COUNT_CAP)
+    else:
+        cursor_creation, _separator, cursor_name = cursor.partition("|")
+        try:
+            # get_datetime("") would be now
+            cursor_creation = get_datetime(cursor_creation) if cursor_creation else None
+        except Exception:
+            cursor_creation = None
+        if not cursor_creation or not cursor_name:
+            frappe.throw(_("Invalid cursor"))
+        # Within creation <= cursor, "creation < cursor or name < cursor name"
+        # is the (creation, name) keyset condition
+        filters.append(["creation", "<=", cursor_creation])
+        or_filters = [
+            ["creation", "<", cursor_creation],
+            ["name", "<", cursor_name],
+        ]
+
+    files = frappe.get_list(
         "File",
-        filters={"is_folder": 0, "dfp.external_storage": ("is", "set")},
+        filters=filters,
+        or_filters=or_filters,
         fields=[
             "name",
             "file_name",
             "file_url",
             "is_private",
+            "folder",
+            "file_size",
+            "creation",
             "dfp_external_storage",
             "dfp_external_storage_s3_key",
         ],
+        order_by="creation desc, name desc",
+        limit_page_length=page_size + 1,
     )
 
-    return files
+    next_cursor = None
+    if len(files) > page_size:
+        files = files[:page_size]
+        last = files[-1]
+        next_cursor = f"{last.creation}|{last.name}"
+
+    return {
+        "files": files,
+        "next_cursor": next_cursor,
+        "total": total,
+        "total_is_estimate": total_is_estimate,
+    }
 
 
 @frappe.whitelist()
@@ -31,15 +150,13 @@ def get_presigned_url(file_id):
             or not file_doc.dfp_external_storage_s3_key
         ):
             return {"success": False, "message": "File not stored in S3"}
-        storage_doc = frappe.get_doc(
-            "DFP External Storage", file_doc.dfp_external_storage
-        )
+        settings = get_storage_settings(file_doc.dfp_external_storage)
 
         # Check if presigned URLs are enabled
-        if not storage_doc.presigned_urls:
+        if not settings.presigned_urls:
             return {"success": False, "message": "Could not generate presigned URL"}
-        # Get presigned URL with proper expiration
-        presigned_url = file_doc.dfp_presigned_url_get()
+        # Get presigned URL with proper expiration, reused while valid
+        presigned_url = get_presigned_url_cached(file_doc)
         if not presigned_url:
             return {"success": False, "message": "Could not generate presigned URL"}
 
@@ -47,40 +164,194 @@ def get_presigned_url(file_id):
             "success": True,
             "presigned_url": presigned_url,
             "file_name": file_doc.file_name,
-            "expiration_seconds": storage_doc.setting_presigned_url_expiration,
+            "expiration_seconds": settings.presigned_url_expiration,
         }
     except Exception as e:
         frappe.log_error(f"Error generating presigned URL: {str(e)}")
         return {"success": False, "message": str(e)}
 
 
+# Max files per `get_presigned_urls` call
+MAX_PRESIGNED_URLS_PER_CALL = 500
+
+
 @frappe.whitelist()
-def bulk_offload_files(storage_name=None, folder=None, limit=100):
-    """Bulk offload files to S3"""
-    if not storage_name:
-        return {"success": False, "message": "Storage name is required"}
+def get_presigned_urls(file_ids):
+    """
+    Get presigned URLs for many files in one call
 
-    filters = {"is_folder": 0, "dfp_external_storage": ("is", "not set")}
-    if folder:
-        filters["folder"] = folder
+    File rows are read with a single permission filtered query, and URLs are
+    signed in bulk per storage. Files not readable by the user, not stored
+    externally or not allowed to have presigned URLs are left out.
 
-    files = frappe.get_all("File", filters=filters, fields=["name"], limit=limit)
+    Args:
+        file_ids (list | str): File names (list or JSON list)
 
-    success_count = 0
-    failed_count = 0
-    for file_data in files:
-        try:
-            file_doc = frappe.get_doc("File", file_data.name)
-            file_doc.dfp_external_storage = storage_name
-            file_doc.save()
-            success_count += 1
-        except Exception as e:
-            frappe.log_error(f"Bulk offload failed for file {file_data.name}: {str(e)}")
-            failed_count += 1
+    Returns:
+        dict: {"success": True, "urls": {file_id: {"presigned_url", "expiration_seconds"}}}
+    """
+    try:
+        file_ids = frappe.parse_json(file_ids) if isinstance(file_ids, str) else file_ids
+        if not isinstance(file_ids, list):
+            return {"success": False, "message": _("file_ids must be a list")}
+        if len(file_ids) > MAX_PRESIGNED_URLS_PER_CALL:
+            return {
+                "success": False,
+                "message": _("Up to {0} files per call").format(MAX_PRESIGNED_URLS_PER_CALL),
+            }
+        if not file_ids:
+            return {"success": True, "urls": {}}
+
+        files = frappe.get_list(
+            "File",
+            filters={"name": ("in", file_ids), "dfp_external_storage": ("is", "set")},
+            fields=[
+                "name",
+                "file_name",
+                "dfp_external_storage",
+                "dfp_external_storage_s3_key",
+            ],
+        )
+        urls = get_presigned_urls_cached(files)
+
+        return {
+            "success": True,
+            "urls": {
+                f.name: {
+                    "presigned_url": urls[f.name],
+                    "expiration_seconds": get_storage_settings(
+                        f.dfp_external_storage
+                    ).presigned_url_expiration,
+                }
+                for f in files
+                if f.name in urls
+            },
+        }
+    except Exception as e:
+        frappe.log_error(f"Error generating presigned URLs: {str(e)}")
+        return {"success": False, "message": str(e)}
 
+
+@frappe.whitelist()
+def bulk_offload_files(storage_name=None, folder=None, limit=None, workers=None):
+    """
+    Bulk offload files to S3 in background
+
+    Work is sharded across parallel background jobs (see `bulk_offload`),
+    progress is published with `dfp_external_storage_bulk_offload` realtime
+    event.
+    """
+    frappe.only_for("System Manager")
+    if not storage_name:
+        return {"success": False, "message": "Storage name is required"}
+
+    job_id = bulk_offload.start_bulk_offload(storage_name, folder, workers=workers, limit=limit)
+    summary = bulk_offload.get_summary(job_id)
     return {
         "success": True,
-        "message": f"Processed {len(files)} files: {success_count} successful, {failed_count} failed",
-        "successful": success_count,
-        "failed": failed_count,
+        "message": f"Offloading {summary['total']} files in background",
+        "job_id": job_id,
+        "total": summary["total"],
     }
+
+
+@frappe.whitelist()
+def get_bulk_offload_status(job_id):
+    frappe.only_for("System Manager")
+    return bulk_offload.get_summary(job_id)
+
+
+@frappe.whitelist()
+def cancel_bulk_offload(job_id):
+    frappe.only_for("System Manager")
+    return bulk_offload.cancel_bulk_offload(job_id)
+
+
+@frappe.whitelist()
+def resume_bulk_offload(job_id):
+    frappe.only_for("System Manager")
+    return bulk_offload.resume_bulk_offload(job_id)
+
+
+@frappe.whitelist()
+def reconcile_storage(storage_name, sync=1, delete_orphans=0, orphan_min_age_hours=None):
+    """
+    Find orphan remote objects and dangling "File" references in background
+
+    Report path and counters are published with `dfp_external_storage_reconcile`
+    realtime event (see `reconcile`).
+    """
+    frappe.only_for("System Manager")
+    reconcile.enqueue_reconcile(storage_name, sync, delete_orphans, orphan_min_age_hours)
+    return {"success": True, "message": f"Reconciling {storage_name} in background"}
+
+
+@frappe.whitelist()
+def relocate_files(file_ids, target_storage=None):
+    """
+    Move Files to another storage (or local filesystem) in background
+
+    S3 to S3 moves within the same endpoint and credentials are copied server
+    side (see `relocate`).
+
+    Args:
+        file_ids (list | str): File names (list or JSON list)
+        target_storage (str): DFP External Storage name, empty for local filesystem
+    """
+    frappe.only_for("System Manager")
+    file_ids = frappe.parse_json(file_ids) if isinstance(file_ids, str) else file_ids
+    if not isinstance(file_ids, list) or not file_ids:
+        return {"success": False, "message": _("file_ids must be a non empty list")}
+    relocate.enqueue_relocate_files(file_ids, target_storage)
+    return {"success": True, "message": f"Moving {len(file_ids)} files in background"}
+
+
+@frappe.whitelist()
+def start_direct_upload(
+    file_name,
+    size,
+    content_type=None,
+    folder=None,
+    is_private=1,
+    doctype=None,
+    docname=None,
+    fieldname=None,
+):
+    """
+    Start a browser to storage upload (see `direct_upload`)
+
+    Returns {"direct": False} when the file must go through the regular upload.
+    """
+    return direct_upload.start_upload(
+        file_name,
+        size,
+        content_type,
+        folder,
+        is_private,
+        doctype=doctype,
+        docname=docname,
+        fieldname=fieldname,
+    )
+
+
+@frappe.whitelist()
+def sign_direct_upload_parts(upload_token, part_numbers):
+    part_numbers = frappe.parse_json(part_numbers) if isinstance(part_numbers, str) else part_numbers
+    return direct_upload.sign_parts(upload_token, part_numbers)
+
+
+@frappe.whitelist(methods=["POST"])
+def complete_direct_upload(upload_token, parts=None):
+    """
+    Register the File of a finished direct upload
+
+    Args:
+        parts: S3 part numbers and etags (list or JSON list)
+    """
+    parts = frappe.parse_json(parts) if isinstance(parts, str) else parts
+    return direct_upload.complete_upload(upload_token, parts)
+
+
+@frappe.whitelist(methods=["POST"])
+def abort_direct_upload(upload_token):
+    direct_upload.abort_upload(upload_token)
@@ -0,0 +1,140 @@
+"""
+DFP External Storage - file proxy block cache benchmark
+
+Counts remote ranged reads (GETs) and bytes fetched by a file proxy without
+block cache (every read is a GET) and by `file_proxy.RangeFileProxy`, for a
+few random access workloads over an in memory "remote" object.
+
+Usage (no site needed):
+    python -m dfp_external_storage.benchmarks.block_cache
+"""
+
+import io
+import random
+import zipfile
+
+from dfp_external_storage.file_proxy import RangeFileProxy
+
+ZIP_MEMBERS = 20000
+MEMBER_SIZE = 2048
+RANDOM_READS = 2000
+SEED = 42
+
+
+class CountingSource:
+    "In memory remote object counting ranged reads"
+
+    def __init__(self, data):
+        self.data = data
+        self.reads = 0
+        self.bytes = 0
+
+    def read_range(self, offset, length):
+        self.reads += 1
+        self.bytes += length
+        return self.data[offset : offset + length]
+
+
+class UncachedProxy(io.RawIOBase):
+    "One ranged read per read call, like a plain seekable proxy"
+
+    def __init__(self, read_range, size):
+        self._read_range = read_range
+        self.size = size
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self.size}[whence]
+        self._pos = base + offset
+        return self._pos
+
+    def readinto(self, b):
+        length = min(len(b), self.size - self._pos)
+        if length <= 0:
+            return 0
+        data = self._read_range(self._pos, length)
+        b[: len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+
+def make_zip():
+    rnd = random.Random(SEED)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as z:
+        for i in range(ZIP_MEMBERS):
+            z.writestr(f"folder_{i % 100}/member_{i}.bin", rnd.randbytes(MEMBER_SIZE))
+    return buffer.getvalue()
+
+
+def workload_zip_toc(f):
+    with zipfile.ZipFile(f) as z:
+        return len(z.infolist())
+
+
+def workload_zip_some_members(f):
+    with zipfile.ZipFile(f) as z:
+        names = z.namelist()
+        rnd = random.Random(SEED)
+        for name in rnd.sample(names, 50):
+            z.read(name)
+
+
+def workload_clustered_random_reads(f):
+    "Small reads around a few hot regions (parsers jumping between structures)"
+    f.seek(0, io.SEEK_END)
+    size = f.tell()
+    rnd = random.Random(SEED)
+    hot = [rnd.randrange(size) for _ in range(8)]
+    for _ in range(RANDOM_READS):
+        f.seek(max(0, min(size - 1, rnd.choice(hot) + rnd.randrange(-65536, 65536))))
+        f.read(rnd.randrange(16, 4096))
+
+
+def workload_sequential(f):
+    while f.read(64 * 1024):
+        pass
+
+
+WORKLOADS = (
+    ("zip table of contents", workload_zip_toc),
+    ("zip 50 random members", workload_zip_some_members),
+    ("clustered random reads", workload_clustered_random_reads),
+    ("sequential 64KB reads", workload_sequential),
+)
+
+
+def run_workload(data, workload, cached):
+    source = CountingSource(data)
+    if cached:
+        raw = RangeFileProxy(source.read_range, len(data))
+    else:
+        raw = UncachedProxy(source.read_range, len(data))
+    workload(io.BufferedReader(raw))
+    return source.reads, source.bytes
+
+
+def main():
+    data = make_zip()
+    print(f"Remote object: zip with {ZIP_MEMBERS} members, {len(data) / 1024 / 1024:.1f} MB\n")
+    print(f"{'workload':<26} {'GETs (no cache)':>16} {'GETs (block cache)':>19} {'MB (no cache)':>14} {'MB (block cache)':>17}")
+    for title, workload in WORKLOADS:
+        plain_reads, plain_bytes = run_workload(data, workload, cached=False)
+        cached_reads, cached_bytes = run_workload(data, workload, cached=True)
+        print(
+            f"{title:<26} {plain_reads:>16} {cached_reads:>19} "
+            f"{plain_bytes / 1024 / 1024:>14.2f} {cached_bytes / 1024 / 1024:>17.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+DFP External Storage - "File" indexes benchmark
+
+Seeds fake "File" rows, then reports query plans and timings of the queries
+this app runs against `tabFile` without and with the composite indexes added
+by `patches/v1_2/add_file_external_storage_indexes.py`.
+
+Use a test site only: indexes are dropped during the "before" run and seeded
+rows are removed at the end (unless keep=True).
+
+Usage:
+    bench --site [site-name] execute dfp_external_storage.benchmarks.file_indexes.run
+    bench --site [site-name] execute dfp_external_storage.benchmarks.file_indexes.run \
+        --kwargs "{'rows': 1000000, 'repeat': 20}"
+"""
+
+import hashlib
+import statistics
+import time
+
+import frappe
+from frappe.utils import now
+
+from dfp_external_storage.patches.v1_2.add_file_external_storage_indexes import (
+    FILE_INDEXES,
+    add_file_indexes,
+)
+
+NAME_PREFIX = "dfp-bench-"
+STORAGES = [f"{NAME_PREFIX}storage-{i}" for i in range(4)]
+SEED_CHUNK_SIZE = 10000
+
+# (title, sql) run on every pass, with the sampled values
+QUERIES = (
+    (
+        "Files sharing a remote key (delete)",
+        """SELECT name FROM `tabFile`
+        WHERE dfp_external_storage = %(storage)s AND dfp_external_storage_s3_key = %(key)s""",
+    ),
+    (
+        "Same content hash in storage (upload)",
+        """SELECT name, dfp_external_storage_s3_key FROM `tabFile`
+        WHERE content_hash = %(content_hash)s AND dfp_external_storage = %(storage)s
+            AND dfp_external_storage_s3_key != '' LIMIT 1""",
+    ),
+    (
+        "Files in storage (media library)",
+        """SELECT name, file_name, file_url FROM `tabFile`
+        WHERE is_folder = 0 AND dfp_external_storage = %(storage)s LIMIT 50""",
+    ),
+    (
+        "Files count in storage (uninstall helper)",
+        """SELECT COUNT(*) FROM `tabFile` WHERE dfp_external_storage = %(storage)s""",
+    ),
+)
+
+
+def _row(i):
+    storage = STORAGES[i % len(STORAGES)]
+    # Every 3rd row is local only, every 10th shares key with previous one
+    remote = i % 3 != 0
+    key_id = i - 1 if i % 10 == 0 else i
+    content_hash = hashlib.md5(str(key_id).encode()).hexdigest()
+    timestamp = now()
+    return (
+        f"{NAME_PREFIX}{i}",
+        f"bench_{i}.pdf",
+        f"/file/{NAME_PREFIX}{i}/bench_{i}.pdf" if remote else f"/private/files/bench_{i}.pdf",
+        1,
+        0,
+        "Home",
+        content_hash,
+        storage if remote else None,
+        f"{frappe.local.site}/bench/{content_hash}.pdf" if remote else None,
+        timestamp,
+        timestamp,
+        "Administrator",
+        "Administrator",
+    )
+
+
+def seed(rows):
+    fields = [
+        "name",
+        "file_name",
+        "file_url",
+        "is_private",
+        "is_folder",
+        "folder",
+        "content_hash",
+        "dfp_external_storage",
+        "dfp_external_storage_s3_key",
+        "creation",
+        "modified",
+        "owner",
+        "modified_by",
+    ]
+    existing = frappe.db.count("File", {"name": ["like", f"{NAME_PREFIX}%"]})
+    for start in range(existing, rows, SEED_CHUNK_SIZE):
+        values = [_row(i) for i in range(start, min(start + SEED_CHUNK_SIZE, rows))]
+        frappe.db.bulk_insert("File", fields, values, ignore_duplicates=True)
+        frappe.db.commit()
+        print(f"Seeded {start + len(values)}/{rows} rows")
+
+
+def cleanup():
+    frappe.db.sql("DELETE FROM `tabFile` WHERE name LIKE %s", f"{NAME_PREFIX}%")
+    frappe.db.commit()
+
+
+def drop_file_indexes():
+    for index_name, _columns in FILE_INDEXES:
+        if frappe.db.has_index("tabFile", index_name):
+            frappe.db.sql_ddl(f"ALTER TABLE `tabFile` DROP INDEX `{index_name}`")
+
+
+def _sample_values(rows):
+    i = rows // 2 + 1  # remote row
+    sample = _row(i)
+    return {"storage": sample[7], "key": sample[8], "content_hash": sample[6]}
+
+
+def measure(values, repeat):
+    results = []
+    for title, sql in QUERIES:
+        plan = frappe.db.sql(f"EXPLAIN {sql}", values, as_dict=True)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            frappe.db.sql(sql, values)
+            timings.append(time.perf_counter() - start)
+        results.append(
+            {
+                "query": title,
+                "median_ms": round(statistics.median(timings) * 1000, 3),
+                "plan": [
+                    {k: p.get(k) for k in ("table", "type", "key", "rows", "Extra")} for p in plan
+                ],
+            }
+        )
+    return results
+
+
+def report(label, results):
+    print(f"\n== {label} ==")
+    for r in results:
+        print(f"- {r['query']}: {r['median_ms']} ms")
+        for p in r["plan"]:
+            print(f"    type={p['type']} key={p['key']} rows={p['rows']} extra={p['Extra']}")
+
+
+def run(rows=1000000, repeat=10, keep=False):
+    seed(rows)
+    values = _sample_values(rows)
+
+    drop_file_indexes()
+    before = measure(values, repeat)
+    report("Before (no composite indexes)", before)
+
+    add_file_indexes()
+    after = measure(values, repeat)
+    report("After (composite indexes)", after)
+
+    if not keep:
+        cleanup()
+
+    return {"rows": rows, "before": before, "after": after}
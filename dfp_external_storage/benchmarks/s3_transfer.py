@@ -0,0 +1,95 @@
+"""
+DFP External Storage - S3 multipart upload benchmark
+
+Uploads a generated local file to an S3 compatible server (a local MinIO
+stand-in) with a few multipart part size / concurrency combinations through
+`S3Connection.upload_file`, and reports throughput of each one. The first row
+(no multipart) is the single stream upload used before part size and
+concurrency were configurable.
+
+Start a MinIO stand-in first, e.g.:
+    docker run -p 9000:9000 -e MINIO_ROOT_USER=minioadmin \
+        -e MINIO_ROOT_PASSWORD=minioadmin minio/minio server /data
+
+Usage (no site needed):
+    python -m dfp_external_storage.benchmarks.s3_transfer
+    python -m dfp_external_storage.benchmarks.s3_transfer --size-mb 4096 \
+        --endpoint http://localhost:9000 --bucket dfp-bench
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from dfp_external_storage.s3_integration import S3Connection
+
+MB = 1024 * 1024
+# (title, multipart threshold, part size, concurrency)
+CONFIGS = (
+    ("single stream", 1024 * 1024 * MB, 16 * MB, 1),
+    ("8MB parts x 4", 8 * MB, 8 * MB, 4),
+    ("16MB parts x 8", 8 * MB, 16 * MB, 8),
+    ("64MB parts x 8", 8 * MB, 64 * MB, 8),
+    ("64MB parts x 16", 8 * MB, 64 * MB, 16),
+)
+
+
+def make_file(size):
+    "Local file of random content (not compressible by the server)"
+    f = tempfile.NamedTemporaryFile(prefix="dfp-bench-", delete=False)
+    with f:
+        block = os.urandom(MB)
+        for _ in range(size // MB):
+            f.write(block)
+    return f.name
+
+
+def run_config(args, local_path, size, multipart_threshold, part_size, concurrency):
+    connection = S3Connection(
+        endpoint=args.endpoint,
+        access_key=args.access_key,
+        secret_key=args.secret_key,
+        region=args.region,
+        multipart_threshold=multipart_threshold,
+        multipart_chunksize=part_size,
+        max_concurrency=concurrency,
+    )
+    key = f"dfp-bench/{part_size}-{concurrency}.bin"
+    start = time.perf_counter()
+    connection.upload_file(args.bucket, key, local_path)
+    elapsed = time.perf_counter() - start
+    connection.client.delete_object(Bucket=args.bucket, Key=key)
+    return size / elapsed / 1024 / MB, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--endpoint", default="http://localhost:9000")
+    parser.add_argument("--access-key", default="minioadmin")
+    parser.add_argument("--secret-key", default="minioadmin")
+    parser.add_argument("--region", default="us-east-1")
+    parser.add_argument("--bucket", default="dfp-bench")
+    parser.add_argument("--size-mb", type=int, default=1024)
+    args = parser.parse_args()
+
+    size = args.size_mb * MB
+    client = S3Connection(args.endpoint, args.access_key, args.secret_key, args.region).client
+    try:
+        client.create_bucket(Bucket=args.bucket)
+    except (client.exceptions.BucketAlreadyOwnedByYou, client.exceptions.BucketAlreadyExists):
+        pass
+
+    local_path = make_file(size)
+    try:
+        print(f"Uploading {args.size_mb} MB to {args.endpoint}/{args.bucket}\n")
+        print(f"{'config':<18} {'seconds':>9} {'GB/s':>8}")
+        for title, threshold, part_size, concurrency in CONFIGS:
+            gbps, elapsed = run_config(args, local_path, size, threshold, part_size, concurrency)
+            print(f"{title:<18} {elapsed:>9.2f} {gbps:>8.3f}")
+    finally:
+        os.remove(local_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Background bulk offload of local files to a DFP External Storage
+
+Files are split in shards (`CRC32(name) % shards`), each one processed by its
+own background job in `long` queue, so offloading runs in parallel outside
+HTTP requests. Each shard walks its files by name in batches and checkpoints
+the last processed name after every batch, so:
+
+- progress is published through `publish_realtime` (event
+  `dfp_external_storage_bulk_offload`) to the user who started the job,
+- a cancelled or crashed job is resumed from its checkpoints with
+  `resume_bulk_offload`,
+- `cancel_bulk_offload` stops all shards after their current batch.
+
+Job state is kept in a Redis hash per job: a "meta" field plus one field per
+shard, each written only by its own shard job. It expires `STATE_TTL` after
+the last write, so finished or abandoned jobs do not stay in Redis forever.
+
+Site config (`site_config.json`):
+    dfp_external_storage_bulk_offload_workers: parallel shards (default 4)
+"""
+
+import frappe
+from frappe import _
+from frappe.utils import cint, now_datetime
+from pypika import CustomFunction
+
+DFP_BULK_OFFLOAD_CACHE_PREFIX = "dfp_external_storage_bulk_offload:"
+DFP_BULK_OFFLOAD_EVENT = "dfp_external_storage_bulk_offload"
+DEFAULT_WORKERS = 4
+MAX_WORKERS = 32
+BATCH_SIZE = 50
+# Long enough for a full shard of a big site, resume covers anything longer
+SHARD_JOB_TIMEOUT = 24 * 60 * 60
+# Job state is kept this long (seconds) after its last update
+STATE_TTL = 3 * 24 * 60 * 60
+
+Crc32 = CustomFunction("CRC32", ["value"])
+
+
+def _cache_name(job_id):
+    return f"{DFP_BULK_OFFLOAD_CACHE_PREFIX}{job_id}"
+
+
+def _get_state(job_id):
+    "(meta, {shard index: shard state})"
+    state = {
+        frappe.safe_decode(field): value
+        for field, value in (frappe.cache().hgetall(_cache_name(job_id)) or {}).items()
+    }
+    meta = state.pop("meta", None)
+    if not meta:
+        frappe.throw(_("Bulk offload job {0} not found").format(job_id))
+    shards = {int(field.split(":", 1)[1]): value for field, value in state.items()}
+    return meta, shards
+
+
+def _set_field(job_id, field, value):
+    cache = frappe.cache()
+    cache.hset(_cache_name(job_id), field, value)
+    cache.expire(cache.make_key(_cache_name(job_id)), STATE_TTL)
+
+
+def _set_meta(job_id, meta):
+    _set_field(job_id, "meta", meta)
+
+
+def _set_shard(job_id, shard, shard_state):
+    _set_field(job_id, f"shard:{shard}", shard_state)
+
+
+def _shard_files(meta, shard, last_name, limit):
+    "Next batch of file names of a shard, after last processed name"
+    File = frappe.qb.DocType("File")
+    conditions = (File.is_folder == 0) & (
+        File.dfp_external_storage.isnull() | (File.dfp_external_storage == "")
+    )
+    if meta.get("folder"):
+        conditions &= File.folder == meta["folder"]
+    if meta["shards"] > 1:
+        conditions &= Crc32(File.name) % meta["shards"] == shard
+    if last_name:
+        conditions &= File.name > last_name
+    return (
+        frappe.qb.from_(File)
+        .select(File.name)
+        .where(conditions)
+        .orderby(File.name)
+        .limit(limit)
+        .run(pluck=True)
+    )
+
+
+def get_summary(job_id):
+    "Aggregated job progress"
+    meta, shards = _get_state(job_id)
+    summary = {
+        "job_id": job_id,
+        "storage": meta["storage"],
+        "folder": meta.get("folder"),
+        "status": meta["status"],
+        "total": meta["total"],
+        "shards": meta["shards"],
+        "shards_done": sum(1 for s in shards.values() if s["done"]),
+        "processed": sum(s["processed"] for s in shards.values()),
+        "failed": sum(s["failed"] for s in shards.values()),
+        "started": meta["started"],
+    }
+    if meta["status"] == "Running" and summary["shards_done"] == meta["shards"]:
+        summary["status"] = "Completed"
+    return summary
+
+
+def _publish(job_id, meta):
+    frappe.publish_realtime(DFP_BULK_OFFLOAD_EVENT, get_summary(job_id), user=meta["user"])
+
+
+def _enqueue_shards(job_id, shards):
+    for shard in shards:
+        frappe.enqueue(
+            "dfp_external_storage.bulk_offload.run_shard",
+            queue="long",
+            timeout=SHARD_JOB_TIMEOUT,
+            job_id=f"{DFP_BULK_OFFLOAD_EVENT}:{job_id}:{shard}",
+            deduplicate=True,
+            bulk_offload_job=job_id,
+            shard=shard,
+        )
+
+
+def start_bulk_offload(storage, folder=None, workers=None, limit=None):
+    """
+    Start offloading local files to a storage in background
+
+    Args:
+        storage (str): DFP External Storage name
+        folder (str): Only files within this folder
+        workers (int): Parallel shards (default from site config)
+        limit (int): Max files to offload (default all)
+
+    Returns:
+        str: Job id
+    """
+    if not frappe.db.exists("DFP External Storage", {"name": storage, "enabled": 1}):
+        frappe.throw(_("Storage {0} not found or disabled").format(storage))
+
+    workers = cint(workers) or cint(
+        frappe.conf.get("dfp_external_storage_bulk_offload_workers", DEFAULT_WORKERS)
+    )
+    workers = max(1, min(workers, MAX_WORKERS))
+
+    filters = {"is_folder": 0, "dfp_external_storage": ("is", "not set")}
+    if folder:
+        filters["folder"] = folder
+    total = frappe.db.count("File", filters)
+    limit = cint(limit)
+    if limit:
+        total = min(total, limit)
+
+    job_id = frappe.generate_hash(length=10)
+    meta = {
+        "storage": storage,
+        "folder": folder,
+        "shards": workers,
+        # Per shard cap, so shards do not need to coordinate
+        "shard_limit": -(-limit // workers) if limit else 0,
+        "total": total,
+        "status": "Running",
+        "user": frappe.session.user,
+        "started": str(now_datetime()),
+    }
+    _set_meta(job_id, meta)
+    for shard in range(workers):
+        _set_shard(
+            job_id, shard, {"last_name": None, "processed": 0, "failed": 0, "done": False}
+        )
+    _enqueue_shards(job_id, range(workers))
+    return job_id
+
+
+def resume_bulk_offload(job_id):
+    "Re-enqueue unfinished shards of a cancelled or interrupted job"
+    meta, shards = _get_state(job_id)
+    meta["status"] = "Running"
+    _set_meta(job_id, meta)
+    pending = [shard for shard, state in shards.items() if not state["done"]]
+    _enqueue_shards(job_id, pending)
+    return get_summary(job_id)
+
+
+def cancel_bulk_offload(job_id):
+    "Shards stop after their current batch"
+    meta, _shards = _get_state(job_id)
+    meta["status"] = "Cancelled"
+    _set_meta(job_id, meta)
+    _publish(job_id, meta)
+    return get_summary(job_id)
+
+
+def run_shard(bulk_offload_job, shard):
+    "Background job: offload files of one shard, checkpointing every batch"
+    job_id = bulk_offload_job
+    meta, shards = _get_state(job_id)
+    state = shards[shard]
+
+    while not state["done"]:
+        # Cancellation is checked between batches
+        meta, _shards = _get_state(job_id)
+        if meta["status"] != "Running":
+            return
+
+        batch_size = BATCH_SIZE
+        if meta["shard_limit"]:
+            batch_size = min(batch_size, meta["shard_limit"] - state["processed"] - state["failed"])
+        names = _shard_files(meta, shard, state["last_name"], batch_size) if batch_size > 0 else []
+        if not names:
+            state["done"] = True
+            _set_shard(job_id, shard, state)
+            break
+
+        for name in names:
+            try:
+                file_doc = frappe.get_doc("File", name)
+                file_doc.dfp_external_storage = meta["storage"]
+                file_doc.save()
+                frappe.db.commit()
+                state["processed"] += 1
+            except Exception as e:
+                frappe.db.rollback()
+                frappe.log_error(f"Bulk offload failed for file {name}: {str(e)}")
+                state["failed"] += 1
+            state["last_name"] = name
+
+        _set_shard(job_id, shard, state)
+        _publish(job_id, meta)
+
+    _publish(job_id, meta)
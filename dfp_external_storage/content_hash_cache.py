@@ -0,0 +1,104 @@
+"""
+Content hash cache for DFP External Storage
+
+Same content uploads (same file hash) reuse the existent remote key. This
+module keeps a `content_hash -> key` map per "DFP External Storage" in Redis so
+that check is a cache lookup instead of a "File" query on every upload. The
+database is still the source of truth: a cache miss falls back to it.
+
+Changes made while saving a "File" only reach Redis once the transaction
+commits, so a rolled back save never leaves an entry pointing to a key that
+was not recorded.
+"""
+
+import frappe
+
+# Redis hash name prefix, one hash per storage: {content_hash: remote key}
+DFP_CONTENT_HASH_CACHE_PREFIX = "dfp_external_storage_content_hash:"
+
+
+def _cache_name(storage):
+    return f"{DFP_CONTENT_HASH_CACHE_PREFIX}{storage}"
+
+
+def get_existing_key(content_hash, storage):
+    """
+    Get remote key already holding given content within a storage
+
+    Args:
+        content_hash (str): File content hash
+        storage (str): DFP External Storage name
+
+    Returns:
+        str: Remote key or None if content is not in that storage yet
+    """
+    if not content_hash or not storage:
+        return None
+
+    key = frappe.cache().hget(_cache_name(storage), content_hash)
+    if key:
+        return key
+
+    files = frappe.get_all(
+        "File",
+        fields=["dfp_external_storage_s3_key"],
+        filters={
+            "content_hash": content_hash,
+            "dfp_external_storage": storage,
+            "dfp_external_storage_s3_key": ["!=", ""],
+        },
+        limit=1,
+    )
+    if not files:
+        return None
+
+    key = files[0].dfp_external_storage_s3_key
+    frappe.cache().hset(_cache_name(storage), content_hash, key)
+    return key
+
+
+def set_existing_key(content_hash, storage, key):
+    if content_hash and storage and key:
+        frappe.cache().hset(_cache_name(storage), content_hash, key)
+
+
+def forget_key(content_hash, storage, key):
+    "Remove cached entry if it points to given key. Next lookup reloads it from DB"
+    if not content_hash or not storage:
+        return
+    if frappe.cache().hget(_cache_name(storage), content_hash) == key:
+        frappe.cache().hdel(_cache_name(storage), content_hash)
+
+
+def after_commit(function, *args):
+    "Run a cache update once the current transaction commits (dropped on rollback)"
+    frappe.db.after_commit.add(lambda: function(*args))
+
+
+def hook_file_before_save(doc, method=None):
+    "Remember remote key of uploaded content and forget the one left behind"
+    previous = doc.get_doc_before_save()
+    if previous and previous.dfp_external_storage_s3_key and (
+        previous.dfp_external_storage != doc.dfp_external_storage
+        or previous.dfp_external_storage_s3_key != doc.dfp_external_storage_s3_key
+    ):
+        after_commit(
+            forget_key,
+            previous.content_hash,
+            previous.dfp_external_storage,
+            previous.dfp_external_storage_s3_key,
+        )
+
+    if not doc.is_folder:
+        after_commit(
+            set_existing_key,
+            doc.content_hash,
+            doc.dfp_external_storage,
+            doc.dfp_external_storage_s3_key,
+        )
+
+
+def hook_file_after_delete(doc, method=None):
+    after_commit(
+        forget_key, doc.content_hash, doc.dfp_external_storage, doc.dfp_external_storage_s3_key
+    )
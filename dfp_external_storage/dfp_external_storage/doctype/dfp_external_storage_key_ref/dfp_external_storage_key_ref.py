@@ -0,0 +1,97 @@
+# Copyright (c) 2026, DFP and contributors
+# For license information, please see license.txt
+
+"""
+Reference counting for remote keys shared by several "File"s.
+
+Same content uploads (same hash) reuse the existent remote key, so before
+deleting a remote object we need to know if other "File"s still use it. This
+table keeps one row per (storage, key) with the number of "File"s pointing to
+it, so the check is a primary key lookup instead of a scan over `tabFile`.
+"""
+
+import hashlib
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import now
+
+DOCTYPE = "DFP External Storage Key Ref"
+
+
+class DFPExternalStorageKeyRef(Document):
+    pass
+
+
+def ref_name(storage, key):
+    """Primary key for a (storage, key) pair. Must match backfill patch SQL."""
+    return hashlib.sha1(f"{storage}\n{key}".encode("utf-8")).hexdigest()
+
+
+def _file_ref(file_doc):
+    "Returns (storage, key) used by a File doc or None"
+    if not file_doc or file_doc.get("is_folder"):
+        return None
+    storage = file_doc.get("dfp_external_storage")
+    key = file_doc.get("dfp_external_storage_s3_key")
+    if not storage or not key:
+        return None
+    return storage, key
+
+
+def increment(storage, key):
+    timestamp = now()
+    frappe.db.sql(
+        f"""
+        INSERT INTO `tab{DOCTYPE}`
+            (name, storage, s3_key, ref_count, creation, modified, owner, modified_by, docstatus, idx)
+        VALUES (%(name)s, %(storage)s, %(key)s, 1, %(now)s, %(now)s, %(user)s, %(user)s, 0, 0)
+        ON DUPLICATE KEY UPDATE ref_count = ref_count + 1, modified = %(now)s
+        """,
+        {
+            "name": ref_name(storage, key),
+            "storage": storage,
+            "key": key,
+            "now": timestamp,
+            "user": frappe.session.user,
+        },
+    )
+
+
+def decrement(storage, key):
+    name = ref_name(storage, key)
+    frappe.db.sql(
+        f"UPDATE `tab{DOCTYPE}` SET ref_count = ref_count - 1, modified = %s WHERE name = %s AND ref_count > 0",
+        (now(), name),
+    )
+    frappe.db.sql(f"DELETE FROM `tab{DOCTYPE}` WHERE name = %s AND ref_count <= 0", name)
+
+
+def get_ref_count(storage, key):
+    "Number of File docs using the given remote key"
+    if not storage or not key:
+        return 0
+    return frappe.db.get_value(DOCTYPE, ref_name(storage, key), "ref_count") or 0
+
+
+def is_key_shared(storage, key):
+    "True if more than one File doc uses the given remote key"
+    return get_ref_count(storage, key) > 1
+
+
+def hook_file_before_save(doc, method=None):
+    "Keep reference counts in sync when a File gets, changes or loses its remote key"
+    previous_ref = _file_ref(doc.get_doc_before_save())
+    current_ref = _file_ref(doc)
+    if previous_ref == current_ref:
+        return
+    if previous_ref:
+        decrement(*previous_ref)
+    if current_ref:
+        increment(*current_ref)
+
+
+def hook_file_after_delete(doc, method=None):
+    file_ref = _file_ref(doc)
+    if file_ref:
+        decrement(*file_ref)
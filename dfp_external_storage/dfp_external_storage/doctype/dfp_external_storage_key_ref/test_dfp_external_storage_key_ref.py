@@ -0,0 +1,56 @@
+# Copyright (c) 2026, DFP and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from dfp_external_storage.dfp_external_storage.doctype.dfp_external_storage_key_ref.dfp_external_storage_key_ref import (
+    DOCTYPE,
+    decrement,
+    get_ref_count,
+    increment,
+    is_key_shared,
+    ref_name,
+)
+
+STORAGE = "_Test Key Ref Storage"
+KEY = "site/test-file/test.txt"
+
+
+class TestDFPExternalStorageKeyRef(FrappeTestCase):
+    def tearDown(self):
+        frappe.db.delete(DOCTYPE, {"storage": STORAGE})
+
+    def test_increment_and_decrement(self):
+        increment(STORAGE, KEY)
+        self.assertEqual(get_ref_count(STORAGE, KEY), 1)
+        self.assertFalse(is_key_shared(STORAGE, KEY))
+
+        increment(STORAGE, KEY)
+        self.assertEqual(get_ref_count(STORAGE, KEY), 2)
+        self.assertTrue(is_key_shared(STORAGE, KEY))
+
+        decrement(STORAGE, KEY)
+        self.assertEqual(get_ref_count(STORAGE, KEY), 1)
+
+    def test_last_decrement_removes_row(self):
+        increment(STORAGE, KEY)
+        decrement(STORAGE, KEY)
+        self.assertEqual(get_ref_count(STORAGE, KEY), 0)
+        self.assertFalse(frappe.db.exists(DOCTYPE, ref_name(STORAGE, KEY)))
+
+    def test_decrement_unknown_key(self):
+        decrement(STORAGE, KEY)
+        self.assertEqual(get_ref_count(STORAGE, KEY), 0)
+        self.assertFalse(frappe.db.exists(DOCTYPE, ref_name(STORAGE, KEY)))
+
+    def test_keys_are_counted_per_storage(self):
+        increment(STORAGE, KEY)
+        increment(STORAGE, f"{KEY}.other")
+        self.assertEqual(get_ref_count(STORAGE, KEY), 1)
+        self.assertEqual(get_ref_count(f"{STORAGE} 2", KEY), 0)
+        self.assertNotEqual(ref_name(STORAGE, KEY), ref_name(f"{STORAGE} 2", KEY))
+
+    def test_missing_storage_or_key(self):
+        self.assertEqual(get_ref_count(None, KEY), 0)
+        self.assertEqual(get_ref_count(STORAGE, ""), 0)
@@ -0,0 +1,162 @@
+# Copyright (c) 2026, DFP and contributors
+# For license information, please see license.txt
+
+"""
+Local index of objects existing in remote storages.
+
+Bucket browsing, orphan checks and reconnect verification used to walk the
+provider every time. A background job (`sync_storage`, daily for every
+enabled storage) walks it once, page by page, and upserts one row per object
+here, so those features become indexed queries.
+
+Each sync run stamps the rows it sees with its id; rows of a storage with an
+older stamp after a complete run are objects deleted remotely and are removed.
+Listing errors (missing folder, provider failures) raise, so an interrupted
+walk never gets there and keeps the index as it was.
+"""
+
+import hashlib
+import mimetypes
+import os
+from datetime import datetime, timezone
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import convert_utc_to_system_timezone, now
+
+from dfp_external_storage.storage_backends import default_list_prefixes, list_objects_page
+
+DOCTYPE = "DFP Remote Object"
+SYNC_PAGE_SIZE = 1000
+SYNC_JOB_TIMEOUT = 6 * 60 * 60
+
+# (index name, columns): filters and sorts used by the bucket list page
+INDEXES = (
+    ("storage_last_modified_index", ["storage", "last_modified"]),
+    ("storage_size_index", ["storage", "size"]),
+    ("storage_file_name_index", ["storage", "file_name"]),
+    ("storage_mime_index", ["storage", "mime"]),
+    ("storage_sync_id_index", ["storage", "sync_id"]),
+    # Key prefix filters (`LIKE 'prefix%'`), prefix indexed within key size limits
+    ("storage_object_key_index", ["storage", "object_key(255)"]),
+)
+
+
+class DFPRemoteObject(Document):
+    pass
+
+
+def on_doctype_update():
+    for index_name, columns in INDEXES:
+        frappe.db.add_index(DOCTYPE, columns, index_name)
+
+
+def object_name(storage, key):
+    """Primary key for a (storage, key) pair"""
+    return hashlib.sha1(f"{storage}\n{key}".encode("utf-8")).hexdigest()
+
+
+def _to_system_datetime(value):
+    "Provider timestamp (aware / naive UTC datetime or ISO string) in system timezone"
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return convert_utc_to_system_timezone(value).replace(tzinfo=None)
+
+
+def _upsert(storage, items, sync_id):
+    if not items:
+        return
+    timestamp = now()
+    user = frappe.session.user
+    rows = []
+    for item in items:
+        file_name = os.path.basename((item["object_name"] or "").rstrip("/"))
+        mime = item["metadata"].get("mime_type") or mimetypes.guess_type(file_name)[0]
+        rows.append(
+            (
+                object_name(storage, item["key"]),
+                storage,
+                item["key"],
+                file_name[:255],
+                item["size"] or 0,
+                (item["etag"] or "")[:140],
+                _to_system_datetime(item["last_modified"]),
+                mime,
+                sync_id,
+                timestamp,
+                timestamp,
+                user,
+                user,
+            )
+        )
+    placeholders = ", ".join(
+        ["(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 0, 0)"] * len(rows)
+    )
+    frappe.db.sql(
+        f"""
+        INSERT INTO `tab{DOCTYPE}`
+            (name, storage, object_key, file_name, size, etag, last_modified, mime, sync_id,
+            creation, modified, owner, modified_by, docstatus, idx)
+        VALUES {placeholders}
+        ON DUPLICATE KEY UPDATE
+            size = VALUES(size), etag = VALUES(etag), last_modified = VALUES(last_modified),
+            mime = VALUES(mime), sync_id = VALUES(sync_id), modified = VALUES(modified)
+        """,
+        [value for row in rows for value in row],
+    )
+
+
+def sync_storage(storage):
+    """
+    Walk remote objects of a storage and refresh its index rows
+
+    Returns:
+        int: Objects seen
+    """
+    sync_id = frappe.generate_hash(length=10)
+    seen = 0
+    for prefix in default_list_prefixes(storage):
+        cursor = None
+        while True:
+            items, cursor = list_objects_page(storage, prefix, cursor, SYNC_PAGE_SIZE)
+            items = [i for i in items if not i["is_dir"] and i.get("key")]
+            _upsert(storage, items, sync_id)
+            frappe.db.commit()
+            seen += len(items)
+            if not cursor:
+                break
+
+    # Only reached when the walk finished (listing errors raise): objects not
+    # seen are gone remotely
+    frappe.db.sql(
+        f"DELETE FROM `tab{DOCTYPE}` WHERE storage = %s AND sync_id != %s", (storage, sync_id)
+    )
+    frappe.db.commit()
+    return seen
+
+
+def enqueue_sync(storage):
+    frappe.enqueue(
+        "dfp_external_storage.dfp_external_storage.doctype.dfp_remote_object.dfp_remote_object.sync_storage",
+        queue="long",
+        timeout=SYNC_JOB_TIMEOUT,
+        job_id=f"dfp_remote_object_sync:{storage}",
+        deduplicate=True,
+        storage=storage,
+    )
+
+
+def sync_all_storages():
+    "Scheduler: refresh index of every enabled storage"
+    for storage in frappe.get_all("DFP External Storage", filters={"enabled": 1}, pluck="name"):
+        enqueue_sync(storage)
+
+
+@frappe.whitelist()
+def sync_now(storage):
+    frappe.only_for("System Manager")
+    enqueue_sync(storage)
@@ -29,6 +29,19 @@ class DFPS3BucketList {
     );
 
     this.make_filters();
+    // Pages are appended while scrolling (provider cursor pagination)
+    this.files = [];
+    this.next_cursor = null;
+    this.loading = false;
+    $(window).on("scroll", () => {
+      if (
+        frappe.get_route()[0] === "dfp-s3-bucket-list" &&
+        $(window).scrollTop() + $(window).height() >=
+          $(document).height() - 300
+      ) {
+        this.load_more();
+      }
+    });
     this.refresh_files = frappe.utils.throttle(
       this.refresh_files.bind(this),
       1000
@@ -122,14 +135,64 @@ class DFPS3BucketList {
       fieldtype: "Select",
       options: [
         { label: "All files", value: "all" },
-        // TODO: set file filters!
-        // { label: 'Images', value: 'image' },
-        // { label: 'Videos', value: 'video' },
-        // { label: 'PDFs', value: 'pdf' },
+        { label: "Images", value: "image" },
+        { label: "Videos", value: "video" },
+        { label: "PDFs", value: "pdf" },
       ],
       default: "all",
       change: () => this.refresh_files(),
     });
+    this.prefix = this.page.add_field({
+      label: __("Prefix / Subfolder"),
+      fieldname: "prefix",
+      fieldtype: "Data",
+      change: () => this.refresh_files(),
+    });
+    this.name_filter = this.page.add_field({
+      label: __("Name contains"),
+      fieldname: "name_filter",
+      fieldtype: "Data",
+      change: () => this.refresh_files(),
+    });
+    this.sort = this.page.add_field({
+      label: __("Sort"),
+      fieldname: "sort",
+      fieldtype: "Select",
+      options: [
+        { label: __("Default"), value: "" },
+        { label: __("Name"), value: "name asc" },
+        { label: __("Size"), value: "size desc" },
+        { label: __("Modified"), value: "last_modified desc" },
+      ],
+      default: "",
+      change: () => this.refresh_files(),
+    });
+    // Index: "DFP Remote Object" table (fast, sorted across the storage)
+    // Live: provider listing (sorting applies within each page)
+    this.source = this.page.add_field({
+      label: __("Source"),
+      fieldname: "source",
+      fieldtype: "Select",
+      options: [
+        { label: __("Index"), value: "index" },
+        { label: __("Live"), value: "live" },
+      ],
+      default: "index",
+      change: () => this.refresh_files(),
+    });
+    this.page.add_inner_button(__("Sync Index"), () => {
+      frappe.call({
+        method:
+          "dfp_external_storage.dfp_external_storage.doctype.dfp_remote_object.dfp_remote_object.sync_now",
+        args: { storage: this.storage.get_value() },
+        callback: () => {
+          frappe.show_alert({
+            message: __("Index sync queued"),
+            indicator: "green",
+          });
+        },
+      });
+    });
     this.auto_refresh = this.page.add_field({
       label: __("Auto Refresh"),
       fieldname: "auto_refresh",
@@ -212,32 +275,66 @@ class DFPS3BucketList {
       file_type,
     });
 
-    // Prepare args object
-    // let file_type = this.file_type.get_value()
-    // let test = this.page.get_form_values()
-    let args = { storage, template, file_type };
+    let [sort_by, sort_order] = (this.sort.get_value() || "").split(" ");
+    this.args = {
+      storage,
+      template,
+      file_type,
+      prefix: this.prefix.get_value() || null,
+      name: this.name_filter.get_value() || null,
+      sort_by: sort_by || null,
+      sort_order: sort_order || null,
+    };
+    this.files = [];
+    this.next_cursor = null;
+    this.fetch_page(null, true);
+  }
+
+  load_more() {
+    if (!this.loading && this.next_cursor) {
+      this.fetch_page(this.next_cursor, false);
+    }
+  }
+
+  fetch_page(cursor, first_page) {
+    let template = this.args.template;
 
     // Show loading message
+    this.loading = true;
     this.page.add_inner_message(__("Refreshing..."));
 
+    let method =
+      this.source.get_value() === "live" ? "get_info" : "get_indexed_info";
+
     frappe.call({
-      method:
-        "dfp_external_storage.dfp_external_storage.page.dfp_s3_bucket_list.dfp_s3_bucket_list.get_info",
-      args,
+      method: `dfp_external_storage.dfp_external_storage.page.dfp_s3_bucket_list.dfp_s3_bucket_list.${method}`,
+      args: Object.assign({ cursor }, this.args),
       callback: (res) => {
+        this.loading = false;
         this.page.add_inner_message("");
 
         // Check if response is valid
-        if (!res || !Array.isArray(res.message)) {
+        if (!res || !res.message || !Array.isArray(res.message.files)) {
           frappe.throw(__("Invalid response from server"));
           return;
         }
+        this.files = this.files.concat(res.message.files);
+        this.next_cursor = res.message.next_cursor;
+        if (first_page && res.message.indexed != null) {
+          this.page.set_indicator(
+            __("{0} objects indexed", [res.message.indexed]),
+            "blue"
+          );
+        } else if (first_page) {
+          this.page.clear_indicator();
+        }
 
         try {
           // Render template
           this.$content.html(
             frappe.render_template(template, {
-              files: res.message || [],
+              files: this.files,
+              has_more: !!this.next_cursor,
               toTitle: (str) =>
                 str ? str.charAt(0).toUpperCase() + str.slice(1) : "",
               fileSizeToHumansMode: this.fileSizeToHumansMode,
@@ -247,13 +344,8 @@ class DFPS3BucketList {
           frappe.throw(__("Error rendering template: ") + e.message);
           return;
         }
-        // this.$content.html(
-        // 	frappe.render_template(template, {
-        // 		files: res.message || [],
-        // 	})
-        // )
 
-        // Handle auto refresh
+        // Handle auto refresh (first page only)
         let auto_refresh;
         try {
           auto_refresh = this.auto_refresh.get_value();
@@ -261,14 +353,17 @@ class DFPS3BucketList {
           console.error("Error getting auto_refresh value:", e);
           auto_refresh = false;
         }
-        // let auto_refresh = this.auto_refresh.get_value()
 
-        // if (frappe.get_route()[0] === 'dfp-s3-bucket-list' && auto_refresh) {
-        if (frappe.get_route()[0] === "dfp-s3-bucket-list" && auto_refresh) {
+        if (
+          first_page &&
+          frappe.get_route()[0] === "dfp-s3-bucket-list" &&
+          auto_refresh
+        ) {
           setTimeout(() => this.refresh_files(), 2000);
         }
       },
       error: (err) => {
+        this.loading = false;
         this.page.add_inner_message("");
         frappe.msgprint({
 			title: __('Error'),
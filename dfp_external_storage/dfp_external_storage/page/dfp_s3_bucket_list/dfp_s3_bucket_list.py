@@ -1,8 +1,21 @@
 # Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
 # License: MIT. See LICENSE
 
+import json
+import mimetypes
+
 import frappe
 from frappe import _
+from frappe.query_builder import Order
+from frappe.utils import cint, get_datetime
+
+from dfp_external_storage.api import escape_like
+from dfp_external_storage.storage_backends import default_list_prefixes, list_objects_page
+
+PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+# Provider calls per request while filling a filtered page
+MAX_REMOTE_PAGES_PER_CALL = 5
 
 
 @frappe.whitelist()
@@ -39,83 +52,232 @@ def diagnose_storage_connection(storage_name=None):
         frappe.throw(_("Failed to diagnose storage connection: {}").format(str(e)))
 
 
+def _matches(item, name, file_type):
+    if item["is_dir"]:
+        return False
+    if name and name.lower() not in (item["object_name"] or "").lower():
+        return False
+    if file_type and file_type != "all":
+        mimetype = mimetypes.guess_type(item["object_name"] or "")[0] or ""
+        if file_type == "pdf":
+            return mimetype == "application/pdf"
+        return mimetype.startswith(f"{file_type}/")
+    return True
+
+
+def _check_prefix(storage, prefix):
+    "Listing stays within this site prefixes (buckets may be shared by sites)"
+    allowed = default_list_prefixes(storage)
+    if not prefix.startswith(tuple(allowed)) or ".." in prefix.split("/"):
+        frappe.throw(
+            _("Prefix must start with one of: {0}").format(", ".join(p or "/" for p in allowed)),
+            frappe.PermissionError,
+        )
+
+
+def _serialize(item):
+    return {
+        "etag": item["etag"],
+        "is_dir": item["is_dir"],
+        "last_modified": str(item["last_modified"] or ""),
+        "metadata": item["metadata"],
+        "name": item["object_name"],
+        "size": item["size"] or 0,
+        "storage_class": item["storage_class"],
+    }
+
+
 @frappe.whitelist()
-def get_info(storage=None, template=None, file_type=None) -> list[dict]:
-    files = []
+def get_info(
+    storage=None,
+    template=None,
+    file_type=None,
+    prefix=None,
+    name=None,
+    sort_by=None,
+    sort_order=None,
+    cursor=None,
+    page_size=None,
+) -> dict:
+    """
+    One page of remote files of a storage
 
-    frappe.logger().info(
-        f"S3 bucket list - get_info called with storage={storage}, template={template}, file_type={file_type}"
-    )
+    Listing is scoped by prefix at the provider (this site prefixes by
+    default, other prefixes must be within them) and paginated with provider cursors, so pages cost the same
+    whatever the bucket size. Name / file type filters are applied server side
+    while filling the page; sorting applies within the page, remote listings
+    come in key order.
 
-    # Get current site name for filtering
-    current_site = frappe.local.site
-    frappe.logger().info(f"Current site: {current_site}")
+    Returns:
+        dict: {"files": [...], "next_cursor": str or None}
+    """
+    frappe.only_for("System Manager")
+    page_size = min(cint(page_size) or PAGE_SIZE, MAX_PAGE_SIZE)
 
     document = "DFP External Storage"
-
-    dfp_external_storage_doc = None
-    if storage:
-        dfp_external_storage_doc = frappe.get_doc(document, storage)
-    else:
+    if not storage:
         last_id = frappe.get_all(
             document, filters={"enabled": 1}, order_by="modified desc", limit=1
         )
-        if last_id:
-            dfp_external_storage_doc = frappe.get_doc(
-                document, last_id[0].name if last_id else None
+        storage = last_id[0].name if last_id else None
+    if not storage:
+        return {"files": [], "next_cursor": None}
+
+    if prefix is not None:
+        _check_prefix(storage, prefix)
+    prefixes = [prefix] if prefix is not None else default_list_prefixes(storage)
+    # Cursor: position within prefixes and provider cursor within that prefix
+    state = json.loads(cursor) if cursor else {"prefix": 0, "token": None}
+
+    files = []
+    remote_pages = 0
+    try:
+        while (
+            len(files) < page_size
+            and state["prefix"] < len(prefixes)
+            and remote_pages < MAX_REMOTE_PAGES_PER_CALL
+        ):
+            items, token = list_objects_page(
+                storage, prefixes[state["prefix"]], state["token"], page_size
             )
+            remote_pages += 1
+            files.extend(_serialize(i) for i in items if _matches(i, name, file_type))
+            state = {"prefix": state["prefix"] + (0 if token else 1), "token": token}
+    except Exception as e:
+        frappe.log_error(f"Error listing remote storage contents: {str(e)}")
+        frappe.throw(_("Error listing remote storage contents: {0}").format(str(e)))
+
+    if sort_by in ("name", "size", "last_modified"):
+        files.sort(key=lambda f: f[sort_by], reverse=sort_order == "desc")
+
+    return {
+        "files": files,
+        "next_cursor": json.dumps(state) if state["prefix"] < len(prefixes) else None,
+    }
+
+
+INDEX_SORT_FIELDS = ("last_modified", "size", "file_name")
+
+
+def _load_index_cursor(cursor, sort_by):
+    "(sort value, name) of a `get_indexed_info` cursor, sort value typed back"
+    try:
+        value, name = json.loads(cursor)
+        if value is not None:
+            if sort_by == "last_modified":
+                value = get_datetime(value)
+            elif sort_by == "size":
+                value = int(value)
+    except (TypeError, ValueError):
+        frappe.throw(_("Invalid cursor"))
+    return value, name
+
+
+def _index_cursor_condition(sort_field, name_field, cursor, descending):
+    """
+    Rows after a (sort value, name) keyset cursor. NULL sort values come
+    first in ascending order and last in descending order (MariaDB order),
+    so they are handled explicitly instead of compared.
+    """
+    value, name = cursor
+    if value is None:
+        after_name = name_field < name if descending else name_field > name
+        same = sort_field.isnull() & after_name
+        return same if descending else same | sort_field.notnull()
+
+    if descending:
+        after = (sort_field < value) | ((sort_field == value) & (name_field < name))
+        return after | sort_field.isnull()
+    return (sort_field > value) | ((sort_field == value) & (name_field > name))
+
+
+@frappe.whitelist()
+def get_indexed_info(
+    storage=None,
+    file_type=None,
+    prefix=None,
+    name=None,
+    sort_by=None,
+    sort_order=None,
+    cursor=None,
+    page_size=None,
+) -> dict:
+    """
+    One page of remote files of a storage from "DFP Remote Object" index
+
+    Filters and sorting work across the whole storage, backed by
+    (storage, column) indexes, and pages are keyset paginated on
+    (sort column, name).
+
+    Returns:
+        dict: {"files": [...], "next_cursor": str or None, "indexed": int}
+    """
+    frappe.only_for("System Manager")
+    if not storage:
+        return {"files": [], "next_cursor": None, "indexed": 0}
+    page_size = min(cint(page_size) or PAGE_SIZE, MAX_PAGE_SIZE)
+    if sort_by == "name":
+        sort_by = "file_name"
+    sort_by = sort_by if sort_by in INDEX_SORT_FIELDS else "last_modified"
+    descending = sort_order != "asc"
+
+    RemoteObject = frappe.qb.DocType("DFP Remote Object")
+    conditions = RemoteObject.storage == storage
+    if prefix:
+        conditions &= RemoteObject.object_key.like(f"{escape_like(prefix)}%")
+    if name:
+        conditions &= RemoteObject.file_name.like(f"%{escape_like(name)}%")
+    if file_type and file_type != "all":
+        if file_type == "pdf":
+            conditions &= RemoteObject.mime == "application/pdf"
+        else:
+            conditions &= RemoteObject.mime.like(f"{escape_like(file_type)}/%")
+
+    sort_field = RemoteObject[sort_by]
+    if cursor:
+        conditions &= _index_cursor_condition(
+            sort_field, RemoteObject.name, _load_index_cursor(cursor, sort_by), descending
+        )
+
+    order = Order.desc if descending else Order.asc
+    rows = (
+        frappe.qb.from_(RemoteObject)
+        .select(
+            RemoteObject.name,
+            RemoteObject.object_key,
+            RemoteObject.file_name,
+            RemoteObject.size,
+            RemoteObject.etag,
+            RemoteObject.last_modified,
+            RemoteObject.mime,
+        )
+        .where(conditions)
+        .orderby(sort_field, order=order)
+        .orderby(RemoteObject.name, order=order)
+        .limit(page_size + 1)
+        .run(as_dict=True)
+    )
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = frappe.as_json([last[sort_by], last.name], indent=None)
 
-    if dfp_external_storage_doc:
-        try:
-            # dfp_external_storage_doc.remote_files_list(template, file_type)
-            objects = dfp_external_storage_doc.remote_files_list()
-            for file in objects:
-                file_data = {}
-                # Check if file is a dictionary or an object
-                if isinstance(file, dict):
-                    key = file.get("Key", "")
-
-                    # Only include files from the current site
-                    if not key.startswith(current_site + "/") and not key.startswith(
-                        "Home/"
-                    ):
-                        continue
-
-                    file_data = {
-                        "etag": file.get("ETag", ""),
-                        "is_dir": False,
-                        "last_modified": file.get("LastModified", ""),
-                        "metadata": file.get("Metadata", {}),
-                        "name": key,
-                        "size": file.get("Size", 0),
-                        "storage_class": file.get("StorageClass", ""),
-                    }
-                else:
-                    # Try to access as object attributes
-                    try:
-                        object_name = getattr(file, "object_name", "")
-                        # Only include files from the current site
-                        if not object_name.startswith(
-                            current_site + "/"
-                        ) and not object_name.startswith("Home/"):
-                            continue
-
-                        file_data = {
-                            "etag": getattr(file, "etag", ""),
-                            "is_dir": getattr(file, "is_dir", False),
-                            "last_modified": getattr(file, "last_modified", ""),
-                            "metadata": getattr(file, "metadata", {}),
-                            "name": object_name,
-                            "size": getattr(file, "size", 0),
-                            "storage_class": getattr(file, "storage_class", ""),
-                        }
-                    except Exception as e:
-                        frappe.log_error(f"Error processing S3 object: {str(e)}")
-                        continue
-
-                if file_data:
-                    files.append(file_data)
-        except Exception as e:
-            frappe.log_error(f"Error listing S3 bucket contents: {str(e)}")
-
-    return files
+    files = [
+        {
+            "etag": row.etag,
+            "is_dir": False,
+            "last_modified": str(row.last_modified or ""),
+            "metadata": {"mime_type": row.mime},
+            "name": row.object_key,
+            "size": row.size or 0,
+            "storage_class": "",
+        }
+        for row in rows
+    ]
+    return {
+        "files": files,
+        "next_cursor": next_cursor,
+        "indexed": None if cursor else frappe.db.count("DFP Remote Object", {"storage": storage}),
+    }
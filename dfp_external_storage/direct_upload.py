@@ -0,0 +1,314 @@
+"""
+Direct browser uploads to DFP External Storages
+
+A regular upload goes through a Frappe worker: the request body is written to
+local disk and then pushed to the storage on "File" save, two full copies and
+a busy worker per upload. Here the browser sends the content straight to the
+storage instead:
+
+1. `start_upload`: resolves the storage of the target folder, opens a provider
+   upload and keeps the upload session in Redis:
+   - S3: multipart upload, part urls signed by `sign_parts`, parts PUT in
+     parallel,
+   - OneDrive: upload session url (`createUploadSession`) for a name unique
+     to the session, chunks PUT in order with `Content-Range`,
+   - Dropbox: temporary upload link (`files_get_temporary_upload_link`), file
+     POSTed at once (up to 150MB).
+2. `complete_upload`: completes the provider upload if needed (S3 part
+   etags), finds the object from the session (never from ids sent by the
+   browser), checks it and creates the "File" pointing to its final key.
+
+Content is never seen by the server, so a content hash sent by the browser can
+not be trusted: Files created this way have no `content_hash` and are not
+deduplicated against same content uploads.
+
+Direct uploads are opt-in (S3 buckets need a CORS rule allowing `PUT` from the
+site origin and exposing the `ETag` header first). The browser falls back to
+the regular upload when a direct one fails.
+
+Site config (`site_config.json`):
+    dfp_external_storage_direct_upload_min_size: files of this size (bytes)
+        or bigger are uploaded directly (default 0, direct uploads disabled)
+"""
+
+import os
+from datetime import timedelta
+
+import frappe
+from frappe import _
+from frappe.utils import cint
+
+from dfp_external_storage.folder_storage_map import get_storage_for_folder
+from dfp_external_storage.s3_integration import part_size_for
+from dfp_external_storage.storage_backends import get_connection, get_folder, remote_stat
+from dfp_external_storage.storage_settings import get_storage_settings
+
+DFP_DIRECT_UPLOAD_CACHE_PREFIX = "dfp_external_storage_direct_upload:"
+# Unfinished sessions are forgotten after this long
+SESSION_TTL = 24 * 60 * 60
+PART_URL_EXPIRATION = timedelta(hours=1)
+MAX_PART_URLS_PER_CALL = 100
+# OneDrive chunks must be multiples of 320KB
+ONEDRIVE_CHUNK_SIZE = 32 * 320 * 1024
+# Dropbox temporary upload links take a single request up to this size
+DROPBOX_UPLOAD_LINK_MAX_SIZE = 150 * 1024 * 1024
+
+
+def _cache_name(upload_token):
+    return f"{DFP_DIRECT_UPLOAD_CACHE_PREFIX}{upload_token}"
+
+
+def _get_session(upload_token):
+    session = frappe.cache().get_value(_cache_name(upload_token))
+    if not session or session["user"] != frappe.session.user:
+        frappe.throw(_("Upload session not found or expired"))
+    return session
+
+
+def _forget_session(upload_token):
+    frappe.cache().delete_value(_cache_name(upload_token))
+
+
+def get_min_size():
+    "Smallest directly uploaded file (bytes), 0 when direct uploads are disabled"
+    return cint(frappe.conf.get("dfp_external_storage_direct_upload_min_size"))
+
+
+def extend_bootinfo(bootinfo):
+    "Lets the file uploader skip direct upload probes of smaller files"
+    bootinfo.dfp_external_storage_direct_upload_min_size = get_min_size()
+
+
+def _target_storage(folder, size):
+    "Storage receiving direct uploads for the folder, None for the regular upload"
+    min_size = get_min_size()
+    if not min_size or size < min_size:
+        return None
+    storage = get_storage_for_folder(folder or "Home")
+    if not storage:
+        return None
+    storage_type = get_storage_settings(storage).type
+    if storage_type not in STARTERS:
+        return None
+    if storage_type == "Dropbox" and size > DROPBOX_UPLOAD_LINK_MAX_SIZE:
+        return None
+    # Upload sessions do not take empty files
+    if storage_type == "OneDrive" and not size:
+        return None
+    return storage
+
+
+def _file_values(file_name, size, folder, is_private, attached_to):
+    return {
+        "file_name": file_name,
+        "file_size": size,
+        "folder": folder or "Home",
+        "is_private": cint(is_private),
+        "attached_to_doctype": attached_to.get("doctype"),
+        "attached_to_name": attached_to.get("docname"),
+        "attached_to_field": attached_to.get("fieldname"),
+    }
+
+
+def _create_file(file_values, storage, key, name):
+    "Insert a File for an object already in the storage"
+    from dfp_external_storage.dfp_external_storage.doctype.dfp_external_storage.dfp_external_storage import (
+        DFP_EXTERNAL_STORAGE_URL_SEGMENT_FOR_FILE_LOAD,
+    )
+
+    file_doc = frappe.new_doc("File")
+    file_doc.update(file_values)
+    # Name is known upfront, it is part of the File url
+    file_doc.name = name
+    file_doc.flags.name_set = True
+    file_doc.dfp_external_storage = storage
+    file_doc.dfp_external_storage_s3_key = key
+    file_doc.file_url = (
+        f"/{DFP_EXTERNAL_STORAGE_URL_SEGMENT_FOR_FILE_LOAD}/{file_doc.name}/{file_doc.file_name}"
+    )
+    file_doc.insert()
+    return file_doc
+
+
+def _start_s3(connection, folder, session, content_type):
+    session["key"] = f"{frappe.local.site}/{session['name']}/{session['file_values']['file_name']}"
+    session["upload_id"] = connection.create_multipart_upload(folder, session["key"], content_type)
+    part_size = part_size_for(session["size"], connection.multipart_chunksize)
+    return {
+        "method": "s3_multipart",
+        "part_size": part_size,
+        "parts": max(1, -(-session["size"] // part_size)),
+    }
+
+
+def _start_onedrive(connection, folder, session, content_type):
+    # Unique name, so the finished item is found from the session alone
+    session["remote_name"] = f"{session['name']}_{session['file_values']['file_name']}"
+    session["upload_url"] = connection.create_upload_session(folder, session["remote_name"])
+    return {
+        "method": "onedrive_session",
+        "upload_url": session["upload_url"],
+        "part_size": ONEDRIVE_CHUNK_SIZE,
+    }
+
+
+def _start_dropbox(connection, folder, session, content_type):
+    folder = folder if folder.startswith("/") else f"/{folder}"
+    session["key"] = f"{folder.rstrip('/')}/{session['name']}/{session['file_values']['file_name']}"
+    return {
+        "method": "dropbox_link",
+        "upload_url": connection.temporary_upload_link(session["key"]),
+    }
+
+
+def _finish_s3(connection, folder, session, parts):
+    parts = sorted(
+        ({"PartNumber": cint(p["part_number"]), "ETag": p["etag"]} for p in parts or ()),
+        key=lambda p: p["PartNumber"],
+    )
+    connection.complete_multipart_upload(folder, session["key"], session["upload_id"], parts)
+    return session["key"]
+
+
+def _finish_onedrive(connection, folder, session, parts):
+    "Item uploaded under the session unique name"
+    item = connection.stat_path(folder, session["remote_name"])
+    if item.get("folder") is not None:
+        frappe.throw(_("Uploaded item is not a file"))
+    return item["id"]
+
+
+def _finish_dropbox(connection, folder, session, parts):
+    return connection.stat_object(folder, session["key"]).path_display
+
+
+def _abort_s3(connection, folder, session):
+    connection.abort_multipart_upload(folder, session["key"], session["upload_id"])
+
+
+def _abort_onedrive(connection, folder, session):
+    connection.cancel_upload_session(session["upload_url"])
+
+
+def _abort_dropbox(connection, folder, session):
+    # Unused temporary upload links just expire
+    pass
+
+
+# Storage types taking direct uploads: (start, finish returning the remote
+# key, abort)
+STARTERS = {
+    "AWS S3": _start_s3,
+    "S3 Compatible": _start_s3,
+    "OneDrive": _start_onedrive,
+    "Dropbox": _start_dropbox,
+}
+FINISHERS = {
+    "AWS S3": _finish_s3,
+    "S3 Compatible": _finish_s3,
+    "OneDrive": _finish_onedrive,
+    "Dropbox": _finish_dropbox,
+}
+ABORTERS = {
+    "AWS S3": _abort_s3,
+    "S3 Compatible": _abort_s3,
+    "OneDrive": _abort_onedrive,
+    "Dropbox": _abort_dropbox,
+}
+
+
+def start_upload(file_name, size, content_type=None, folder=None, is_private=1, **attached_to):
+    """
+    Start a direct upload
+
+    Args:
+        file_name (str): File name
+        size (int): File size in bytes
+        content_type (str): Mimetype
+        folder (str): Target folder (default "Home")
+        is_private (int): Private file
+        **attached_to: doctype, docname and fieldname the File is attached to
+
+    Returns:
+        dict: {"direct": False} when the regular upload must be used, or
+            {"direct": True, "upload_token", "method", ...} with "part_size"
+            and "parts" (S3) or "upload_url" (OneDrive, Dropbox)
+    """
+    frappe.has_permission("File", "create", throw=True)
+    size = cint(size)
+    file_name = os.path.basename(file_name or "")
+    if not file_name:
+        frappe.throw(_("File name is required"))
+    storage = _target_storage(folder, size)
+    if not storage:
+        return {"direct": False}
+
+    file_values = _file_values(file_name, size, folder, is_private, attached_to)
+    storage_type = get_storage_settings(storage).type
+    session = {
+        "user": frappe.session.user,
+        "storage": storage,
+        "type": storage_type,
+        "name": frappe.generate_hash(length=10),
+        "size": size,
+        "file_values": file_values,
+    }
+    upload = STARTERS[storage_type](get_connection(storage), get_folder(storage), session, content_type)
+    upload_token = frappe.generate_hash(length=20)
+    frappe.cache().set_value(_cache_name(upload_token), session, expires_in_sec=SESSION_TTL)
+    return {"direct": True, "upload_token": upload_token, **upload}
+
+
+def sign_parts(upload_token, part_numbers):
+    """
+    Presigned part upload urls (S3)
+
+    Returns:
+        dict: {part number: url}
+    """
+    session = _get_session(upload_token)
+    if "upload_id" not in session:
+        frappe.throw(_("Upload session has no parts to sign"))
+    part_numbers = [cint(n) for n in part_numbers][:MAX_PART_URLS_PER_CALL]
+    connection = get_connection(session["storage"])
+    bucket = get_folder(session["storage"])
+    return {
+        n: connection.presigned_upload_part(
+            bucket, session["key"], session["upload_id"], n, PART_URL_EXPIRATION
+        )
+        for n in part_numbers
+    }
+
+
+def complete_upload(upload_token, parts=None):
+    """
+    Finalize a direct upload and create its File
+
+    Args:
+        parts (list): [{"part_number": int, "etag": str}] (S3)
+
+    Returns:
+        dict: Created File
+    """
+    session = _get_session(upload_token)
+    storage = session["storage"]
+    connection = get_connection(storage)
+    folder = get_folder(storage)
+    key = FINISHERS[session["type"]](connection, folder, session, parts)
+    _forget_session(upload_token)
+
+    size, _etag = remote_stat(storage, key, connection)
+    if size != session["size"]:
+        connection.remove_object(folder, key)
+        frappe.throw(_("Uploaded size does not match the file size"))
+
+    file_doc = _create_file(session["file_values"], storage, key, session["name"])
+    return file_doc.as_dict()
+
+
+def abort_upload(upload_token):
+    session = _get_session(upload_token)
+    ABORTERS[session["type"]](
+        get_connection(session["storage"]), get_folder(session["storage"]), session
+    )
+    _forget_session(upload_token)
@@ -0,0 +1,334 @@
+"""
+Local disk cache for remote file contents
+
+The per storage "cache only files smaller than" setting keeps small files in
+Redis. Bigger hot files (PDFs, images of some MB) would be fetched from the
+remote storage on every view, so this module keeps a copy of them on local
+disk, in front of every storage type.
+
+- Entries are content addressed (File content hash, or storage + key when there
+  is no hash), so same content in different "File"s or storages is cached once.
+  Content hash entries are md5 checked once downloaded: an object not matching
+  its File hash is never cached, it would be served for every File sharing it.
+- Writes are atomic: content is downloaded to a temporary file in the cache
+  folder and then renamed into place. Temporary files are named after the
+  entry, so a failed download is resumed by the next attempt (see
+  `parallel_download`), one process at a time, and leftovers not touched for
+  `STALE_TMP_AGE` are removed by eviction.
+- Total size is capped by a byte budget. Hits refresh entry mtime and, when the
+  budget is exceeded, least recently used entries are evicted first. Files
+  bigger than a fraction of the budget are not cached at all.
+- Hit / miss counters are kept per site in Redis.
+
+Reads of any storage type go through it with `storage_backends.open_file`
+(full content), `storage_backends.get_file_proxy` (random access) and the
+`file_renderer` range responses.
+
+Site config (`site_config.json`):
+    dfp_external_storage_disk_cache_size: byte budget (default 1 GB, 0 disables)
+    dfp_external_storage_disk_cache_max_file_size: biggest cached file
+        (default budget / 4)
+"""
+
+import fcntl
+import hashlib
+import os
+import time
+
+import frappe
+
+DFP_DISK_CACHE_FOLDER = "dfp_external_storage_cache"
+DFP_DISK_CACHE_STATS_PREFIX = "dfp_external_storage_disk_cache:"
+DEFAULT_DISK_CACHE_SIZE = 1024 * 1024 * 1024
+
+# Evict down to this fraction of the budget so we do not evict on every write
+EVICT_TO_RATIO = 0.9
+# Seconds between full folder scans to enforce the budget
+EVICT_CHECK_INTERVAL = 60
+# Temporary files not modified for this long (seconds) are abandoned fills
+STALE_TMP_AGE = 24 * 60 * 60
+TMP_PREFIX = ".tmp-"
+
+# {site: (last scan timestamp, bytes written since then)}
+_writes_since_scan = {}
+
+
+class ContentMismatchError(Exception):
+    "Downloaded content does not match the File content hash"
+
+
+class FillInProgressError(Exception):
+    "Another process is downloading the same entry"
+
+
+def get_cache_size():
+    return int(frappe.conf.get("dfp_external_storage_disk_cache_size", DEFAULT_DISK_CACHE_SIZE))
+
+
+def get_max_file_size():
+    return int(
+        frappe.conf.get("dfp_external_storage_disk_cache_max_file_size") or get_cache_size() // 4
+    )
+
+
+def get_cache_folder():
+    return frappe.get_site_path("private", DFP_DISK_CACHE_FOLDER)
+
+
+def cache_id_for(file_doc):
+    "Content address for a remote File"
+    if file_doc.content_hash:
+        return file_doc.content_hash
+    return hashlib.sha1(
+        f"{file_doc.dfp_external_storage}\n{file_doc.dfp_external_storage_s3_key}".encode("utf-8")
+    ).hexdigest()
+
+
+def _md5(path):
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def _entry_path(cache_id):
+    return os.path.join(get_cache_folder(), cache_id[:2], cache_id)
+
+
+def _count(counter, amount=1):
+    cache = frappe.cache()
+    cache.incrby(cache.make_key(f"{DFP_DISK_CACHE_STATS_PREFIX}{counter}"), amount)
+
+
+def is_cacheable(size):
+    return bool(get_cache_size()) and bool(size) and 0 < size <= get_max_file_size()
+
+
+def get_cached_path(cache_id):
+    """
+    Get local path of a cached entry, refreshing its LRU position
+
+    Returns:
+        str: Path or None if not cached
+    """
+    path = _entry_path(cache_id)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def put(cache_id, fetch, content_hash=None):
+    """
+    Store content in the cache
+
+    Args:
+        cache_id (str): Content address
+        fetch (callable): Called with a temporary local path that must be
+            filled with the file content
+        content_hash (str): Expected md5 of the content (optional)
+
+    Returns:
+        str: Path of the cached entry
+
+    Raises:
+        ContentMismatchError: Fetched content does not match `content_hash`
+        FillInProgressError: Another process is filling the same entry
+    """
+    path = _entry_path(cache_id)
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    # Same temporary path on every attempt: fetch resumes partial downloads
+    tmp_path = os.path.join(folder, f"{TMP_PREFIX}{cache_id}")
+    with open(f"{tmp_path}.lock", "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise FillInProgressError(cache_id)
+        os.utime(lock.name)
+        try:
+            fetch(tmp_path)
+            if content_hash and _md5(tmp_path) != content_hash:
+                raise ContentMismatchError(cache_id)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except ContentMismatchError:
+            _remove_tmp_files(folder, cache_id)
+            raise
+        except BaseException:
+            # Partial download files are kept for the next attempt
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    _after_write(size)
+    return path
+
+
+def _remove_tmp_files(folder, cache_id):
+    "Temporary file of an entry and its partial download files (lock kept)"
+    prefix = f"{TMP_PREFIX}{cache_id}"
+    for entry in os.scandir(folder):
+        if not entry.name.startswith(prefix) or entry.name.endswith(".lock"):
+            continue
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def get_or_fetch(cache_id, size, fetch, content_hash=None):
+    """
+    Read through the cache
+
+    Args:
+        cache_id (str): Content address (see `cache_id_for`)
+        size (int): Expected size, used for admission
+        fetch (callable): Called with a local path to download the content into
+        content_hash (str): Expected md5 of the content (optional), content
+            not matching it is not cached
+
+    Returns:
+        str: Local path with the content, or None if content is not cacheable
+            (caller must then read it from the remote storage)
+    """
+    if not is_cacheable(size):
+        return None
+
+    path = get_cached_path(cache_id)
+    if path:
+        _count("hits")
+        _count("bytes_served", size)
+        return path
+
+    _count("misses")
+    try:
+        return put(cache_id, fetch, content_hash)
+    except FillInProgressError:
+        # Served from remote storage meanwhile
+        return None
+    except ContentMismatchError:
+        _count("mismatches")
+        frappe.log_error(f"Disk cache: remote content does not match hash {content_hash}")
+        return None
+
+
+def open_file(file_doc, fetch):
+    """
+    Open a remote File through the cache
+
+    Args:
+        file_doc: File doc
+        fetch (callable): Called with a local path to download the content into
+
+    Returns:
+        file: Opened binary file, or None if the file is not cacheable
+    """
+    path = get_or_fetch(
+        cache_id_for(file_doc), file_doc.file_size, fetch, file_doc.content_hash
+    )
+    return open(path, "rb") if path else None
+
+
+def _after_write(size):
+    last_scan, written = _writes_since_scan.get(frappe.local.site, (0, 0))
+    written += size
+    if written > get_cache_size() * (1 - EVICT_TO_RATIO) or (
+        time.time() - last_scan > EVICT_CHECK_INTERVAL
+    ):
+        evict()
+        written = 0
+        last_scan = time.time()
+    _writes_since_scan[frappe.local.site] = (last_scan, written)
+
+
+def _entries():
+    folder = get_cache_folder()
+    if not os.path.isdir(folder):
+        return
+    for bucket in os.scandir(folder):
+        if not bucket.is_dir():
+            continue
+        for entry in os.scandir(bucket.path):
+            if entry.name.startswith(TMP_PREFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            yield entry.path, stat.st_size, stat.st_mtime
+
+
+def _sweep_tmp_files():
+    "Remove temporary files of fills abandoned for `STALE_TMP_AGE`"
+    folder = get_cache_folder()
+    if not os.path.isdir(folder):
+        return
+    stale_before = time.time() - STALE_TMP_AGE
+    for bucket in os.scandir(folder):
+        if not bucket.is_dir():
+            continue
+        for entry in os.scandir(bucket.path):
+            if not entry.name.startswith(TMP_PREFIX):
+                continue
+            try:
+                if entry.stat().st_mtime < stale_before:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def evict(budget=None):
+    """
+    Remove abandoned temporary files, then least recently used entries until
+    total size is below budget
+    """
+    _sweep_tmp_files()
+    budget = get_cache_size() if budget is None else budget
+    entries = sorted(_entries(), key=lambda e: e[2])
+    total = sum(e[1] for e in entries)
+    if total <= budget:
+        return 0
+
+    target = budget * EVICT_TO_RATIO
+    evicted = 0
+    for path, size, _mtime in entries:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        evicted += 1
+    _count("evictions", evicted)
+    return evicted
+
+
+def remove(cache_id):
+    try:
+        os.remove(_entry_path(cache_id))
+    except FileNotFoundError:
+        pass
+
+
+@frappe.whitelist()
+def get_stats():
+    "Hit / miss counters and current disk usage"
+    frappe.only_for("System Manager")
+    cache = frappe.cache()
+    stats = {
+        counter: int(cache.get(cache.make_key(f"{DFP_DISK_CACHE_STATS_PREFIX}{counter}")) or 0)
+        for counter in ("hits", "misses", "mismatches", "bytes_served", "evictions")
+    }
+    entries = list(_entries())
+    stats.update(
+        {
+            "entries": len(entries),
+            "size": sum(e[1] for e in entries),
+            "budget": get_cache_size(),
+        }
+    )
+    return stats
@@ -10,7 +10,10 @@ import io
 import os
 import re
 import json
+import threading
+from collections import OrderedDict
 import frappe
+import requests
 from frappe import _
 from frappe.utils import get_request_site_address, get_url
 from datetime import datetime, timedelta
@@ -19,9 +22,22 @@ from dropbox import DropboxOAuth2Flow
 from dropbox.exceptions import ApiError, AuthError
 from dropbox.files import FileMetadata, FolderMetadata
 
+from dfp_external_storage.content_hash_cache import get_existing_key
+from dfp_external_storage.presigned_url_cache import (
+    get_presigned_url as get_presigned_url_cached,
+)
+from dfp_external_storage.storage_settings import get_storage_settings
+
 # Cache key prefix for Dropbox tokens
 DFP_DROPBOX_TOKEN_CACHE_PREFIX = "dfp_dropbox_token:"
 
+# Temporary links last 4 hours, renew them a bit before
+DROPBOX_TEMPORARY_LINK_TTL = timedelta(hours=3, minutes=50)
+# Temporary links kept per connection (least recently used dropped first)
+DROPBOX_TEMPORARY_LINKS_MAX = 1024
+# Ranged reads through temporary links: (connect, read) seconds
+DROPBOX_RANGE_READ_TIMEOUT = (10, 60)
+
 
 class DropboxConnection:
     """Dropbox connection handler for DFP External Storage"""
@@ -43,6 +59,9 @@ class DropboxConnection:
 
         # Initialize the connection
         self.dbx = None
+        # {file path: (link, expires at)}, shared by parallel range reads
+        self._temporary_links = OrderedDict()
+        self._temporary_links_lock = threading.Lock()
         self._connect()
 
     def _connect(self):
@@ -175,25 +194,15 @@ class DropboxConnection:
         Args:
             folder_path (str): Base folder path (not used directly, included for API compatibility)
             file_path (str): Full Dropbox file path
-            offset (int): Start byte position (not directly supported by Dropbox)
-            length (int): Number of bytes to read (not directly supported by Dropbox)
+            offset (int): Start byte position
+            length (int): Number of bytes to read
 
         Returns:
             BytesIO: File content as a file-like object
         """
         try:
             if offset > 0 or length > 0:
-                # Dropbox doesn't support range requests directly
-                # We need to download the whole file and then extract the range
-                metadata, response = self.dbx.files_download(file_path)
-                content = response.content
-
-                if offset > 0:
-                    content = content[offset:]
-                if length > 0:
-                    content = content[:length]
-
-                return io.BytesIO(content)
+                return io.BytesIO(self.read_range(folder_path, file_path, offset, length))
             else:
                 # Download the whole file
                 metadata, response = self.dbx.files_download(file_path)
@@ -202,6 +211,64 @@ class DropboxConnection:
             frappe.log_error(f"Dropbox download error: {str(e)}")
             raise
 
+    def _get_temporary_link(self, file_path):
+        """Direct download link for a file, reused while valid (4 hours)"""
+        now = datetime.now()
+        with self._temporary_links_lock:
+            link, expires_at = self._temporary_links.get(file_path, (None, None))
+            if link and expires_at > now:
+                self._temporary_links.move_to_end(file_path)
+                return link
+
+        link = self.dbx.files_get_temporary_link(file_path).link
+        with self._temporary_links_lock:
+            self._temporary_links[file_path] = (link, now + DROPBOX_TEMPORARY_LINK_TTL)
+            self._temporary_links.move_to_end(file_path)
+            for path, (_link, expires_at) in list(self._temporary_links.items()):
+                if expires_at <= now:
+                    del self._temporary_links[path]
+            while len(self._temporary_links) > DROPBOX_TEMPORARY_LINKS_MAX:
+                self._temporary_links.popitem(last=False)
+        return link
+
+    def _forget_temporary_link(self, file_path):
+        with self._temporary_links_lock:
+            self._temporary_links.pop(file_path, None)
+
+    def read_range(self, folder_path, file_path, offset, length=0):
+        """
+        Read a byte range of a Dropbox file
+
+        Dropbox API download endpoint does not expose ranges through the SDK, but
+        temporary links accept HTTP Range requests.
+
+        Args:
+            folder_path (str): Base folder path (not used directly, included for API compatibility)
+            file_path (str): Full Dropbox file path
+            offset (int): Start byte position
+            length (int): Number of bytes to read (0 to read until the end)
+
+        Returns:
+            bytes: Range content
+        """
+        range_end = "" if length <= 0 else str(offset + length - 1)
+        for attempt in range(2):
+            response = requests.get(
+                self._get_temporary_link(file_path),
+                headers={"Range": f"bytes={offset}-{range_end}"},
+                timeout=DROPBOX_RANGE_READ_TIMEOUT,
+            )
+            if response.status_code not in (404, 410):
+                break
+            # Link expired before expected: retry once with a fresh one
+            self._forget_temporary_link(file_path)
+        response.raise_for_status()
+        content = response.content
+        if response.status_code == 200 and (offset or length):
+            # Range ignored, whole file returned
+            content = content[offset : offset + length if length > 0 else None]
+        return content
+
     def fget_object(self, folder_path, file_path, local_path):
         """
         Download file from Dropbox to a local path
@@ -215,9 +282,17 @@ class DropboxConnection:
             bool: True if file was successfully downloaded
         """
         try:
-            with open(local_path, "wb") as f:
-                metadata, response = self.dbx.files_download(file_path)
-                f.write(response.content)
+            from dfp_external_storage.parallel_download import download_ranges_to_file
+            from dfp_external_storage.storage_backends import STAT_NORMALIZERS
+
+            # Ranged, resumable and parallel for big files
+            size, etag = STAT_NORMALIZERS["Dropbox"](self.stat_object(folder_path, file_path))
+            download_ranges_to_file(
+                lambda offset, length: self.read_range(folder_path, file_path, offset, length),
+                size,
+                local_path,
+                etag,
+            )
             return True
         except Exception as e:
             frappe.log_error(f"Dropbox download to file error: {str(e)}")
@@ -375,6 +450,75 @@ class DropboxConnection:
             frappe.log_error(f"Dropbox list error: {str(e)}")
             yield None
 
+    def list_objects_page(self, folder_path, prefix="", cursor=None, page_size=200):
+        """
+        One page of files within a Dropbox folder (recursive)
+
+        Args:
+            folder_path (str): Dropbox folder path
+            prefix (str): Subfolder of folder_path to list
+            cursor (str): Cursor returned by previous page
+            page_size (int): Approximate number of entries per page
+
+        Returns:
+            tuple: (list of file metadata dicts, next cursor or None)
+        """
+        if cursor:
+            result = self.dbx.files_list_folder_continue(cursor)
+        else:
+            # Missing folder raises: an empty answer would read as "no files"
+            path = "/" + "/".join(p.strip("/") for p in (folder_path, prefix) if p.strip("/"))
+            result = self.dbx.files_list_folder(
+                "" if path == "/" else path, recursive=True, limit=page_size
+            )
+
+        items = [
+            {
+                "key": entry.path_display,
+                "object_name": entry.path_display,
+                "size": entry.size,
+                "etag": entry.content_hash or "",
+                "last_modified": entry.server_modified,
+                "is_dir": False,
+                "storage_class": "DROPBOX",
+                "metadata": {"id": entry.id, "rev": entry.rev, "path": entry.path_display},
+            }
+            for entry in result.entries
+            if isinstance(entry, FileMetadata)
+        ]
+        return items, result.cursor if result.has_more else None
+
+    def temporary_upload_link(self, file_path, duration=4 * 60 * 60):
+        """
+        One time link the browser can POST the file content to (up to 150MB)
+
+        Args:
+            file_path (str): Full Dropbox path of the new file
+            duration (int): Link validity in seconds (max 4 hours)
+
+        Returns:
+            str: Upload link
+        """
+        result = self.dbx.files_get_temporary_upload_link(
+            dropbox.files.CommitInfo(path=file_path, mode=dropbox.files.WriteMode.add),
+            duration=duration,
+        )
+        return result.link
+
+    def direct_download_url(self, folder_path, file_path, expires=None):
+        """
+        Short lived url serving file content (Dropbox temporary link)
+
+        Args:
+            folder_path (str): Base folder path (not used directly, included for API compatibility)
+            file_path (str): Full Dropbox file path
+            expires (timedelta): Not used, temporary links are valid for 4 hours
+
+        Returns:
+            str: Temporary link
+        """
+        return self._get_temporary_link(file_path)
+
     def presigned_get_object(self, folder_path, file_path, expires=timedelta(hours=3)):
         """
         Create a temporary shareable link for a Dropbox file
@@ -779,23 +923,16 @@ class DFPExternalStorageDropboxFile:
         self.file_name = file_doc.file_name
         self.content_hash = file_doc.content_hash
         self.storage_doc = file_doc.dfp_external_storage_doc
+        self.settings = get_storage_settings(self.storage_doc.name)
         self.client = self._get_dropbox_client()
 
     def _get_dropbox_client(self):
         """Initialize Dropbox client"""
         try:
-            storage_doc = self.storage_doc
-            app_key = storage_doc.dropbox_app_key
-            app_secret = frappe.utils.password.get_decrypted_password(
-                "DFP External Storage", storage_doc.name, "dropbox_app_secret"
-            )
-            refresh_token = frappe.utils.password.get_decrypted_password(
-                "DFP External Storage", storage_doc.name, "dropbox_refresh_token"
-            )
+            from dfp_external_storage.storage_backends import get_connection
 
-            return DropboxConnection(
-                app_key=app_key, app_secret=app_secret, refresh_token=refresh_token
-            )
+            # Reused per process until storage settings change
+            return get_connection(self.storage_doc.name)
         except Exception as e:
             frappe.log_error(f"Failed to initialize Dropbox client: {str(e)}")
             return None
@@ -824,19 +961,34 @@ class DFPExternalStorageDropboxFile:
             if not os.path.exists(local_file):
                 frappe.throw(_("Local file not found: {0}").format(local_file))
 
+            from dfp_external_storage.dfp_external_storage.doctype.dfp_external_storage.dfp_external_storage import (
+                DFP_EXTERNAL_STORAGE_URL_SEGMENT_FOR_FILE_LOAD,
+            )
+
+            # Same content already in Dropbox: reuse its path, do not reupload
+            existing_key = get_existing_key(self.content_hash, self.storage_doc.name)
+            if existing_key:
+                self.file_doc.dfp_external_storage_s3_key = existing_key
+                self.file_doc.dfp_external_storage = self.storage_doc.name
+                self.file_doc.file_url = f"/{DFP_EXTERNAL_STORAGE_URL_SEGMENT_FOR_FILE_LOAD}/{self.file_doc.name}/{self.file_name}"
+                os.remove(local_file)
+                return True
+
             # Determine folder path
             folder_path = self.storage_doc.dropbox_folder_path
             if not folder_path.startswith("/"):
                 folder_path = "/" + folder_path
 
-            # Create destination path in Dropbox
-            dropbox_path = f"{folder_path}/{self.file_name}"
+            # Path unique per File (like S3 `site/name/file_name` keys): uploads
+            # overwrite, so a shared `folder/file_name` path would replace the
+            # content deduplicated Files point to
+            dropbox_name = f"{self.file_doc.name}/{self.file_name}"
 
             # Upload file
             with open(local_file, "rb") as f:
                 # Upload to Dropbox
                 result = self.client.put_object(
-                    folder_path=folder_path, file_name=self.file_name, data=f
+                    folder_path=folder_path, file_name=dropbox_name, data=f
                 )
 
                 if not result:
@@ -847,10 +999,6 @@ class DFPExternalStorageDropboxFile:
                 self.file_doc.dfp_external_storage = self.storage_doc.name
 
                 # Update file_url to use our custom URL pattern
-                from dfp_external_storage.dfp_external_storage.doctype.dfp_external_storage.dfp_external_storage import (
-                    DFP_EXTERNAL_STORAGE_URL_SEGMENT_FOR_FILE_LOAD,
-                )
-
                 self.file_doc.file_url = f"/{DFP_EXTERNAL_STORAGE_URL_SEGMENT_FOR_FILE_LOAD}/{self.file_doc.name}/{self.file_name}"
 
                 # Remove local file
@@ -879,15 +1027,14 @@ class DFPExternalStorageDropboxFile:
             return False
 
         # Check if other files use the same key
-        files_using_key = frappe.get_all(
-            "File",
-            filters={
-                "dfp_external_storage_s3_key": self.file_doc.dfp_external_storage_s3_key,
-                "dfp_external_storage": self.file_doc.dfp_external_storage,
-            },
+        from dfp_external_storage.dfp_external_storage.doctype.dfp_external_storage_key_ref.dfp_external_storage_key_ref import (
+            is_key_shared,
         )
 
-        if len(files_using_key) > 1:
+        if is_key_shared(
+            self.file_doc.dfp_external_storage,
+            self.file_doc.dfp_external_storage_s3_key,
+        ):
             # Other files are using this Dropbox file, don't delete
             return False
 
@@ -905,13 +1052,12 @@ class DFPExternalStorageDropboxFile:
             return False
 
     def download_file(self):
-        """Download file from Dropbox"""
+        """Download file from Dropbox (through the local disk cache)"""
         try:
-            file_content = self.client.get_object(
-                folder_path=None,  # Not needed for Dropbox
-                file_path=self.file_doc.dfp_external_storage_s3_key,
-            )
-            return file_content.read()
+            from dfp_external_storage.storage_backends import open_file
+
+            with open_file(self.file_doc, connection=self.client) as file_content:
+                return file_content.read()
         except Exception as e:
             error_msg = _("Error downloading file from Dropbox")
             frappe.log_error(title=f"{error_msg}: {self.file_name}")
@@ -919,20 +1065,19 @@ class DFPExternalStorageDropboxFile:
             return b""
 
     def stream_file(self):
-        """Stream file from Dropbox"""
+        """Stream file from Dropbox (through the local disk cache)"""
         try:
             from werkzeug.wsgi import wrap_file
 
-            file_content = self.client.get_object(
-                folder_path=None,  # Not needed for Dropbox
-                file_path=self.file_doc.dfp_external_storage_s3_key,
-            )
+            from dfp_external_storage.storage_backends import open_file
+
+            file_content = open_file(self.file_doc, connection=self.client)
 
             # Wrap the file content for streaming
             return wrap_file(
                 environ=frappe.local.request.environ,
                 file=file_content,
-                buffer_size=self.storage_doc.setting_stream_buffer_size,
+                buffer_size=self.settings.stream_buffer_size or 8192,
             )
         except Exception as e:
             frappe.log_error(f"Dropbox streaming error: {str(e)}")
@@ -941,28 +1086,29 @@ class DFPExternalStorageDropboxFile:
     def download_to_local_and_remove_remote(self):
         """Download file from Dropbox and remove the remote file"""
         try:
-            # Get file content
-            file_content = self.client.get_object(
-                folder_path=None,  # Not needed for Dropbox
-                file_path=self.file_doc.dfp_external_storage_s3_key,
-            )
+            from dfp_external_storage.parallel_download import download_to_site_files
 
-            # Save content
-            self.file_doc._content = file_content.read()
+            # Download to site files (parallel ranged reads for big files)
+            self.file_doc.file_url = download_to_site_files(
+                self.file_doc, connection=self.client
+            )
 
             # Clear storage info
+            storage = self.file_doc.dfp_external_storage
             file_path = self.file_doc.dfp_external_storage_s3_key
             self.file_doc.dfp_external_storage_s3_key = ""
             self.file_doc.dfp_external_storage = ""
 
-            # Save to filesystem
-            self.file_doc.save_file_on_filesystem()
-
-            # Delete from Dropbox
-            self.client.remove_object(
-                folder_path=None, file_path=file_path  # Not needed for Dropbox
+            # Delete from Dropbox, unless other files still use the same path
+            from dfp_external_storage.dfp_external_storage.doctype.dfp_external_storage_key_ref.dfp_external_storage_key_ref import (
+                is_key_shared,
             )
 
+            if not is_key_shared(storage, file_path):
+                self.client.remove_object(
+                    folder_path=None, file_path=file_path  # Not needed for Dropbox
+                )
+
             return True
         except Exception as e:
             error_msg = _("Error downloading and removing file from Dropbox.")
@@ -970,35 +1116,23 @@ class DFPExternalStorageDropboxFile:
             frappe.throw(error_msg)
             return False
 
+    def file_proxy(self, **kwargs):
+        """Seekable file-like object reading the Dropbox file lazily by ranges"""
+        from dfp_external_storage.storage_backends import get_file_proxy
+
+        return get_file_proxy(self.file_doc, connection=self.client, **kwargs)
+
     def get_presigned_url(self):
         """Get a presigned URL for the file"""
         try:
-            if not self.storage_doc.presigned_urls:
+            # Check presigned urls enabled and mimetype restrictions
+            if not self.settings.presigned_url_allowed(
+                self.file_doc.dfp_mime_type_guess_by_file_name
+            ):
                 return None
 
-            # Check mimetype restrictions
-            if (
-                self.storage_doc.presigned_mimetypes_starting
-                and self.file_doc.dfp_mime_type_guess_by_file_name
-            ):
-                presigned_mimetypes_starting = [
-                    i.strip()
-                    for i in self.storage_doc.presigned_mimetypes_starting.split("\n")
-                    if i.strip()
-                ]
-
-                if not any(
-                    self.file_doc.dfp_mime_type_guess_by_file_name.startswith(i)
-                    for i in presigned_mimetypes_starting
-                ):
-                    return None
-
-            # Get presigned URL
-            return self.client.presigned_get_object(
-                folder_path=None,  # Not needed for Dropbox
-                file_path=self.file_doc.dfp_external_storage_s3_key,
-                expires=self.storage_doc.setting_presigned_url_expiration,
-            )
+            # Reused from cache while valid
+            return get_presigned_url_cached(self.file_doc)
         except Exception as e:
             frappe.log_error(f"Error generating Dropbox presigned URL: {str(e)}")
             return None
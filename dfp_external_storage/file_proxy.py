@@ -0,0 +1,246 @@
+"""
+Random access proxy for remote files
+
+`RangeFileProxy` is a seekable, read only `io.RawIOBase` over any remote
+object able to answer ranged reads. Consumers like zipfile, PDF parsers or
+openpyxl issue many small, overlapping reads; sending each one as a ranged
+GET is slow, so the proxy reads whole aligned blocks and keeps them in a LRU:
+
+- Fixed size blocks aligned to block size, so overlapping reads share blocks.
+- Contiguous missing blocks are fetched with a single ranged read.
+- Sequential access is detected (read starting where the previous one ended)
+  and readahead grows exponentially up to a maximum, resetting on seeks.
+- Blocks live in a per proxy LRU and, optionally, in a process wide LRU shared
+  by all proxies (`get_shared_block_cache()`), keyed by a caller given source
+  id that must change when the remote content changes (e.g. include etag).
+
+This module does not depend on frappe so it can be benchmarked standalone.
+"""
+
+import io
+import threading
+from collections import OrderedDict
+
+DEFAULT_BLOCK_SIZE = 256 * 1024
+DEFAULT_CACHE_BLOCKS = 64
+DEFAULT_READAHEAD_MAX_BLOCKS = 32
+DEFAULT_SHARED_CACHE_BLOCKS = 256
+
+
+class BlockCache:
+    """Thread safe LRU of blocks keyed by (source id, block index)"""
+
+    def __init__(self, max_blocks):
+        self.max_blocks = max_blocks
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is not None:
+                self._blocks.move_to_end(key)
+            return block
+
+    def put(self, key, block):
+        if self.max_blocks <= 0:
+            return
+        with self._lock:
+            self._blocks[key] = block
+            self._blocks.move_to_end(key)
+            while len(self._blocks) > self.max_blocks:
+                self._blocks.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+
+    def __len__(self):
+        return len(self._blocks)
+
+
+_shared_block_cache = None
+
+
+def get_shared_block_cache():
+    "Process wide block cache shared by proxies created with `shared_cache=True`"
+    global _shared_block_cache
+    if _shared_block_cache is None:
+        _shared_block_cache = BlockCache(DEFAULT_SHARED_CACHE_BLOCKS)
+    return _shared_block_cache
+
+
+class RangeFileProxy(io.RawIOBase):
+    """
+    Seekable read only file over ranged reads
+
+    Args:
+        read_range (callable): read_range(offset, length) -> bytes
+        size (int): Total object size
+        block_size (int): Aligned block size fetched from remote
+        cache_blocks (int): Blocks kept in this proxy LRU
+        shared_cache (bool | BlockCache): Also use a shared block cache
+        source_id (str): Cache key of remote content (required for shared cache)
+        readahead_max_blocks (int): Max extra blocks fetched on sequential reads
+    """
+
+    def __init__(
+        self,
+        read_range,
+        size,
+        block_size=DEFAULT_BLOCK_SIZE,
+        cache_blocks=DEFAULT_CACHE_BLOCKS,
+        shared_cache=False,
+        source_id=None,
+        readahead_max_blocks=DEFAULT_READAHEAD_MAX_BLOCKS,
+    ):
+        super().__init__()
+        self._read_range = read_range
+        self.size = size
+        self.block_size = block_size
+        self.readahead_max_blocks = readahead_max_blocks
+        self._cache = BlockCache(cache_blocks)
+        if shared_cache is True:
+            shared_cache = get_shared_block_cache()
+        # Not a truth test: an empty BlockCache has len 0
+        use_shared = isinstance(shared_cache, BlockCache) and source_id
+        self._shared_cache = shared_cache if use_shared else None
+        self._source_id = source_id
+        self._pos = 0
+        self._last_read_end = None
+        self._readahead_blocks = 0
+        # Stats
+        self.remote_reads = 0
+        self.remote_bytes = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence ({whence})")
+        if pos < 0:
+            raise ValueError(f"Negative seek position {pos}")
+        self._pos = pos
+        return pos
+
+    def readinto(self, b):
+        view = memoryview(b).cast("B")
+        length = min(len(view), self.size - self._pos)
+        if length <= 0:
+            return 0
+
+        start = self._pos
+        end = start + length
+        self._update_readahead(start)
+
+        written = 0
+        for index, block in self._get_blocks(start // self.block_size, (end - 1) // self.block_size):
+            block_start = index * self.block_size
+            lo = max(start, block_start) - block_start
+            hi = min(end, block_start + len(block)) - block_start
+            view[written : written + hi - lo] = block[lo:hi]
+            written += hi - lo
+
+        self._pos += written
+        self._last_read_end = self._pos
+        return written
+
+    def readall(self):
+        return self.read(self.size - self._pos)
+
+    def _update_readahead(self, start):
+        if start == self._last_read_end:
+            self._readahead_blocks = min(
+                max(1, self._readahead_blocks * 2), self.readahead_max_blocks
+            )
+        else:
+            self._readahead_blocks = 0
+
+    def _cache_get(self, index):
+        block = self._cache.get(index)
+        if block is None and self._shared_cache is not None:
+            block = self._shared_cache.get((self._source_id, index))
+            if block is not None:
+                self._cache.put(index, block)
+        return block
+
+    def _cache_put(self, index, block):
+        self._cache.put(index, block)
+        if self._shared_cache is not None:
+            self._shared_cache.put((self._source_id, index), block)
+
+    def _get_blocks(self, first, last):
+        "Yields (index, block) for first..last, fetching missing runs at once"
+        last_block = (self.size - 1) // self.block_size
+        blocks = {}
+        missing = []
+        for index in range(first, last + 1):
+            block = self._cache_get(index)
+            if block is None:
+                missing.append(index)
+            else:
+                blocks[index] = block
+
+        if missing:
+            # Extend last run with readahead blocks not cached yet
+            readahead_end = min(last + self._readahead_blocks, last_block)
+            if missing[-1] == last:
+                for index in range(last + 1, readahead_end + 1):
+                    if self._cache_get(index) is not None:
+                        break
+                    missing.append(index)
+            for run_first, run_last in _runs(missing):
+                blocks.update(self._fetch(run_first, run_last))
+
+        for index in range(first, last + 1):
+            yield index, blocks[index]
+
+    def _fetch(self, first, last):
+        offset = first * self.block_size
+        length = min((last + 1) * self.block_size, self.size) - offset
+        data = self._read_range(offset, length)
+        self.remote_reads += 1
+        self.remote_bytes += len(data)
+        if len(data) != length:
+            # Never cache a short read: blocks would stay truncated
+            raise IOError(
+                f"Short range read at {offset}: expected {length} bytes, got {len(data)}"
+            )
+        fetched = {}
+        for index in range(first, last + 1):
+            lo = (index - first) * self.block_size
+            block = bytes(data[lo : lo + self.block_size])
+            self._cache_put(index, block)
+            fetched[index] = block
+        return fetched
+
+
+def _runs(indexes):
+    "Groups sorted block indexes in (first, last) contiguous runs"
+    run_first = run_last = indexes[0]
+    for index in indexes[1:]:
+        if index == run_last + 1:
+            run_last = index
+            continue
+        yield run_first, run_last
+        run_first = run_last = index
+    yield run_first, run_last
+
+
+def open_range_proxy(read_range, size, source_id=None, **kwargs):
+    "Buffered reader over a `RangeFileProxy`, the usual object to hand to consumers"
+    raw = RangeFileProxy(read_range, size, source_id=source_id, **kwargs)
+    return io.BufferedReader(raw, buffer_size=min(raw.block_size, io.DEFAULT_BUFFER_SIZE))
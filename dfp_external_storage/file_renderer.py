@@ -0,0 +1,445 @@
+"""
+Fast paths for `/file/<name>/<file_name>` urls
+
+`DFPExternalStorageFileRenderer` streams whole files from byte 0. This
+renderer is listed before it in `page_renderer` hook and only takes requests
+it can answer without a full body:
+
+- `Range` requests (seeking videos, resuming downloads) are answered with
+  206 Partial Content, reading only requested bytes from the local disk cache
+  or from the remote storage with ranged reads. A cache miss does not wait for
+  the whole file: it is served remotely while a background job fills the
+  cache for files within its budget. Several ranges are answered with a multipart/byteranges
+  body. `If-Range` not matching current file validators falls back to the
+  full file, as required by RFC 9110.
+- Conditional requests (`If-None-Match`, `If-Modified-Since`) matching
+  current validators are answered with 304 Not Modified from File doc fields
+  alone, without touching the remote storage.
+- Big files (size and mimetype policy below) of storages with presigned urls
+  enabled are answered, after permission check, with a 302 redirect to a
+  short lived storage url (S3 presigned url, Dropbox temporary link, OneDrive
+  download url), so bytes do not go through a web worker. Off unless a
+  minimum size is configured. Google Drive files are always streamed.
+
+Full responses of the main renderer get the same validators and a
+`Cache-Control` header through `after_request` hook (`hook_after_request`).
+
+Site config (`site_config.json`):
+    dfp_external_storage_public_cache_control: `Cache-Control` of public
+        files (default "public, max-age=3600")
+    dfp_external_storage_private_cache_control: `Cache-Control` of private
+        files (default "private, no-cache", browsers revalidate every time)
+    dfp_external_storage_redirect_min_size: files of this size (bytes) or
+        bigger are redirected (default 0, redirects disabled)
+    dfp_external_storage_redirect_mimetypes: list of mimetype prefixes to
+        redirect, e.g. ["video/", "application/zip"] (default all)
+    dfp_external_storage_redirect_url_expiration: validity of redirect urls
+        in seconds, where the storage allows choosing it (default 300)
+
+Anything else is left to `DFPExternalStorageFileRenderer`.
+"""
+
+import mimetypes
+import os
+from datetime import timedelta, timezone
+from urllib.parse import quote
+from zoneinfo import ZoneInfo
+
+import frappe
+from frappe.utils import get_datetime, get_system_timezone
+from frappe.website.page_renderers.base_renderer import BaseRenderer
+from werkzeug.http import http_date
+from werkzeug.wrappers import Response
+
+from dfp_external_storage import disk_cache
+from dfp_external_storage.dfp_external_storage.doctype.dfp_external_storage.dfp_external_storage import (
+    DFP_EXTERNAL_STORAGE_URL_SEGMENT_FOR_FILE_LOAD,
+    DFPExternalStorageFileRenderer,
+)
+from dfp_external_storage.storage_backends import (
+    enqueue_fill_disk_cache,
+    get_connection,
+    get_direct_download_url,
+    get_folder,
+    remote_stat,
+    supports_direct_download,
+)
+from dfp_external_storage.storage_settings import get_storage_settings
+
+# Bytes read from storage per backend call while streaming a range
+RANGE_READ_CHUNK_SIZE = 4 * 1024 * 1024
+# More ranges than this in a single request are ignored (full file is served)
+MAX_RANGES = 16
+DEFAULT_PUBLIC_CACHE_CONTROL = "public, max-age=3600"
+DEFAULT_PRIVATE_CACHE_CONTROL = "private, no-cache"
+# Redirects are opt-in
+DEFAULT_REDIRECT_MIN_SIZE = 0
+DEFAULT_REDIRECT_URL_EXPIRATION = 300
+
+
+def is_file_path(path):
+    parts = path.strip("/").split("/")
+    return len(parts) == 3 and parts[0] == DFP_EXTERNAL_STORAGE_URL_SEGMENT_FOR_FILE_LOAD
+
+
+def get_file_doc_for_path(path):
+    """
+    File doc of an external storage `/file/<name>/<file_name>` path
+
+    Returns:
+        File doc or None if path is not an external storage file url
+    """
+    if not is_file_path(path):
+        return None
+    parts = path.strip("/").split("/")
+    file_name = frappe.db.get_value("File", parts[1], "file_name")
+    if not file_name or file_name != parts[2]:
+        return None
+    file_doc = frappe.get_doc("File", parts[1])
+    if not file_doc.dfp_external_storage or not file_doc.dfp_external_storage_s3_key:
+        return None
+    return file_doc
+
+
+def file_etag(file_doc, backend_etag=None):
+    "Strong validator of File content: content hash, else remote etag"
+    value = file_doc.content_hash or backend_etag
+    return f'"{value}"' if value else None
+
+
+def file_last_modified(file_doc):
+    "File doc modification time as an aware UTC datetime, second precision"
+    modified = get_datetime(file_doc.modified).replace(microsecond=0)
+    return modified.replace(tzinfo=ZoneInfo(get_system_timezone())).astimezone(timezone.utc)
+
+
+def cache_control(file_doc):
+    if file_doc.is_private:
+        return frappe.conf.get(
+            "dfp_external_storage_private_cache_control", DEFAULT_PRIVATE_CACHE_CONTROL
+        )
+    return frappe.conf.get("dfp_external_storage_public_cache_control", DEFAULT_PUBLIC_CACHE_CONTROL)
+
+
+def set_validator_headers(response, file_doc, etag=None):
+    "ETag, Last-Modified and Cache-Control headers of a File response"
+    etag = etag or file_etag(file_doc)
+    if etag:
+        response.headers["ETag"] = etag
+    response.headers["Last-Modified"] = http_date(file_last_modified(file_doc))
+    response.headers["Cache-Control"] = cache_control(file_doc)
+
+
+def is_not_modified(request, file_doc):
+    """
+    Conditional GET evaluation using File doc fields only (RFC 9110 13.2.2)
+
+    `If-None-Match` can only match files with a content hash, as any other
+    etag would need a remote stat. `If-Modified-Since` is ignored when
+    `If-None-Match` is present.
+    """
+    if request.if_none_match:
+        etag = file_etag(file_doc)
+        return bool(etag) and request.if_none_match.contains_weak(etag.strip('"'))
+    if request.if_modified_since:
+        return file_last_modified(file_doc) <= request.if_modified_since
+    return False
+
+
+def should_redirect(file_doc):
+    """
+    Redirect policy, evaluated from File doc fields and storage settings only.
+    Opt-in: needs a redirect min size in site config and presigned urls
+    enabled in the storage (its endpoint must be reachable by browsers).
+    """
+    min_size = int(
+        frappe.conf.get("dfp_external_storage_redirect_min_size", DEFAULT_REDIRECT_MIN_SIZE)
+    )
+    if not min_size or (file_doc.file_size or 0) < min_size:
+        return False
+    mimetypes_starting = tuple(frappe.conf.get("dfp_external_storage_redirect_mimetypes") or ())
+    if mimetypes_starting and not file_mimetype(file_doc).startswith(mimetypes_starting):
+        return False
+    if not get_storage_settings(file_doc.dfp_external_storage).presigned_urls:
+        return False
+    return supports_direct_download(file_doc.dfp_external_storage)
+
+
+def file_mimetype(file_doc):
+    return mimetypes.guess_type(file_doc.file_name or "")[0] or "application/octet-stream"
+
+
+def content_disposition(file_doc, disposition="inline"):
+    return f"{disposition}; filename*=UTF-8''{quote(file_doc.file_name or file_doc.name)}"
+
+
+class RemoteFileSource:
+    """
+    Ranged reads over a File, from local disk cache or remote storage
+    otherwise (filling the cache in background for cacheable sizes). Remote stat is done once,
+    when size or etag is needed.
+    """
+
+    def __init__(self, file_doc):
+        self.file_doc = file_doc
+        self.storage = file_doc.dfp_external_storage
+        self.key = file_doc.dfp_external_storage_s3_key
+        self._local_path = None
+        self._connection = None
+        self._stat = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = get_connection(self.storage)
+        return self._connection
+
+    @property
+    def local_path(self):
+        "Disk cache entry of the File, empty when not cached yet"
+        if self._local_path is None:
+            self._local_path = (
+                disk_cache.get_cached_path(disk_cache.cache_id_for(self.file_doc)) or ""
+            )
+            if not self._local_path and disk_cache.is_cacheable(self.file_doc.file_size):
+                # Range requests must not wait for a full download
+                enqueue_fill_disk_cache(self.file_doc)
+        return self._local_path
+
+    def stat(self):
+        "(size, backend etag)"
+        if self._stat is None:
+            if self.local_path:
+                self._stat = (os.path.getsize(self.local_path), None)
+            else:
+                self._stat = remote_stat(self.storage, self.key, self.connection)
+        return self._stat
+
+    @property
+    def size(self):
+        return self.stat()[0]
+
+    @property
+    def etag(self):
+        return file_etag(self.file_doc, self.stat()[1])
+
+    def iter_range(self, start, stop, chunk_size=RANGE_READ_CHUNK_SIZE):
+        "Yields content of bytes start..stop (stop excluded) in chunks"
+        if self.local_path:
+            with open(self.local_path, "rb") as f:
+                f.seek(start)
+                while start < stop:
+                    data = f.read(min(chunk_size, stop - start))
+                    if not data:
+                        break
+                    start += len(data)
+                    yield data
+            return
+
+        folder = get_folder(self.storage)
+        while start < stop:
+            data = self.connection.read_range(
+                folder, self.key, start, min(chunk_size, stop - start)
+            )
+            if not data:
+                break
+            start += len(data)
+            yield data
+
+
+def resolve_ranges(byte_ranges, size):
+    """
+    Absolute (start, stop) ranges satisfiable within size
+
+    Args:
+        byte_ranges (list): werkzeug `Range.ranges`, (start, stop or None) with
+            negative start for suffix ranges
+        size (int): Total content size
+
+    Returns:
+        list: [(start, stop)], stop excluded; empty when none is satisfiable
+    """
+    resolved = []
+    for start, stop in byte_ranges:
+        if start < 0:
+            start, stop = max(size + start, 0), size
+        else:
+            stop = size if stop is None else min(stop, size)
+        if start < stop:
+            resolved.append((start, stop))
+    return resolved
+
+
+def if_range_matches(if_range, etag, last_modified):
+    "`If-Range` precondition, strong comparison only"
+    if not if_range:
+        return True
+    if if_range.etag:
+        return bool(etag) and if_range.etag == etag.strip('"')
+    if if_range.date:
+        return last_modified <= if_range.date
+    return False
+
+
+def partial_content_response(source, ranges):
+    "206 response for resolved ranges (single part or multipart/byteranges)"
+    file_doc = source.file_doc
+    size = source.size
+    mimetype = file_mimetype(file_doc)
+
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        response = Response(
+            source.iter_range(start, stop), status=206, mimetype=mimetype, direct_passthrough=True
+        )
+        response.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+        response.headers["Content-Length"] = str(stop - start)
+    else:
+        boundary = frappe.generate_hash(length=24)
+        heads = [
+            (
+                f"--{boundary}\r\nContent-Type: {mimetype}\r\n"
+                f"Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n"
+            ).encode("ascii")
+            for start, stop in ranges
+        ]
+        tail = f"\r\n--{boundary}--\r\n".encode("ascii")
+
+        def body():
+            for i, (start, stop) in enumerate(ranges):
+                yield (b"\r\n" if i else b"") + heads[i]
+                yield from source.iter_range(start, stop)
+            yield tail
+
+        length = sum(len(h) for h in heads) + 2 * (len(ranges) - 1) + len(tail)
+        length += sum(stop - start for start, stop in ranges)
+        response = Response(
+            body(),
+            status=206,
+            mimetype=f"multipart/byteranges; boundary={boundary}",
+            direct_passthrough=True,
+        )
+        response.headers["Content-Length"] = str(length)
+
+    response.headers["Accept-Ranges"] = "bytes"
+    response.headers["Content-Disposition"] = content_disposition(file_doc)
+    set_validator_headers(response, file_doc, source.etag)
+    return response
+
+
+def redirect_response(url):
+    response = Response(status=302)
+    response.headers["Location"] = url
+    # Url expires soon, it must not be reused from any cache
+    response.headers["Cache-Control"] = "private, no-store"
+    return response
+
+
+def not_modified_response(file_doc):
+    response = Response(status=304)
+    set_validator_headers(response, file_doc)
+    return response
+
+
+def range_not_satisfiable_response(size):
+    response = Response(status=416)
+    response.headers["Content-Range"] = f"bytes */{size}"
+    response.headers["Accept-Ranges"] = "bytes"
+    return response
+
+
+class DFPExternalStorageFileFastPathRenderer(BaseRenderer):
+    "Not modified, redirect and partial content answers for external storage files"
+
+    def can_render(self):
+        request = frappe.request
+        if not request or request.method not in ("GET", "HEAD") or not is_file_path(self.path):
+            return False
+
+        self.file_doc = get_file_doc_for_path(self.path)
+        if not self.file_doc:
+            return False
+        if not get_storage_settings(self.file_doc.dfp_external_storage).enabled:
+            return False
+
+        # Conditional headers are evaluated before Range
+        if is_not_modified(request, self.file_doc):
+            self.answer = "not_modified"
+        elif should_redirect(self.file_doc):
+            self.answer = "redirect"
+        elif self.prepare_partial():
+            self.answer = "partial"
+        else:
+            return False
+        return True
+
+    def prepare_partial(self):
+        "Range request can be answered with partial content"
+        request = frappe.request
+        if not request.headers.get("Range"):
+            return False
+
+        # Malformed or abusive Range headers are ignored: full file is served
+        byte_range = request.range
+        if not byte_range or byte_range.units != "bytes" or len(byte_range.ranges) > MAX_RANGES:
+            return False
+
+        self.byte_ranges = byte_range.ranges
+        return True
+
+    def render(self):
+        if not self.file_doc.is_downloadable():
+            raise frappe.PermissionError
+
+        if self.answer == "not_modified":
+            return not_modified_response(self.file_doc)
+
+        if self.answer == "redirect":
+            expiration = int(
+                frappe.conf.get(
+                    "dfp_external_storage_redirect_url_expiration", DEFAULT_REDIRECT_URL_EXPIRATION
+                )
+            )
+            url = get_direct_download_url(self.file_doc, timedelta(seconds=expiration))
+            if url:
+                return redirect_response(url)
+            # No url from storage: serve bytes ourselves
+            if not self.prepare_partial():
+                return self.render_full()
+
+        # Validators may need a remote stat: only after the permission check
+        self.source = RemoteFileSource(self.file_doc)
+        if_range = frappe.request.if_range
+        if if_range and not if_range_matches(
+            if_range, self.source.etag, file_last_modified(self.file_doc)
+        ):
+            return self.render_full()
+
+        ranges = resolve_ranges(self.byte_ranges, self.source.size)
+        if not ranges:
+            return range_not_satisfiable_response(self.source.size)
+        return partial_content_response(self.source, ranges)
+
+    def render_full(self):
+        return DFPExternalStorageFileRenderer(self.path, self.http_status_code).render()
+
+
+def hook_after_request(response, request):
+    "Validators and caching headers on full external storage file responses"
+    if request.method not in ("GET", "HEAD") or response.status_code != 200:
+        return
+    if "ETag" in response.headers:
+        return
+    if not is_file_path(request.path):
+        return
+    parts = request.path.strip("/").split("/")
+    file_doc = frappe.db.get_value(
+        "File",
+        parts[1],
+        ["name", "content_hash", "modified", "is_private", "dfp_external_storage"],
+        as_dict=True,
+    )
+    if not file_doc or not file_doc.dfp_external_storage:
+        return
+    set_validator_headers(response, file_doc)
+    response.headers["Accept-Ranges"] = "bytes"
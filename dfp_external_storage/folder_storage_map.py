@@ -0,0 +1,109 @@
+"""
+Folder to storage map for DFP External Storage
+
+A "File" uses the "DFP External Storage" assigned to its folder or, if none,
+the one assigned to the closest parent folder up to "Home". Instead of walking
+the folder tree on every "File" save, the resolved storage for every folder is
+precomputed and kept in a per site Redis hash, so resolving is a single field
+lookup. The map is dropped when changes to storages or folders are committed,
+so it is never rebuilt from uncommitted rows.
+"""
+
+import pickle
+
+import frappe
+
+DFP_FOLDER_STORAGE_CACHE_KEY = "dfp_external_storage_folder_storage"
+
+# Stored for folders without storage, so they are not recomputed on every call
+NO_STORAGE = ""
+
+
+def build_folder_storage_map():
+    """
+    Resolve the storage of every folder
+
+    Returns:
+        dict: {folder name: storage name or NO_STORAGE}
+    """
+    enabled_storages = set(
+        frappe.get_all("DFP External Storage", filters={"enabled": 1}, pluck="name")
+    )
+    assigned = {}
+    for row in frappe.get_all(
+        "DFP External Storage by Folder",
+        fields=["parent", "folder"],
+        filters={"parenttype": "DFP External Storage"},
+    ):
+        if row.parent in enabled_storages and row.folder:
+            assigned[row.folder] = row.parent
+
+    parents = {
+        f.name: f.folder
+        for f in frappe.get_all("File", filters={"is_folder": 1}, fields=["name", "folder"])
+    }
+
+    resolved = {}
+    for folder in parents:
+        # Walk up until a folder with known storage, then fill in the path
+        path = []
+        current = folder
+        while current and current not in resolved and current not in assigned:
+            path.append(current)
+            current = parents.get(current)
+            if current in path:  # broken tree
+                break
+        if current in resolved:
+            storage = resolved[current]
+        else:
+            storage = assigned.get(current, NO_STORAGE)
+        for name in path:
+            resolved[name] = storage
+    resolved.update(assigned)
+    return resolved
+
+
+def get_storage_for_folder(folder):
+    """
+    Get "DFP External Storage" used by files within given folder
+
+    Args:
+        folder (str): Folder "File" name (e.g. "Home/Attachments")
+
+    Returns:
+        str: Storage name or None if files in that folder stay local
+    """
+    if not folder:
+        return None
+
+    cache = frappe.cache()
+    storage = cache.hget(DFP_FOLDER_STORAGE_CACHE_KEY, folder)
+    if storage is None:
+        folder_map = build_folder_storage_map()
+        storage = folder_map.setdefault(folder, NO_STORAGE)
+        # Whole map in one round trip, values pickled as `RedisWrapper.hget` expects
+        cache_name = cache.make_key(DFP_FOLDER_STORAGE_CACHE_KEY)
+        pipe = cache.pipeline()
+        pipe.delete(cache_name)
+        pipe.hset(
+            cache_name,
+            mapping={name: pickle.dumps(value) for name, value in folder_map.items()},
+        )
+        pipe.execute()
+
+    return storage or None
+
+
+def clear_folder_storage_map(*args, **kwargs):
+    frappe.cache().delete_key(DFP_FOLDER_STORAGE_CACHE_KEY)
+
+
+def hook_storage_changed(doc, method=None):
+    "Drop map once a storage change is committed"
+    frappe.db.after_commit.add(clear_folder_storage_map)
+
+
+def hook_file_folder_changed(doc, method=None):
+    "Drop map once a folder creation, move or deletion is committed"
+    if doc.is_folder:
+        frappe.db.after_commit.add(clear_folder_storage_map)
@@ -12,6 +12,7 @@ import io
 import os
 import re
 import json
+import threading
 import frappe
 from frappe import _
 from frappe.utils import get_request_site_address, get_url
@@ -54,11 +55,29 @@ class GoogleDriveConnection:
         self.client_secret = client_secret
         self.refresh_token = refresh_token
         self.token_uri = token_uri
-        self.service = None
+        self._credentials = None
+        # Drive API service per thread (see `service`)
+        self._local = threading.local()
 
         # Initialize the connection
         self._connect()
 
+    @property
+    def service(self):
+        """
+        Drive API service of the calling thread
+
+        Services wrap an httplib2 `Http`, which is not thread safe, and the
+        connection is shared by the threads of parallel downloads and
+        transfers: each thread builds its own over the shared credentials.
+        """
+        service = getattr(self._local, "service", None)
+        if service is None and self._credentials is not None:
+            service = self._local.service = build(
+                "drive", "v3", credentials=self._credentials
+            )
+        return service
+
     def _connect(self):
         """Establish connection to Google Drive API"""
         try:
@@ -75,8 +94,9 @@ class GoogleDriveConnection:
             if creds.expired:
                 creds.refresh(Request())
 
-            # Build the Drive API service
-            self.service = build("drive", "v3", credentials=creds)
+            # Drive API services are built on first use in each thread
+            self._credentials = creds
+            self._local = threading.local()
             return True
         except Exception as e:
             frappe.log_error(f"Google Drive connection error: {str(e)}")
@@ -176,13 +196,16 @@ class GoogleDriveConnection:
         Args:
             folder_id (str): Not used for Google Drive (included for API compatibility)
             file_id (str): Google Drive file ID
-            offset (int): Start byte position (not directly supported by Google Drive)
-            length (int): Number of bytes to read (not directly supported by Google Drive)
+            offset (int): Start byte position
+            length (int): Number of bytes to read
 
         Returns:
             BytesIO: File content as a file-like object
         """
         try:
+            if offset > 0 or length > 0:
+                return io.BytesIO(self.read_range(folder_id, file_id, offset, length))
+
             request = self.service.files().get_media(fileId=file_id)
             file_content = io.BytesIO()
             downloader = MediaIoBaseDownload(file_content, request)
@@ -193,18 +216,29 @@ class GoogleDriveConnection:
 
             # Reset position to beginning
             file_content.seek(0)
-
-            # Handle offset and length if specified
-            if offset > 0 or length > 0:
-                file_content.seek(offset)
-                if length > 0:
-                    return io.BytesIO(file_content.read(length))
-
             return file_content
         except Exception as e:
             frappe.log_error(f"Google Drive download error: {str(e)}")
             raise
 
+    def read_range(self, folder_id, file_id, offset, length=0):
+        """
+        Read a byte range of a Google Drive file
+
+        Args:
+            folder_id (str): Not used for Google Drive (included for API compatibility)
+            file_id (str): Google Drive file ID
+            offset (int): Start byte position
+            length (int): Number of bytes to read (0 to read until the end)
+
+        Returns:
+            bytes: Range content
+        """
+        range_end = "" if length <= 0 else str(offset + length - 1)
+        request = self.service.files().get_media(fileId=file_id)
+        request.headers["Range"] = f"bytes={offset}-{range_end}"
+        return request.execute()
+
     def fget_object(self, folder_id, file_id, file_path):
         """
         Download file from Google Drive to a local path
@@ -218,12 +252,17 @@ class GoogleDriveConnection:
             bool: True if file was successfully downloaded
         """
         try:
-            request = self.service.files().get_media(fileId=file_id)
-            with open(file_path, "wb") as f:
-                downloader = MediaIoBaseDownload(f, request)
-                done = False
-                while not done:
-                    status, done = downloader.next_chunk()
+            from dfp_external_storage.parallel_download import download_ranges_to_file
+            from dfp_external_storage.storage_backends import STAT_NORMALIZERS
+
+            # Ranged, resumable and parallel for big files
+            size, etag = STAT_NORMALIZERS["Google Drive"](self.stat_object(folder_id, file_id))
+            download_ranges_to_file(
+                lambda offset, length: self.read_range(folder_id, file_id, offset, length),
+                size,
+                file_path,
+                etag,
+            )
             return True
         except Exception as e:
             frappe.log_error(f"Google Drive download to file error: {str(e)}")
@@ -337,6 +376,96 @@ class GoogleDriveConnection:
             frappe.log_error(f"Google Drive list error: {str(e)}")
             yield None
 
+    def _subfolder_id(self, folder_id, path):
+        "Id of a subfolder path (names separated by '/') or None if missing"
+        for name in [p for p in path.split("/") if p]:
+            name = name.replace("\\", "\\\\").replace("'", "\\'")
+            response = (
+                self.service.files()
+                .list(
+                    q=(
+                        f"'{folder_id}' in parents and name='{name}' and trashed=false"
+                        " and mimeType='application/vnd.google-apps.folder'"
+                    ),
+                    fields="files(id)",
+                    pageSize=1,
+                )
+                .execute()
+            )
+            files = response.get("files", [])
+            if not files:
+                return None
+            folder_id = files[0]["id"]
+        return folder_id
+
+    def list_objects_page(self, folder_id, prefix="", cursor=None, page_size=200):
+        """
+        One page of files within a Google Drive folder and its subfolders
+        (recursive, like S3 prefixes and Dropbox listings)
+
+        Folders are walked breadth first: the cursor keeps the folders still
+        to list (id and path) and the page token within the current one.
+
+        Args:
+            folder_id (str): Google Drive folder ID
+            prefix (str): Subfolder path of folder_id to list
+            cursor (str): Cursor returned by previous page
+            page_size (int): Max entries per page
+
+        Returns:
+            tuple: (list of file metadata dicts, object_name being the path
+                relative to the listed folder, next cursor or None)
+        """
+        if cursor:
+            state = json.loads(cursor)
+        else:
+            if prefix:
+                subfolder_id = self._subfolder_id(folder_id, prefix)
+                # Missing folder raises: an empty answer would read as "no files"
+                if not subfolder_id:
+                    frappe.throw(
+                        _("Folder {0} not found in Google Drive").format(prefix),
+                        frappe.DoesNotExistError,
+                    )
+                folder_id = subfolder_id
+            state = {"folders": [[folder_id, ""]], "token": None}
+
+        current_id, path = state["folders"][0]
+        response = (
+            self.service.files()
+            .list(
+                q=f"'{current_id}' in parents and trashed=false",
+                spaces="drive",
+                fields="nextPageToken, files(id, name, mimeType, size, modifiedTime, md5Checksum)",
+                orderBy="name",
+                pageSize=page_size,
+                pageToken=state["token"],
+            )
+            .execute()
+        )
+        items = []
+        for file in response.get("files", []):
+            if file.get("mimeType") == "application/vnd.google-apps.folder":
+                state["folders"].append([file.get("id"), f"{path}{file.get('name')}/"])
+                continue
+            items.append(
+                {
+                    "key": file.get("id"),
+                    "object_name": f"{path}{file.get('name')}",
+                    "size": int(file.get("size") or 0),
+                    "etag": file.get("md5Checksum", ""),
+                    "last_modified": file.get("modifiedTime"),
+                    "is_dir": False,
+                    "storage_class": "GOOGLE_DRIVE",
+                    "metadata": {"id": file.get("id"), "mime_type": file.get("mimeType")},
+                }
+            )
+
+        state["token"] = response.get("nextPageToken")
+        if not state["token"]:
+            state["folders"].pop(0)
+        return items, json.dumps(state) if state["folders"] else None
+
     def presigned_get_object(self, folder_id, file_id, expires=timedelta(hours=3)):
         """
         Create a temporary shareable link for a Google Drive file
@@ -19,9 +19,16 @@ override_doctype_class = {
 }
 
 page_renderer = [
+    # Before main renderer: only takes requests answered without a full body
+    "dfp_external_storage.file_renderer.DFPExternalStorageFileFastPathRenderer",
     "dfp_external_storage.dfp_external_storage.doctype.dfp_external_storage.dfp_external_storage.DFPExternalStorageFileRenderer",
 ]
 
+after_request = ["dfp_external_storage.file_renderer.hook_after_request"]
+
+# Direct upload min size for the desk file uploader
+extend_bootinfo = "dfp_external_storage.direct_upload.extend_bootinfo"
+
 # Installation hooks
 after_install = "dfp_external_storage.install_hooks.after_install"
 after_sync = "dfp_external_storage.install_hooks.after_sync"
@@ -34,9 +41,42 @@ doc_events = {
     "File": {
         # TODO: Remove below line after 2025.01.01
         # "on_update": "dfp_external_storage.dfp_external_storage.doctype.dfp_external_storage.dfp_external_storage.hook_file_on_update",
-        "before_save": "dfp_external_storage.dfp_external_storage.doctype.dfp_external_storage.dfp_external_storage.hook_file_before_save",
-        "after_delete": "dfp_external_storage.dfp_external_storage.doctype.dfp_external_storage.dfp_external_storage.hook_file_after_delete",
-    }
+        "before_save": [
+            "dfp_external_storage.dfp_external_storage.doctype.dfp_external_storage.dfp_external_storage.hook_file_before_save",
+            # After main hook so remote key is already the final one
+            "dfp_external_storage.dfp_external_storage.doctype.dfp_external_storage_key_ref.dfp_external_storage_key_ref.hook_file_before_save",
+            "dfp_external_storage.content_hash_cache.hook_file_before_save",
+        ],
+        "after_delete": [
+            "dfp_external_storage.dfp_external_storage.doctype.dfp_external_storage.dfp_external_storage.hook_file_after_delete",
+            # After main hook so "is key shared" checks still count deleted File
+            "dfp_external_storage.dfp_external_storage.doctype.dfp_external_storage_key_ref.dfp_external_storage_key_ref.hook_file_after_delete",
+            "dfp_external_storage.content_hash_cache.hook_file_after_delete",
+            "dfp_external_storage.folder_storage_map.hook_file_folder_changed",
+            "dfp_external_storage.presigned_url_cache.hook_file_after_delete",
+        ],
+        "on_update": [
+            "dfp_external_storage.folder_storage_map.hook_file_folder_changed",
+            "dfp_external_storage.presigned_url_cache.hook_file_on_update",
+        ],
+        "after_rename": "dfp_external_storage.folder_storage_map.hook_file_folder_changed",
+    },
+    "DFP External Storage": {
+        "on_update": [
+            "dfp_external_storage.folder_storage_map.hook_storage_changed",
+            "dfp_external_storage.storage_settings.hook_storage_changed",
+        ],
+        "on_trash": [
+            "dfp_external_storage.folder_storage_map.hook_storage_changed",
+            "dfp_external_storage.storage_settings.hook_storage_changed",
+        ],
+    },
+}
+
+scheduler_events = {
+    "daily_long": [
+        "dfp_external_storage.dfp_external_storage.doctype.dfp_remote_object.dfp_remote_object.sync_all_storages",
+    ],
 }
 
 # Translation
@@ -13,6 +13,17 @@ from frappe.utils import now_datetime
 
 def after_install():
     """Run after app is installed"""
+    # Patches are not executed on install, run the ones preparing data here
+    from dfp_external_storage.patches.v1_2 import (
+        add_file_external_storage_indexes,
+        add_s3_transfer_fields,
+        backfill_external_storage_key_refs,
+    )
+
+    add_file_external_storage_indexes.execute()
+    backfill_external_storage_key_refs.execute()
+    add_s3_transfer_fields.execute()
+
     # Check if this is a reinstallation
     check_reconnect_needed()
 
@@ -16,8 +16,9 @@ import requests
 import time
 from frappe import _
 from frappe.utils import get_request_site_address, get_url
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from functools import wraps
+from urllib.parse import quote
 import msal
 
 # OneDrive API scopes
@@ -28,6 +29,8 @@ DFP_ONEDRIVE_TOKEN_CACHE_PREFIX = "dfp_onedrive_token:"
 
 # Microsoft Graph API endpoint
 GRAPH_API_ENDPOINT = "https://graph.microsoft.com/v1.0"
+# Microsoft Graph JSON batching limit
+GRAPH_BATCH_MAX_REQUESTS = 20
 
 
 def retry_on_token_refresh(max_retries=2):
@@ -273,8 +276,8 @@ class OneDriveConnection:
         Args:
             folder_id (str): Not used for OneDrive (included for API compatibility)
             file_id (str): OneDrive file ID
-            offset (int): Start byte position (not directly supported by OneDrive)
-            length (int): Number of bytes to read (not directly supported by OneDrive)
+            offset (int): Start byte position
+            length (int): Number of bytes to read
 
         Returns:
             BytesIO: File content as a file-like object
@@ -307,6 +310,28 @@ class OneDriveConnection:
             frappe.log_error(f"OneDrive download error: {str(e)}")
             raise
 
+    @retry_on_token_refresh()
+    def read_range(self, folder_id, file_id, offset, length=0):
+        """
+        Read a byte range of a OneDrive file
+
+        Args:
+            folder_id (str): Not used for OneDrive (included for API compatibility)
+            file_id (str): OneDrive file ID
+            offset (int): Start byte position
+            length (int): Number of bytes to read (0 to read until the end)
+
+        Returns:
+            bytes: Range content
+        """
+        range_end = "" if length <= 0 else str(offset + length - 1)
+        response = self._make_request(
+            method="GET",
+            endpoint=f"/drive/items/{file_id}/content",
+            headers={"Range": f"bytes={offset}-{range_end}"},
+        )
+        return response.content
+
     @retry_on_token_refresh()
     def fget_object(self, folder_id, file_id, file_path):
         """
@@ -321,14 +346,17 @@ class OneDriveConnection:
             bool: True if file was successfully downloaded
         """
         try:
-            response = self._make_request(
-                method="GET", endpoint=f"/drive/items/{file_id}/content", stream=True
+            from dfp_external_storage.parallel_download import download_ranges_to_file
+            from dfp_external_storage.storage_backends import STAT_NORMALIZERS
+
+            # Ranged, resumable and parallel for big files
+            size, etag = STAT_NORMALIZERS["OneDrive"](self.stat_object(folder_id, file_id))
+            download_ranges_to_file(
+                lambda offset, length: self.read_range(folder_id, file_id, offset, length),
+                size,
+                file_path,
+                etag,
             )
-
-            with open(file_path, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
             return True
         except Exception as e:
             frappe.log_error(f"OneDrive download to file error: {str(e)}")
@@ -360,6 +388,45 @@ class OneDriveConnection:
             frappe.log_error(f"OneDrive upload error: {str(e)}")
             raise
 
+    @retry_on_token_refresh()
+    def stat_path(self, folder_id, path):
+        """
+        Get metadata of the item at a path within a folder
+
+        Args:
+            folder_id (str): OneDrive folder ID
+            path (str): Item path relative to the folder
+
+        Returns:
+            dict: Item metadata
+        """
+        response = self._make_request(
+            method="GET", endpoint=f"/drive/items/{folder_id}:/{quote(path)}"
+        )
+        return response.json()
+
+    @retry_on_token_refresh()
+    def create_upload_session(self, folder_id, file_name):
+        """
+        Pre-authenticated upload url the browser can PUT file chunks to. The
+        upload fails if an item with that name already exists.
+
+        Returns:
+            str: Upload session url
+        """
+        response = self._make_request(
+            method="POST",
+            endpoint=f"/drive/items/{folder_id}:/{quote(file_name)}:/createUploadSession",
+            data={"item": {"@microsoft.graph.conflictBehavior": "fail"}},
+        )
+        return response.json()["uploadUrl"]
+
+    def cancel_upload_session(self, upload_url):
+        try:
+            requests.delete(upload_url)
+        except requests.RequestException as e:
+            frappe.log_error(f"OneDrive cancel upload session error: {str(e)}")
+
     def _simple_upload(self, folder_id, file_name, data):
         """Simple upload for small files (<4MB)"""
         # Create upload URL
@@ -496,6 +563,94 @@ class OneDriveConnection:
             frappe.log_error(f"OneDrive list error: {str(e)}")
             yield None
 
+    @retry_on_token_refresh()
+    def list_objects_page(self, folder_id, prefix="", cursor=None, page_size=200):
+        """
+        One page of files within a OneDrive folder and its subfolders
+        (recursive, like S3 prefixes and Dropbox listings)
+
+        Folders are walked breadth first: the cursor keeps the folders still
+        to list (id and path) and the next page link within the current one.
+
+        Args:
+            folder_id (str): OneDrive folder ID
+            prefix (str): Subfolder path of folder_id to list
+            cursor (str): Cursor returned by previous page
+            page_size (int): Max entries per page
+
+        Returns:
+            tuple: (list of file metadata dicts, object_name being the path
+                relative to the listed folder, next cursor or None)
+        """
+        if cursor:
+            state = json.loads(cursor)
+        else:
+            prefix = prefix.strip("/")
+            if prefix:
+                # Missing folder raises (404): an empty answer would read as "no files"
+                folder_id = self._make_request(
+                    method="GET",
+                    endpoint=f"/drive/items/{folder_id}:/{quote(prefix)}:",
+                    params={"select": "id"},
+                ).json()["id"]
+            state = {"folders": [[folder_id, ""]], "token": None}
+
+        current_id, path = state["folders"][0]
+        if state["token"]:
+            endpoint, params = state["token"], None
+        else:
+            endpoint = f"/drive/items/{current_id}/children"
+            params = {"$top": page_size, "$orderby": "name"}
+        data = self._make_request(method="GET", endpoint=endpoint, params=params).json()
+
+        items = []
+        for item in data.get("value", []):
+            if item.get("folder") is not None:
+                state["folders"].append([item.get("id"), f"{path}{item.get('name')}/"])
+                continue
+            items.append(
+                {
+                    "key": item.get("id"),
+                    "object_name": f"{path}{item.get('name')}",
+                    "size": item.get("size", 0),
+                    "etag": item.get("eTag", ""),
+                    "last_modified": item.get("lastModifiedDateTime"),
+                    "is_dir": False,
+                    "storage_class": "ONEDRIVE",
+                    "metadata": {
+                        "id": item.get("id"),
+                        "mime_type": item.get("file", {}).get("mimeType"),
+                    },
+                }
+            )
+
+        next_link = data.get("@odata.nextLink")
+        state["token"] = next_link.replace(GRAPH_API_ENDPOINT, "") if next_link else None
+        if not state["token"]:
+            state["folders"].pop(0)
+        return items, json.dumps(state) if state["folders"] else None
+
+    @retry_on_token_refresh()
+    def direct_download_url(self, folder_id, file_id, expires=None):
+        """
+        Short lived, pre-authenticated url serving file content
+
+        Args:
+            folder_id (str): Not used for OneDrive (included for API compatibility)
+            file_id (str): OneDrive file ID
+            expires (timedelta): Not used, Microsoft Graph download urls are
+                valid for about an hour
+
+        Returns:
+            str: Download url
+        """
+        response = self._make_request(
+            method="GET",
+            endpoint=f"/drive/items/{file_id}",
+            params={"select": "id,@microsoft.graph.downloadUrl"},
+        )
+        return response.json().get("@microsoft.graph.downloadUrl")
+
     @retry_on_token_refresh()
     def presigned_get_object(self, folder_id, file_id, expires=timedelta(hours=3)):
         """
@@ -511,7 +666,7 @@ class OneDriveConnection:
         """
         try:
             # Create a sharing link
-            expiration_datetime = datetime.now() + expires
+            expiration_datetime = datetime.now(timezone.utc) + expires
             response = self._make_request(
                 method="POST",
                 endpoint=f"/drive/items/{file_id}/createLink",
@@ -528,6 +683,51 @@ class OneDriveConnection:
             frappe.log_error(f"OneDrive presigned URL error: {str(e)}")
             return None
 
+    @retry_on_token_refresh()
+    def presigned_get_objects(self, folder_id, file_ids, expires=timedelta(hours=3)):
+        """
+        Create sharing links for many OneDrive files with JSON batching
+
+        Args:
+            folder_id (str): Not used for OneDrive (included for API compatibility)
+            file_ids (list): OneDrive file IDs
+            expires (timedelta): How long the links should be valid
+
+        Returns:
+            dict: {file_id: link or None}
+        """
+        expiration_datetime = (datetime.now(timezone.utc) + expires).isoformat()
+        links = {}
+        for start in range(0, len(file_ids), GRAPH_BATCH_MAX_REQUESTS):
+            chunk = file_ids[start : start + GRAPH_BATCH_MAX_REQUESTS]
+            response = self._make_request(
+                method="POST",
+                endpoint="/$batch",
+                data={
+                    "requests": [
+                        {
+                            "id": str(i),
+                            "method": "POST",
+                            "url": f"/drive/items/{file_id}/createLink",
+                            "headers": {"Content-Type": "application/json"},
+                            "body": {
+                                "type": "view",
+                                "scope": "anonymous",
+                                "expirationDateTime": expiration_datetime,
+                            },
+                        }
+                        for i, file_id in enumerate(chunk)
+                    ]
+                },
+            )
+            for item in response.json().get("responses", []):
+                file_id = chunk[int(item["id"])]
+                if item.get("status") in (200, 201):
+                    links[file_id] = item.get("body", {}).get("link", {}).get("webUrl")
+                else:
+                    frappe.log_error(f"OneDrive presigned URL error: {item.get('body')}")
+                    links[file_id] = None
+        return links
 
 # Helper functions for OneDrive OAuth flow
 
@@ -0,0 +1,229 @@
+"""
+Parallel ranged downloads of remote objects to local files
+
+Downloading a big object as one stream is bound to the throughput of a single
+connection. Objects over a threshold are split in parts downloaded by several
+threads at once with ranged reads (`read_range`, available in every
+connector), each part written at its offset with `os.pwrite` into a file
+preallocated to the object size. A failed part is retried on its own.
+
+Interrupted downloads are resumed: parts already written are recorded in a
+sidecar file next to the partial one, together with the object size and
+etag, so a new attempt only fetches what is missing (see
+`download_ranges_to_file`).
+
+Site config (`site_config.json`):
+    dfp_external_storage_parallel_download_threshold: bytes (default 64MB)
+    dfp_external_storage_download_part_size: bytes (default 8MB)
+    dfp_external_storage_download_concurrency: parallel parts (default 8)
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import frappe
+from frappe.utils import cint
+
+from dfp_external_storage.storage_backends import get_connection, get_folder, remote_stat
+
+DEFAULT_PARALLEL_THRESHOLD = 64 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_CONCURRENCY = 8
+PART_RETRIES = 3
+# Seconds, doubled on every retry of a part
+RETRY_BACKOFF = 1
+PARTIAL_SUFFIX = ".part"
+
+
+def _conf(key, default):
+    return cint(frappe.conf.get(f"dfp_external_storage_{key}")) or default
+
+
+def _preallocate(fd, size):
+    if not size:
+        return
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        # Not available on this platform / filesystem: sparse file is fine
+        os.ftruncate(fd, size)
+
+
+class _Progress:
+    """
+    Sidecar JSON file (`<partial file>.json`) recording object size, etag,
+    part size and parts already written, rewritten atomically after each part
+    """
+
+    def __init__(self, path, size, etag, part_size):
+        self.path = path
+        self.state = {"size": size, "etag": etag, "part_size": part_size, "done": []}
+        self._done = set()
+        self._lock = threading.Lock()
+
+    def load(self):
+        "Parts done by a previous attempt, if it was for the same object version"
+        try:
+            with open(self.path) as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            return False
+        same_object = all(previous.get(k) == self.state[k] for k in ("size", "etag", "part_size"))
+        # Without etag a changed object can not be told apart: start over
+        if not same_object or not self.state["etag"]:
+            return False
+        self._done = set(previous.get("done") or [])
+        return True
+
+    def is_done(self, part):
+        return part in self._done
+
+    def mark_done(self, part):
+        with self._lock:
+            self._done.add(part)
+            self.state["done"] = sorted(self._done)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.state, f)
+            os.replace(tmp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _download_part(read_range, fd, offset, length, progress=None, part=None):
+    "Download and write one part, retrying it on errors and short reads"
+    for attempt in range(PART_RETRIES + 1):
+        try:
+            data = read_range(offset, length)
+            if len(data) != length:
+                raise OSError(f"Short read at {offset}: {len(data)} of {length} bytes")
+            os.pwrite(fd, data, offset)
+            break
+        except Exception:
+            if attempt == PART_RETRIES:
+                raise
+            time.sleep(RETRY_BACKOFF * 2**attempt)
+    if progress:
+        # Part must be on disk before it is recorded as done
+        os.fdatasync(fd)
+        progress.mark_done(part)
+    return length
+
+
+def download_ranges_to_file(
+    read_range, size, local_path, etag=None, part_size=None, concurrency=None
+):
+    """
+    Download `size` bytes read by ranges into a local file, resuming an
+    interrupted previous attempt
+
+    Data goes to `<local_path>.part` (renamed to `local_path` once complete)
+    with a sidecar recording the parts written. A new attempt for the same
+    object (same size and etag) only requests missing parts; a changed
+    object (or unknown etag) is downloaded from scratch, never spliced.
+
+    Args:
+        read_range (callable): (offset, length) -> bytes
+        size (int): Object size
+        local_path (str): Destination path (overwritten)
+        etag (str): Object version, to validate resumed downloads
+        part_size (int): Range size per request
+        concurrency (int): Parts downloaded at once (1 below the parallel
+            download threshold)
+
+    Returns:
+        int: Bytes written
+    """
+    part_size = part_size or _conf("download_part_size", DEFAULT_PART_SIZE)
+    concurrency = concurrency or _conf("download_concurrency", DEFAULT_CONCURRENCY)
+    if size < _conf("parallel_download_threshold", DEFAULT_PARALLEL_THRESHOLD):
+        concurrency = 1
+    partial_path = f"{local_path}{PARTIAL_SUFFIX}"
+    progress = _Progress(f"{partial_path}.json", size, etag, part_size)
+    resuming = progress.load() and os.path.exists(partial_path)
+    if not resuming:
+        progress.remove()
+    parts = [
+        (part, offset, min(part_size, size - offset))
+        for part, offset in enumerate(range(0, size, part_size))
+        if not (resuming and progress.is_done(part))
+    ]
+
+    fd = os.open(partial_path, os.O_WRONLY | os.O_CREAT | (0 if resuming else os.O_TRUNC), 0o644)
+    try:
+        if not resuming:
+            _preallocate(fd, size)
+        if concurrency == 1 or len(parts) <= 1:
+            for part, offset, length in parts:
+                _download_part(read_range, fd, offset, length, progress, part)
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                # Context copy keeps `frappe.local` available to connectors in threads
+                futures = [
+                    executor.submit(
+                        contextvars.copy_context().run,
+                        _download_part,
+                        read_range,
+                        fd,
+                        offset,
+                        length,
+                        progress,
+                        part,
+                    )
+                    for part, offset, length in parts
+                ]
+                for future in futures:
+                    future.result()
+        os.fsync(fd)
+    finally:
+        # Partial file and sidecar are kept on errors for the next attempt
+        os.close(fd)
+    os.replace(partial_path, local_path)
+    progress.remove()
+    return size
+
+
+def download_to_file(storage, key, local_path, connection=None):
+    """
+    Download a remote object of a storage to a local file, in parallel parts
+    when it is big
+
+    Returns:
+        int: Bytes written
+    """
+    connection = connection or get_connection(storage)
+    folder = get_folder(storage)
+    size, etag = remote_stat(storage, key, connection)
+
+    def read_range(offset, length):
+        return connection.read_range(folder, key, offset, length)
+
+    return download_ranges_to_file(read_range, size, local_path, etag)
+
+
+def download_to_site_files(file_doc, connection=None):
+    """
+    Download a remote File into the site files folder ("private/files" or
+    "public/files" as File `is_private`)
+
+    Returns:
+        str: Local `file_url` for the File
+    """
+    file_name = file_doc.file_name
+    files_path = frappe.get_site_path("private" if file_doc.is_private else "public", "files")
+    if os.path.exists(os.path.join(files_path, file_name)):
+        partial, extension = os.path.splitext(file_name)
+        file_name = f"{partial}{frappe.generate_hash(length=6)}{extension}"
+    download_to_file(
+        file_doc.dfp_external_storage,
+        file_doc.dfp_external_storage_s3_key,
+        os.path.join(files_path, file_name),
+        connection,
+    )
+    return f"{'/private' if file_doc.is_private else ''}/files/{file_name}"
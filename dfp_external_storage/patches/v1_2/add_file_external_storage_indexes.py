@@ -0,0 +1,30 @@
+import frappe
+
+# (index name, columns) for "File" custom fields filtered by this app
+FILE_INDEXES = (
+    (
+        "dfp_external_storage_s3_key_index",
+        ["dfp_external_storage", "dfp_external_storage_s3_key"],
+    ),
+    (
+        "content_hash_dfp_external_storage_index",
+        ["content_hash", "dfp_external_storage"],
+    ),
+    (
+        "dfp_external_storage_creation_index",
+        ["dfp_external_storage", "creation"],
+    ),
+)
+
+
+def add_file_indexes():
+    """Composite indexes used by delete, same hash and listing queries"""
+    if not frappe.db.has_column("File", "dfp_external_storage_s3_key"):
+        # Custom fields not synced yet
+        return
+    for index_name, columns in FILE_INDEXES:
+        frappe.db.add_index("File", columns, index_name)
+
+
+def execute():
+    add_file_indexes()
@@ -0,0 +1,46 @@
+import frappe
+from frappe.custom.doctype.custom_field.custom_field import create_custom_fields
+
+S3_TYPES_DEPENDS_ON = "eval:['AWS S3', 'S3 Compatible'].includes(doc.type)"
+
+# Per storage multipart transfer settings read by `storage_backends` (empty / 0
+# falls back to `dfp_external_storage_s3_<fieldname>` site config)
+S3_TRANSFER_FIELDS = {
+    "DFP External Storage": [
+        {
+            "fieldname": "s3_transfer_section",
+            "fieldtype": "Section Break",
+            "label": "S3 Transfers",
+            "insert_after": "secure",
+            "collapsible": 1,
+            "depends_on": S3_TYPES_DEPENDS_ON,
+        },
+        {
+            "fieldname": "multipart_threshold",
+            "fieldtype": "Int",
+            "label": "Multipart Threshold (bytes)",
+            "description": "Uploads and copies of this size or bigger use parallel parts (default 64MB)",
+            "insert_after": "s3_transfer_section",
+        },
+        {
+            "fieldname": "multipart_chunksize",
+            "fieldtype": "Int",
+            "label": "Part Size (bytes)",
+            "description": "Grown as needed to stay within 10000 parts (default 16MB)",
+            "insert_after": "multipart_threshold",
+        },
+        {
+            "fieldname": "max_concurrency",
+            "fieldtype": "Int",
+            "label": "Parallel Parts",
+            "description": "Parts transferred at once (default 8)",
+            "insert_after": "multipart_chunksize",
+        },
+    ]
+}
+
+
+def execute():
+    if not frappe.db.table_exists("DFP External Storage"):
+        return
+    create_custom_fields(S3_TRANSFER_FIELDS, update=True)
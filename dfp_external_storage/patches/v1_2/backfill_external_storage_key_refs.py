@@ -0,0 +1,30 @@
+import frappe
+
+from dfp_external_storage.dfp_external_storage.doctype.dfp_external_storage_key_ref.dfp_external_storage_key_ref import (
+    DOCTYPE,
+)
+
+
+def execute():
+    """Build "DFP External Storage Key Ref" rows from existent remote "File"s"""
+    frappe.reload_doc("dfp_external_storage", "doctype", "dfp_external_storage_key_ref")
+
+    frappe.db.delete(DOCTYPE)
+    # Row names must match `ref_name()`: sha1 of "<storage>\n<key>"
+    frappe.db.sql(
+        f"""
+        INSERT INTO `tab{DOCTYPE}`
+            (name, storage, s3_key, ref_count, creation, modified, owner, modified_by, docstatus, idx)
+        SELECT
+            SHA1(CONCAT(dfp_external_storage, CHAR(10 USING utf8mb4), dfp_external_storage_s3_key)),
+            dfp_external_storage,
+            dfp_external_storage_s3_key,
+            COUNT(*),
+            NOW(), NOW(), 'Administrator', 'Administrator', 0, 0
+        FROM `tabFile`
+        WHERE is_folder = 0
+            AND IFNULL(dfp_external_storage, '') != ''
+            AND IFNULL(dfp_external_storage_s3_key, '') != ''
+        GROUP BY dfp_external_storage, dfp_external_storage_s3_key
+        """
+    )
@@ -0,0 +1,145 @@
+"""
+Presigned url cache for DFP External Storage
+
+Minting a presigned url means an API call for Dropbox and OneDrive, and
+signing plus loading "File" and storage docs for S3. Listing pages ask for the
+same urls over and over, so minted urls are kept in Redis until shortly before
+they expire.
+
+One Redis hash per "File" holds its urls, keyed by storage, storage settings
+version and content disposition. Moving the file to another storage or
+changing storage settings gives new keys; deleting the file or changing its
+storage or remote key drops the whole hash.
+"""
+
+import mimetypes
+import pickle
+import time
+from datetime import timedelta
+
+import frappe
+
+from dfp_external_storage.storage_backends import get_presigned_urls as mint_presigned_urls
+from dfp_external_storage.storage_settings import get_storage_settings
+
+DFP_PRESIGNED_URL_CACHE_PREFIX = "dfp_external_storage_presigned_url:"
+# Connectors default validity when storage has no expiration setting
+DEFAULT_PRESIGNED_URL_EXPIRATION = 3 * 60 * 60
+# Cached urls are dropped this long before they expire, capped to a tenth of
+# validity for short lived urls
+SAFETY_MARGIN_SECS = 60
+
+
+def _cache_name(file_name):
+    return f"{DFP_PRESIGNED_URL_CACHE_PREFIX}{file_name}"
+
+
+def _cache_field(settings, disposition):
+    return f"{settings.name}\n{settings.version}\n{disposition}"
+
+
+def get_presigned_url(file_doc, disposition="inline"):
+    """
+    Presigned url of a File, reused while it stays valid
+
+    Args:
+        file_doc: File doc (or dict with name, file_name, dfp_external_storage
+            and dfp_external_storage_s3_key)
+        disposition (str): "inline" or "attachment"
+
+    Returns:
+        str: Url or None if file is not in an external storage or presigned
+            urls are not allowed for it
+    """
+    return get_presigned_urls([file_doc], disposition).get(file_doc.name)
+
+
+def _allowed_settings(file_doc):
+    "Storage settings if presigned urls are allowed for the File, else None"
+    if not file_doc.dfp_external_storage or not file_doc.dfp_external_storage_s3_key:
+        return None
+    settings = get_storage_settings(file_doc.dfp_external_storage)
+    mimetype = mimetypes.guess_type(file_doc.file_name or "")[0]
+    if not settings.enabled or not settings.presigned_url_allowed(mimetype):
+        return None
+    return settings
+
+
+def get_presigned_urls(file_docs, disposition="inline"):
+    """
+    Presigned urls of many Files
+
+    Cached urls are read with a single Redis round trip, missing ones are
+    minted per storage in bulk (see `storage_backends.get_presigned_urls`)
+    and cached with a single Redis round trip too.
+
+    Args:
+        file_docs (list): File docs or dicts (see `get_presigned_url`)
+        disposition (str): "inline" or "attachment"
+
+    Returns:
+        dict: {File name: url}, files without url are left out
+    """
+    eligible = []
+    for file_doc in file_docs:
+        settings = _allowed_settings(file_doc)
+        if settings:
+            eligible.append((file_doc, settings, _cache_field(settings, disposition)))
+    if not eligible:
+        return {}
+
+    cache = frappe.cache()
+    pipe = cache.pipeline()
+    for file_doc, _settings, field in eligible:
+        pipe.hget(cache.make_key(_cache_name(file_doc.name)), field)
+    cached_values = pipe.execute()
+
+    urls = {}
+    missing = {}
+    now = time.time()
+    for (file_doc, settings, field), value in zip(eligible, cached_values):
+        cached = pickle.loads(value) if value else None
+        if cached and cached[1] > now:
+            urls[file_doc.name] = cached[0]
+        else:
+            missing.setdefault(settings.name, (settings, []))[1].append((file_doc, field))
+
+    pipe = cache.pipeline()
+    for storage, (settings, docs) in missing.items():
+        expiration = settings.presigned_url_expiration or DEFAULT_PRESIGNED_URL_EXPIRATION
+        ttl = expiration - min(SAFETY_MARGIN_SECS, expiration // 10)
+        try:
+            minted = mint_presigned_urls(
+                storage, [d for d, _field in docs], timedelta(seconds=expiration), disposition
+            )
+        except Exception as e:
+            # One failing storage leaves its files out, not the whole batch
+            frappe.log_error(f"Presigned urls error for storage {storage}: {str(e)}")
+            continue
+        for file_doc, field in docs:
+            url = minted.get(file_doc.name)
+            if not url:
+                continue
+            urls[file_doc.name] = url
+            name = cache.make_key(_cache_name(file_doc.name))
+            pipe.hset(name, field, pickle.dumps((url, now + ttl)))
+            # Hash goes away with its last url even if the file is never purged
+            pipe.expire(name, ttl)
+    pipe.execute()
+    return urls
+
+
+def purge(file_name):
+    "Drop all cached urls of a File"
+    frappe.cache().delete_key(_cache_name(file_name))
+
+
+def hook_file_on_update(doc, method=None):
+    if doc.has_value_changed("dfp_external_storage") or doc.has_value_changed(
+        "dfp_external_storage_s3_key"
+    ):
+        purge(doc.name)
+
+
+def hook_file_after_delete(doc, method=None):
+    purge(doc.name)
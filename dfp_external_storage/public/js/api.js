@@ -1,8 +1,10 @@
 frappe.provide("dfp_external_storage.api");
 
-dfp_external_storage.api.get_media_library = function () {
+// filters: {storage, folder, mimetype, name, cursor, page_size}
+dfp_external_storage.api.get_media_library = function (filters) {
   return frappe.call({
     method: "dfp_external_storage.api.get_media_library",
+    args: filters || {},
   });
 };
 
@@ -15,21 +17,65 @@ dfp_external_storage.api.get_presigned_url = function (file_id) {
   });
 };
 
+dfp_external_storage.api.get_presigned_urls = function (file_ids) {
+  return frappe.call({
+    method: "dfp_external_storage.api.get_presigned_urls",
+    args: {
+      file_ids: file_ids,
+    },
+  });
+};
+
 dfp_external_storage.api.bulk_offload_files = function (
   storage_name,
   folder,
-  limit
+  limit,
+  workers
 ) {
   return frappe.call({
     method: "dfp_external_storage.api.bulk_offload_files",
     args: {
       storage_name: storage_name,
       folder: folder,
-      limit: limit || 100,
+      limit: limit,
+      workers: workers,
+    },
+  });
+};
+
+["get_bulk_offload_status", "cancel_bulk_offload", "resume_bulk_offload"].forEach(
+  (method) => {
+    dfp_external_storage.api[method] = function (job_id) {
+      return frappe.call({
+        method: `dfp_external_storage.api.${method}`,
+        args: { job_id: job_id },
+      });
+    };
+  }
+);
+
+dfp_external_storage.api.reconcile_storage = function (
+  storage_name,
+  delete_orphans,
+  orphan_min_age_hours
+) {
+  return frappe.call({
+    method: "dfp_external_storage.api.reconcile_storage",
+    args: {
+      storage_name: storage_name,
+      delete_orphans: delete_orphans ? 1 : 0,
+      orphan_min_age_hours: orphan_min_age_hours,
     },
   });
 };
 
+dfp_external_storage.api.relocate_files = function (file_ids, target_storage) {
+  return frappe.call({
+    method: "dfp_external_storage.api.relocate_files",
+    args: { file_ids: file_ids, target_storage: target_storage },
+  });
+};
+
 // dfp_external_storage.api.get_cdn_url = function (file_doc) {
 //   if (!file_doc.dfp_external_storage || !file_doc.dfp_external_storage_s3_key) {
 //     return null;
@@ -1,3 +1,4 @@
 import "./app";
 import "./api";
+import "./direct_upload";
 import "./file_uploader";
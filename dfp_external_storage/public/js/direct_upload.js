@@ -0,0 +1,152 @@
+frappe.provide("dfp_external_storage.direct_upload");
+
+// Parts uploaded at once
+dfp_external_storage.direct_upload.CONCURRENCY = 4;
+// Part urls requested per call
+dfp_external_storage.direct_upload.SIGN_BATCH = 50;
+dfp_external_storage.direct_upload.PART_RETRIES = 3;
+// Milliseconds, doubled on every retry of a part
+dfp_external_storage.direct_upload.RETRY_BACKOFF = 1000;
+
+dfp_external_storage.direct_upload.call = function (method, args) {
+  return frappe
+    .call({ method: `dfp_external_storage.api.${method}`, args: args })
+    .then((r) => r.message);
+};
+
+// Network errors and 5xx answers (e.g. 503 SlowDown) are retried with backoff
+dfp_external_storage.direct_upload.put_part = async function (url, blob, retries) {
+  const du = dfp_external_storage.direct_upload;
+  for (let attempt = 0; ; attempt++) {
+    let response = null;
+    try {
+      response = await fetch(url, { method: "PUT", body: blob });
+    } catch (error) {
+      if (attempt >= retries) throw error;
+    }
+    // Bucket CORS rule must expose ETag
+    if (response && response.ok) return response.headers.get("ETag");
+    if (response && (response.status < 500 || attempt >= retries)) {
+      throw new Error(`Part upload failed: ${response.status}`);
+    }
+    await new Promise((resolve) => setTimeout(resolve, du.RETRY_BACKOFF * 2 ** attempt));
+  }
+};
+
+// S3: parts PUT in parallel to presigned urls, etags kept for completion
+dfp_external_storage.direct_upload.upload_s3_parts = async function (
+  file,
+  start,
+  on_progress
+) {
+  const du = dfp_external_storage.direct_upload;
+  const etags = [];
+  const in_flight = new Set();
+  let urls = {};
+  let loaded = 0;
+  for (let part = 1; part <= start.parts; part++) {
+    if (!urls[part]) {
+      const numbers = [];
+      for (let n = part; n < part + du.SIGN_BATCH && n <= start.parts; n++) numbers.push(n);
+      urls = await du.call("sign_direct_upload_parts", {
+        upload_token: start.upload_token,
+        part_numbers: numbers,
+      });
+    }
+    const blob = file.slice((part - 1) * start.part_size, part * start.part_size);
+    const upload = du.put_part(urls[part], blob, du.PART_RETRIES).then((etag) => {
+      etags.push({ part_number: part, etag: etag });
+      loaded += blob.size;
+      on_progress(loaded, file.size);
+      in_flight.delete(upload);
+    });
+    in_flight.add(upload);
+    if (in_flight.size >= du.CONCURRENCY) await Promise.race(in_flight);
+  }
+  await Promise.all(in_flight);
+  return { parts: etags };
+};
+
+// OneDrive: chunks PUT in order to the upload session
+dfp_external_storage.direct_upload.upload_onedrive_chunks = async function (
+  file,
+  start,
+  on_progress
+) {
+  for (let offset = 0; offset < file.size; offset += start.part_size) {
+    const blob = file.slice(offset, offset + start.part_size);
+    const response = await fetch(start.upload_url, {
+      method: "PUT",
+      headers: {
+        "Content-Range": `bytes ${offset}-${offset + blob.size - 1}/${file.size}`,
+      },
+      body: blob,
+    });
+    if (!response.ok) throw new Error(`Chunk upload failed: ${response.status}`);
+    on_progress(offset + blob.size, file.size);
+  }
+  return {};
+};
+
+// Dropbox: whole file POSTed to the temporary upload link
+dfp_external_storage.direct_upload.upload_dropbox_link = async function (
+  file,
+  start,
+  on_progress
+) {
+  const response = await fetch(start.upload_url, {
+    method: "POST",
+    headers: { "Content-Type": "application/octet-stream" },
+    body: file,
+  });
+  if (!response.ok) throw new Error(`Upload failed: ${response.status}`);
+  on_progress(file.size, file.size);
+  return {};
+};
+
+/**
+ * Upload a browser File straight to the storage of its folder
+ *
+ * S3 parts are uploaded in parallel (`CONCURRENCY` at a time), OneDrive
+ * chunks in order and Dropbox files in a single request. A failed transfer
+ * aborts the provider upload and rejects, callers fall back to the regular
+ * upload.
+ *
+ * @param {File} file
+ * @param {Object} options folder, is_private, doctype, docname, fieldname,
+ *   on_progress(loaded, total)
+ * @returns {Promise<Object|null>} Created File, or null when the folder
+ *   storage does not take direct uploads (use the regular upload)
+ */
+dfp_external_storage.direct_upload.upload = async function (file, options = {}) {
+  const du = dfp_external_storage.direct_upload;
+  const start = await du.call("start_direct_upload", {
+    file_name: file.name,
+    size: file.size,
+    content_type: file.type,
+    folder: options.folder,
+    is_private: options.is_private ? 1 : 0,
+    doctype: options.doctype,
+    docname: options.docname,
+    fieldname: options.fieldname,
+  });
+  if (!start.direct) return null;
+
+  const uploaders = {
+    s3_multipart: du.upload_s3_parts,
+    onedrive_session: du.upload_onedrive_chunks,
+    dropbox_link: du.upload_dropbox_link,
+  };
+  let result;
+  try {
+    result = await uploaders[start.method](file, start, options.on_progress || (() => {}));
+  } catch (error) {
+    du.call("abort_direct_upload", { upload_token: start.upload_token });
+    throw error;
+  }
+
+  return du.call(
+    "complete_direct_upload",
+    Object.assign({ upload_token: start.upload_token }, result)
+  );
+};
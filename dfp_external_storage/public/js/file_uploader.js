@@ -47,117 +47,226 @@ dfp_external_storage.uploader.setup = function () {
   }
 };
 
+// Local files go straight to the folder storage when it takes direct uploads
+// (see `direct_upload.js`), others through the regular upload
+dfp_external_storage.uploader.setup_direct_upload = function () {
+  const BaseFileUploader = frappe.ui.FileUploader;
+  if (!BaseFileUploader || BaseFileUploader.dfp_direct_upload) return;
+
+  frappe.ui.FileUploader = class FileUploader extends BaseFileUploader {
+    static dfp_direct_upload = true;
+
+    constructor(options = {}) {
+      super(options);
+      this.dfp_options = options;
+    }
+
+    upload_files(...args) {
+      // No server round trip for files direct uploads never take
+      const min_size = frappe.boot.dfp_external_storage_direct_upload_min_size;
+      const files = (this.uploader && this.uploader.files) || [];
+      const local = files.filter(
+        (f) =>
+          min_size &&
+          f.file_obj &&
+          !f.request_succeeded &&
+          f.file_obj.size >= min_size
+      );
+      if (!local.length) return super.upload_files(...args);
+
+      const options = this.dfp_options;
+      return Promise.all(
+        local.map((f) => {
+          f.uploading = true;
+          return dfp_external_storage.direct_upload
+            .upload(f.file_obj, {
+              folder: options.folder,
+              is_private: f.private,
+              doctype: options.doctype,
+              docname: options.docname,
+              fieldname: options.fieldname,
+              on_progress: (loaded, total) => {
+                f.progress = loaded;
+                f.total = total;
+              },
+            })
+            .then((file_doc) => ({ f, file_doc }))
+            .catch((error) => {
+              // e.g. bucket without CORS rule: regular upload takes the file
+              console.warn("Direct upload failed, using regular upload", error);
+              return { f, file_doc: null };
+            });
+        })
+      ).then((results) => {
+        for (const { f, file_doc } of results) {
+          f.uploading = false;
+          if (!file_doc) {
+            // Failed, or not taken by the folder storage: regular upload
+            f.progress = 0;
+            continue;
+          }
+          f.request_succeeded = true;
+          // Done ones leave the list, the rest use the regular upload
+          files.splice(files.indexOf(f), 1);
+          options.on_success && options.on_success(file_doc);
+        }
+        if (results.some((r) => !r.file_doc)) {
+          return super.upload_files(...args);
+        }
+        this.dialog && this.dialog.hide();
+      });
+    }
+  };
+};
+
 // Show S3 file browser dialog
 dfp_external_storage.uploader.show_s3_browser = function (link_dialog) {
-  frappe.call({
-    method: "dfp_external_storage.api.get_media_library",
-    callback: function (r) {
-      if (!r.message) return;
-      let files = r.message;
-      let d = new frappe.ui.Dialog({
-        title: __("Select S3 File"),
+  // Files are loaded page by page (keyset cursor) while scrolling
+  let files = [];
+  let next_cursor = null;
+  let loading = false;
+
+  const load_page = (reset) => {
+    if (loading || (!reset && !next_cursor)) return;
+    loading = true;
+    frappe.call({
+      method: "dfp_external_storage.api.get_media_library",
+      args: {
+        storage: d.get_value("storage_filter"),
+        name: d.get_value("name_filter"),
+        cursor: reset ? null : next_cursor,
+      },
+      callback: function (r) {
+        loading = false;
+        if (!r.message) return;
+        if (reset) files = [];
+        files = files.concat(r.message.files);
+        next_cursor = r.message.next_cursor;
+        if (reset && r.message.total !== null) {
+          let total = r.message.total_is_estimate
+            ? `${r.message.total}+`
+            : r.message.total;
+          d.set_title(__("Select S3 File") + ` (${total})`);
+        }
+        let grid = d.fields_dict.file_list.grid;
+        grid.df.data = files;
+        grid.data = files;
+        grid.refresh();
+      },
+      error: function () {
+        loading = false;
+      },
+    });
+  };
+
+  let d = new frappe.ui.Dialog({
+    title: __("Select S3 File"),
+    fields: [
+      {
+        label: __("Storage"),
+        fieldname: "storage_filter",
+        fieldtype: "Link",
+        options: "DFP External Storage",
+        change: () => load_page(true),
+      },
+      {
+        label: __("File Name"),
+        fieldname: "name_filter",
+        fieldtype: "Data",
+        change: () => load_page(true),
+      },
+      {
+        label: __("Files"),
+        fieldname: "file_list",
+        fieldtype: "Table",
+        connot_add_rows: true,
+        data: files,
         fields: [
           {
-            label: __("Storage"),
-            fieldname: "storage_filter",
-            fieldtype: "Link",
-            options: "DFP External Storage",
-            change: () => {
-              let storage = d.get_value("storage_filter");
-              let filtered_files = storage
-                ? files.filter((f) => f.dfp_external_storage === storage)
-                : files;
-
-              d.fields_dict.file_list.grid.refresh();
-              d.fields_dict.file_list.grid.data = filtered_files;
-              d.fields_dict.file_list.grid.render_rows();
-            },
+            label: __("File"),
+            fieldsname: "file_name",
+            fieldtype: "Data",
+            in_list_view: 1,
+            read_only: 1,
           },
           {
-            label: __("Files"),
-            fieldname: "file_list",
-            fieldtype: "Table",
-            connot_add_rows: true,
-            data: files,
-            fields: [
-              {
-                label: __("File"),
-                fieldsname: "file_name",
-                fieldtype: "Data",
-                in_list_view: 1,
-                read_only: 1,
-              },
-              {
-                label: __("Private"),
-                fieldname: "is_private",
-                fieldtype: "Check",
-                in_list_view: 1,
-                read_only: 1,
-              },
-              {
-                label: __("Get URL"),
-                fieldname: "get_url",
-                fieldtype: "Button",
-                in_list_view: 1,
-                click: (evt, doc) => {
-                  if (doc.is_private) {
-                    // For private files, get a secure presigned URL
-                    frappe.call({
-                      method: "dfp_external_storage.api.get_presigned_url",
-                      args: {
-                        file_id: doc.name,
-                      },
-                      callback: function (r) {
-                        if (r.message && r.message.success) {
-                          if (link_dialog) {
-                            link_dialog.set_value(
-                              "url",
-                              r.message.presigned_url
-                            );
-                            d.hide();
-
-                            // Show expiration warning
-                            let mins = Math.floor(
-                              r.message.expiration_seconds / 60
-                            );
-                            frappe.show_alert(
-                              {
-                                message: __(
-                                  `Note: This secure link will expire in ${mins} minutes`
-                                ),
-                                indicator: "orange",
-                              },
-                              7
-                            );
-                          }
-                        } else {
-                          frappe.msgprint(__("Could not generate secure URL"));
-                        }
-                      },
-                    });
-                  } else {
-                    // For public files, use the file URL directly
-                    if (link_dialog) {
-                      link_dialog.set_value("url", doc.file_url);
-                      d.hide();
+            label: __("Private"),
+            fieldname: "is_private",
+            fieldtype: "Check",
+            in_list_view: 1,
+            read_only: 1,
+          },
+          {
+            label: __("Get URL"),
+            fieldname: "get_url",
+            fieldtype: "Button",
+            in_list_view: 1,
+            click: (evt, doc) => {
+              if (doc.is_private) {
+                // For private files, get a secure presigned URL
+                frappe.call({
+                  method: "dfp_external_storage.api.get_presigned_url",
+                  args: {
+                    file_id: doc.name,
+                  },
+                  callback: function (r) {
+                    if (r.message && r.message.success) {
+                      if (link_dialog) {
+                        link_dialog.set_value(
+                          "url",
+                          r.message.presigned_url
+                        );
+                        d.hide();
+
+                        // Show expiration warning
+                        let mins = Math.floor(
+                          r.message.expiration_seconds / 60
+                        );
+                        frappe.show_alert(
+                          {
+                            message: __(
+                              `Note: This secure link will expire in ${mins} minutes`
+                            ),
+                            indicator: "orange",
+                          },
+                          7
+                        );
+                      }
+                    } else {
+                      frappe.msgprint(__("Could not generate secure URL"));
                     }
-                  }
-                },
-              },
-            ],
+                  },
+                });
+              } else {
+                // For public files, use the file URL directly
+                if (link_dialog) {
+                  link_dialog.set_value("url", doc.file_url);
+                  d.hide();
+                }
+              }
+            },
           },
         ],
-        primary_action_label: __("Cancel"),
-        primary_action: () => {
-          d.hide();
-        },
-      });
-      d.show();
+      },
+    ],
+    primary_action_label: __("Cancel"),
+    primary_action: () => {
+      d.hide();
     },
   });
+  d.show();
+
+  // Next page when scrolled near the bottom
+  d.$wrapper.on("scroll", function () {
+    if (this.scrollTop + this.clientHeight >= this.scrollHeight - 200) {
+      load_page(false);
+    }
+  });
+  load_page(true);
 };
 
 // Initialize the enhancements
 $(document).ready(function () {
   dfp_external_storage.uploader.setup();
+  dfp_external_storage.uploader.setup_direct_upload();
 });
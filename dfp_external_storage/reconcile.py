@@ -0,0 +1,257 @@
+"""
+Reconciliation of remote objects against "File"s of a DFP External Storage
+
+Finds:
+- orphans: remote objects no "File" points to (wasted storage),
+- dangling references: remote keys used by "File"s but missing remotely
+  (broken downloads).
+
+Both sides are streamed in the same order and merge joined, so memory use is
+constant whatever the number of objects:
+- remote side: "DFP Remote Object" index (refreshed by a sync walk of the
+  provider first),
+- local side: "DFP External Storage Key Ref", one row per remote key used by
+  "File"s.
+
+Both tables are keyed by `sha1(storage + key)`, so walking them by primary key
+gives the same order in MariaDB and Python regardless of collations, and
+provider listing order (only S3 lists sorted by key) does not matter.
+
+Findings are written to a CSV report in
+`private/files/dfp_external_storage_reports`. Optional cleanup removes
+orphans older than a grace period (to not race in flight uploads), each one
+double checked against `tabFile` first. It is only available for storages
+listed by site prefixes (S3): Dropbox, Google Drive and OneDrive folders may
+be shared by several sites, whose files would look like orphans here.
+"""
+
+import csv
+import os
+
+import frappe
+from frappe import _
+from frappe.utils import add_to_date, cint, get_datetime, now_datetime
+
+from dfp_external_storage.dfp_external_storage.doctype.dfp_external_storage_key_ref.dfp_external_storage_key_ref import (
+    DOCTYPE as KEY_REF_DOCTYPE,
+)
+from dfp_external_storage.dfp_external_storage.doctype.dfp_remote_object.dfp_remote_object import (
+    DOCTYPE as REMOTE_OBJECT_DOCTYPE,
+)
+from dfp_external_storage.dfp_external_storage.doctype.dfp_remote_object.dfp_remote_object import (
+    sync_storage,
+)
+from dfp_external_storage.storage_backends import (
+    default_list_prefixes,
+    get_connection,
+    get_folder,
+)
+
+DFP_RECONCILE_EVENT = "dfp_external_storage_reconcile"
+REPORTS_DIR = "dfp_external_storage_reports"
+STREAM_BATCH_SIZE = 5000
+# Orphans younger than this may belong to uploads not saved yet
+DEFAULT_ORPHAN_MIN_AGE_HOURS = 24
+# "File" names listed per dangling key in report
+MAX_FILES_PER_KEY = 10
+RECONCILE_JOB_TIMEOUT = 12 * 60 * 60
+
+
+def _stream(doctype, storage, fields):
+    "Rows of a storage ordered by name, fetched in keyset batches"
+    table = frappe.qb.DocType(doctype)
+    last_name = ""
+    while True:
+        rows = (
+            frappe.qb.from_(table)
+            .select(table.name, *[table[f] for f in fields])
+            .where((table.storage == storage) & (table.name > last_name))
+            .orderby(table.name)
+            .limit(STREAM_BATCH_SIZE)
+            .run(as_dict=True)
+        )
+        yield from rows
+        if len(rows) < STREAM_BATCH_SIZE:
+            return
+        last_name = rows[-1].name
+
+
+def merge_join(remote_rows, local_rows):
+    """
+    Merge join two streams sorted by `name`
+
+    Yields:
+        tuple: (remote row or None, local row or None); a missing side is an
+            orphan (no local) or a dangling reference (no remote)
+    """
+    remote = next(remote_rows, None)
+    local = next(local_rows, None)
+    while remote or local:
+        if local is None or (remote and remote.name < local.name):
+            yield remote, None
+            remote = next(remote_rows, None)
+        elif remote is None or local.name < remote.name:
+            yield None, local
+            local = next(local_rows, None)
+        else:
+            yield remote, local
+            remote = next(remote_rows, None)
+            local = next(local_rows, None)
+
+
+def _in_listed_prefixes(storage, key):
+    "Keys outside synced prefixes can not be told missing"
+    prefixes = tuple(p for p in default_list_prefixes(storage) if p)
+    return not prefixes or key.startswith(prefixes)
+
+
+def can_delete_orphans(storage):
+    "Listing is scoped to this site prefixes, so orphans are really this site's"
+    prefixes = default_list_prefixes(storage)
+    return bool(prefixes) and all(prefixes)
+
+
+def _check_delete_orphans(storage):
+    if not can_delete_orphans(storage):
+        frappe.throw(
+            _(
+                "Orphans can not be removed from storage {0}: its folder is not scoped by site"
+            ).format(storage)
+        )
+
+
+def _report_path(storage):
+    reports_dir = frappe.get_site_path("private", "files", REPORTS_DIR)
+    os.makedirs(reports_dir, exist_ok=True)
+    timestamp = now_datetime().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(reports_dir, f"reconcile_{frappe.scrub(storage)}_{timestamp}.csv")
+
+
+def _file_names(storage, key):
+    return frappe.get_all(
+        "File",
+        filters={"dfp_external_storage": storage, "dfp_external_storage_s3_key": key},
+        pluck="name",
+        limit=MAX_FILES_PER_KEY,
+    )
+
+
+def _remove_orphan(storage, remote, connection, folder):
+    "Delete an orphan remote object, unless a File got it meanwhile"
+    if frappe.db.exists(
+        "File", {"dfp_external_storage": storage, "dfp_external_storage_s3_key": remote.object_key}
+    ):
+        return False
+    if not connection.remove_object(folder, remote.object_key):
+        return False
+    frappe.db.delete(REMOTE_OBJECT_DOCTYPE, remote.name)
+    return True
+
+
+def reconcile_storage(storage, sync=True, delete_orphans=False, orphan_min_age_hours=None):
+    """
+    Compare remote objects of a storage with its "File"s and write a report
+
+    Args:
+        storage (str): DFP External Storage name
+        sync (bool): Refresh "DFP Remote Object" index first
+        delete_orphans (bool): Remove orphan remote objects (storages
+            listed by site prefixes only, see `can_delete_orphans`)
+        orphan_min_age_hours (int): Only remove orphans older than this
+
+    Returns:
+        dict: Counters and report path
+    """
+    delete_orphans = cint(delete_orphans)
+    if delete_orphans:
+        _check_delete_orphans(storage)
+    if cint(sync):
+        sync_storage(storage)
+
+    min_age = cint(orphan_min_age_hours or DEFAULT_ORPHAN_MIN_AGE_HOURS)
+    orphan_cutoff = add_to_date(now_datetime(), hours=-min_age)
+    connection = get_connection(storage) if delete_orphans else None
+    folder = get_folder(storage) if delete_orphans else None
+
+    summary = {
+        "storage": storage,
+        "matched": 0,
+        "orphans": 0,
+        "orphans_removed": 0,
+        "dangling": 0,
+        "unchecked": 0,
+        "report": _report_path(storage),
+    }
+    remote_rows = _stream(REMOTE_OBJECT_DOCTYPE, storage, ["object_key", "size", "last_modified"])
+    local_rows = _stream(KEY_REF_DOCTYPE, storage, ["s3_key", "ref_count"])
+
+    with open(summary["report"], "w", newline="", encoding="utf-8") as report_file:
+        writer = csv.writer(report_file)
+        writer.writerow(["status", "key", "size", "last_modified", "ref_count", "files", "action"])
+        for remote, local in merge_join(remote_rows, local_rows):
+            if remote and local:
+                summary["matched"] += 1
+            elif remote:
+                summary["orphans"] += 1
+                action = ""
+                if (
+                    delete_orphans
+                    and remote.last_modified
+                    and get_datetime(remote.last_modified) < orphan_cutoff
+                ):
+                    try:
+                        if _remove_orphan(storage, remote, connection, folder):
+                            summary["orphans_removed"] += 1
+                            action = "removed"
+                    except Exception as e:
+                        frappe.log_error(
+                            f"Reconcile: failed removing orphan {remote.object_key}: {str(e)}"
+                        )
+                        action = "remove failed"
+                writer.writerow(
+                    ["orphan", remote.object_key, remote.size, remote.last_modified, 0, "", action]
+                )
+            elif not _in_listed_prefixes(storage, local.s3_key):
+                summary["unchecked"] += 1
+            else:
+                summary["dangling"] += 1
+                writer.writerow(
+                    [
+                        "dangling",
+                        local.s3_key,
+                        "",
+                        "",
+                        local.ref_count,
+                        " ".join(_file_names(storage, local.s3_key)),
+                        "",
+                    ]
+                )
+
+    frappe.db.commit()
+    return summary
+
+
+def run_reconcile(storage, user, sync=True, delete_orphans=False, orphan_min_age_hours=None):
+    "Background job: reconcile a storage and notify the user who started it"
+    summary = reconcile_storage(storage, sync, delete_orphans, orphan_min_age_hours)
+    frappe.publish_realtime(DFP_RECONCILE_EVENT, summary, user=user)
+    return summary
+
+
+def enqueue_reconcile(storage, sync=True, delete_orphans=False, orphan_min_age_hours=None):
+    if not frappe.db.exists("DFP External Storage", storage):
+        frappe.throw(_("Storage {0} not found").format(storage))
+    if cint(delete_orphans):
+        _check_delete_orphans(storage)
+    frappe.enqueue(
+        "dfp_external_storage.reconcile.run_reconcile",
+        queue="long",
+        timeout=RECONCILE_JOB_TIMEOUT,
+        job_id=f"{DFP_RECONCILE_EVENT}:{storage}",
+        deduplicate=True,
+        storage=storage,
+        user=frappe.session.user,
+        sync=cint(sync),
+        delete_orphans=cint(delete_orphans),
+        orphan_min_age_hours=orphan_min_age_hours,
+    )
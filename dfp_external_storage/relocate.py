@@ -0,0 +1,156 @@
+"""
+Relocation of "File"s between DFP External Storages
+
+Changing the storage of a "File" and saving it downloads the object from the
+old storage, uploads it to the new one and removes the source. When both
+storages are S3 buckets reachable with the same endpoint and credentials the
+object is copied server side instead (CopyObject, or UploadPartCopy parts for
+objects over 5GB), so bytes never pass through the Frappe worker. Other
+pairs of external storages are piped through `transfer` without temporary
+files. Moves to the local filesystem download big objects in parallel parts
+(see `parallel_download`).
+
+After the copy the "File" is pointed to the new object directly,
+keeping the same bookkeeping a save does (key reference counts, content hash
+and presigned url caches), and the source object is removed once no other
+"File" uses it, after the transaction commits.
+"""
+
+import posixpath
+
+import frappe
+from frappe import _
+
+from dfp_external_storage import content_hash_cache, presigned_url_cache, transfer
+from dfp_external_storage.parallel_download import download_to_site_files
+from dfp_external_storage.dfp_external_storage.doctype.dfp_external_storage_key_ref import (
+    dfp_external_storage_key_ref as key_ref,
+)
+from dfp_external_storage.storage_backends import get_connection, get_folder, remote_stat
+from dfp_external_storage.storage_settings import get_storage_settings
+
+S3_TYPES = transfer.S3_TYPES
+RELOCATE_JOB_TIMEOUT = 6 * 60 * 60
+
+
+def can_copy_server_side(source, target):
+    "Both storages are S3 buckets of the same endpoint and credentials"
+    if get_storage_settings(source).type not in S3_TYPES:
+        return False
+    if get_storage_settings(target).type not in S3_TYPES:
+        return False
+    return get_connection(target).can_copy_from(get_connection(source))
+
+
+def _point_to(file_doc, target, key, file_url=None):
+    """
+    Move File to an object already in target storage (or a local file when
+    target is empty), with the bookkeeping of a save
+    """
+    source = file_doc.dfp_external_storage
+    source_key = file_doc.dfp_external_storage_s3_key
+    values = {"dfp_external_storage": target, "dfp_external_storage_s3_key": key}
+    if file_url:
+        values["file_url"] = file_url
+    frappe.db.set_value("File", file_doc.name, values)
+    key_ref.decrement(source, source_key)
+    content_hash_cache.after_commit(
+        content_hash_cache.forget_key, file_doc.content_hash, source, source_key
+    )
+    if target:
+        key_ref.increment(target, key)
+        content_hash_cache.after_commit(
+            content_hash_cache.set_existing_key, file_doc.content_hash, target, key
+        )
+    presigned_url_cache.purge(file_doc.name)
+
+    # Only once committed: a rollback must find the source object in place
+    content_hash_cache.after_commit(_remove_if_unused, source, source_key)
+
+
+def _remove_if_unused(storage, key):
+    "Remove a remote object that no File references anymore"
+    if not key_ref.get_ref_count(storage, key):
+        get_connection(storage).remove_object(get_folder(storage), key)
+
+
+def _free_target_key(target, key):
+    "Key for a server side copy, with a random folder level if already in use"
+    if not get_connection(target).object_exists(get_folder(target), key):
+        return key
+    folder, file_name = posixpath.split(key)
+    return posixpath.join(folder, frappe.generate_hash(length=10), file_name)
+
+
+def _relocate_remote(file_doc, target):
+    "Copy between two external storages: server side if possible, else pipelined"
+    source = file_doc.dfp_external_storage
+    key = file_doc.dfp_external_storage_s3_key
+    # Same content already in target storage: reuse it
+    new_key = content_hash_cache.get_existing_key(file_doc.content_hash, target)
+    if not new_key and can_copy_server_side(source, target):
+        size, _etag = remote_stat(source, key)
+        # Never overwrite an object of the target bucket
+        target_key = _free_target_key(target, key)
+        if not get_connection(target).copy_object(
+            get_folder(source), key, get_folder(target), target_key, size
+        ):
+            frappe.throw(_("Server side copy of {0} failed").format(file_doc.name))
+        new_key = target_key
+    elif not new_key:
+        new_key = transfer.transfer_object(file_doc, target)
+    _point_to(file_doc, target, new_key)
+
+
+def relocate_file(file_name, target_storage):
+    """
+    Move a File to another storage ("" / None for local filesystem)
+
+    Returns:
+        bool: True if File was moved
+    """
+    file_doc = frappe.get_doc("File", file_name)
+    source = file_doc.dfp_external_storage
+    target = target_storage or ""
+    if file_doc.is_folder or (source or "") == target:
+        return False
+
+    if source and target and file_doc.dfp_external_storage_s3_key:
+        _relocate_remote(file_doc, target)
+    elif source and file_doc.dfp_external_storage_s3_key:
+        # Parallel ranged download for big objects
+        _point_to(file_doc, "", "", download_to_site_files(file_doc))
+    else:
+        # From local filesystem: upload on save
+        file_doc.dfp_external_storage = target
+        file_doc.save()
+    return True
+
+
+def relocate_files(file_names, target_storage):
+    "Background job: move Files to another storage, one commit per File"
+    moved = failed = 0
+    for file_name in file_names:
+        try:
+            if relocate_file(file_name, target_storage):
+                moved += 1
+            frappe.db.commit()
+        except Exception as e:
+            frappe.db.rollback()
+            frappe.log_error(f"Relocation of file {file_name} failed: {str(e)}")
+            failed += 1
+    return {"moved": moved, "failed": failed}
+
+
+def enqueue_relocate_files(file_names, target_storage):
+    if target_storage and not frappe.db.exists(
+        "DFP External Storage", {"name": target_storage, "enabled": 1}
+    ):
+        frappe.throw(_("Storage {0} not found or disabled").format(target_storage))
+    frappe.enqueue(
+        "dfp_external_storage.relocate.relocate_files",
+        queue="long",
+        timeout=RELOCATE_JOB_TIMEOUT,
+        file_names=file_names,
+        target_storage=target_storage,
+    )
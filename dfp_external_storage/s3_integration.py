@@ -0,0 +1,379 @@
+"""
+S3 Integration for DFP External Storage
+
+boto3 based connection for "AWS S3" and "S3 Compatible" storages exposing the
+same methods as the Dropbox, Google Drive and OneDrive connectors (bucket name
+as first argument, object key as second), so generic code in
+`storage_backends` can handle S3 too.
+Uploads and copies use boto3 managed transfers: objects over the multipart
+threshold are sent in parts, several at once. Threshold, part size and
+concurrency come from storage fields or site config (see
+`storage_backends._s3_connection`).
+
+It requires the following dependencies:
+- boto3
+"""
+
+import io
+import os
+from datetime import timedelta
+from urllib.parse import quote
+
+import boto3
+import frappe
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+# CopyObject limit, bigger objects are copied by parts (UploadPartCopy)
+MAX_SINGLE_COPY_SIZE = 5 * 1024 * 1024 * 1024
+MAX_PARTS = 10000
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_MULTIPART_THRESHOLD = 64 * 1024 * 1024
+DEFAULT_MULTIPART_CHUNKSIZE = 16 * 1024 * 1024
+DEFAULT_MAX_CONCURRENCY = 8
+
+
+def part_size_for(length, part_size):
+    "Part size big enough to send `length` bytes within the parts limit"
+    if length and length > 0:
+        part_size = max(part_size, -(-length // MAX_PARTS))
+    return max(part_size, MIN_PART_SIZE)
+
+
+class S3Connection:
+    """S3 connection handler for DFP External Storage"""
+
+    def __init__(
+        self,
+        endpoint,
+        access_key,
+        secret_key,
+        region=None,
+        secure=True,
+        multipart_threshold=None,
+        multipart_chunksize=None,
+        max_concurrency=None,
+    ):
+        """
+        Initialize S3 connection
+
+        Args:
+            endpoint (str): S3 endpoint host (e.g. "s3.amazonaws.com") or url
+            access_key (str): Access key ID
+            secret_key (str): Secret access key
+            region (str): Bucket region
+            secure (bool): Use https when endpoint has no scheme
+            multipart_threshold (int): Upload in parts objects bigger than this (bytes)
+            multipart_chunksize (int): Part size (bytes)
+            max_concurrency (int): Parts sent at once
+        """
+        self.endpoint = endpoint
+        if endpoint and "://" not in endpoint:
+            endpoint = f"{'https' if secure else 'http'}://{endpoint}"
+        self.endpoint_url = endpoint
+        self.access_key = access_key
+        self.region = region if region and region != "auto" else None
+        self.multipart_threshold = multipart_threshold or DEFAULT_MULTIPART_THRESHOLD
+        self.multipart_chunksize = multipart_chunksize or DEFAULT_MULTIPART_CHUNKSIZE
+        self.max_concurrency = max_concurrency or DEFAULT_MAX_CONCURRENCY
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=self.endpoint_url,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            region_name=self.region,
+            # Enough pooled connections for parallel parts
+            config=Config(
+                signature_version="s3v4",
+                max_pool_connections=max(10, self.max_concurrency),
+            ),
+        )
+
+    def transfer_config(self, length=-1, multipart_threshold=None):
+        """
+        boto3 TransferConfig of this connection
+
+        Args:
+            length (int): Object size if known, to keep within the parts limit
+            multipart_threshold (int): Override connection threshold
+        """
+        return TransferConfig(
+            multipart_threshold=multipart_threshold or self.multipart_threshold,
+            multipart_chunksize=part_size_for(length, self.multipart_chunksize),
+            max_concurrency=self.max_concurrency,
+            use_threads=self.max_concurrency > 1,
+        )
+
+    def stat_object(self, bucket, key):
+        """
+        Get object metadata
+
+        Returns:
+            dict: head_object response
+        """
+        try:
+            return self.client.head_object(Bucket=bucket, Key=key)
+        except Exception as e:
+            frappe.log_error(f"S3 stat error: {str(e)}")
+            raise
+
+    def object_exists(self, bucket, key):
+        "Object exists in bucket (other errors than not found are raised)"
+        try:
+            self.client.head_object(Bucket=bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    def read_range(self, bucket, key, offset, length=0):
+        """
+        Read a byte range of an object
+
+        Args:
+            bucket (str): Bucket name
+            key (str): Object key
+            offset (int): Start byte position
+            length (int): Number of bytes to read (0 to read until the end)
+
+        Returns:
+            bytes: Range content
+        """
+        range_end = "" if length <= 0 else str(offset + length - 1)
+        response = self.client.get_object(
+            Bucket=bucket, Key=key, Range=f"bytes={offset}-{range_end}"
+        )
+        return response["Body"].read()
+
+    def get_object(self, bucket, key, offset=0, length=0):
+        """
+        Get object content
+
+        Returns:
+            BytesIO: Object content as a file-like object
+        """
+        try:
+            if offset > 0 or length > 0:
+                return io.BytesIO(self.read_range(bucket, key, offset, length))
+            response = self.client.get_object(Bucket=bucket, Key=key)
+            return io.BytesIO(response["Body"].read())
+        except Exception as e:
+            frappe.log_error(f"S3 download error: {str(e)}")
+            raise
+
+    def fget_object(self, bucket, key, local_path):
+        """
+        Download an object to a local path: ranged, resumable and parallel
+        for big objects (see `parallel_download`)
+
+        Returns:
+            bool: True if file was successfully downloaded
+        """
+        from dfp_external_storage.parallel_download import download_ranges_to_file
+
+        metadata = self.stat_object(bucket, key)
+        download_ranges_to_file(
+            lambda offset, length: self.read_range(bucket, key, offset, length),
+            int(metadata.get("ContentLength") or 0),
+            local_path,
+            (metadata.get("ETag") or "").strip('"'),
+        )
+        return True
+
+    def put_object(self, bucket, key, data, metadata=None, length=-1):
+        """
+        Upload a file-like object
+
+        boto3 managed upload reads it sequentially, switching to parallel
+        multipart upload for big objects, so non seekable streams work too.
+
+        Args:
+            metadata (dict): {"Content-Type": ...} (optional)
+            length (int): Data size (optional, keeps big uploads within the
+                parts limit)
+        """
+        try:
+            self.client.upload_fileobj(
+                data,
+                bucket,
+                key,
+                ExtraArgs=self._extra_args(metadata),
+                Config=self.transfer_config(length),
+            )
+            return key
+        except Exception as e:
+            frappe.log_error(f"S3 upload error: {str(e)}")
+            raise
+
+    def upload_file(self, bucket, key, local_path, metadata=None):
+        """
+        Upload a local file, in parallel parts when over the multipart threshold
+
+        Returns:
+            str: Object key
+        """
+        try:
+            self.client.upload_file(
+                local_path,
+                bucket,
+                key,
+                ExtraArgs=self._extra_args(metadata),
+                Config=self.transfer_config(os.path.getsize(local_path)),
+            )
+            return key
+        except Exception as e:
+            frappe.log_error(f"S3 upload error: {str(e)}")
+            raise
+
+    @staticmethod
+    def _extra_args(metadata):
+        if metadata and metadata.get("Content-Type"):
+            return {"ContentType": metadata["Content-Type"]}
+        return None
+
+    def create_multipart_upload(self, bucket, key, content_type=None):
+        "Start a multipart upload, returning its UploadId"
+        params = {"Bucket": bucket, "Key": key}
+        if content_type:
+            params["ContentType"] = content_type
+        return self.client.create_multipart_upload(**params)["UploadId"]
+
+    def presigned_upload_part(self, bucket, key, upload_id, part_number, expires=timedelta(hours=1)):
+        "Presigned url the browser PUTs one part of a multipart upload to"
+        return self.client.generate_presigned_url(
+            "upload_part",
+            Params={
+                "Bucket": bucket,
+                "Key": key,
+                "UploadId": upload_id,
+                "PartNumber": part_number,
+            },
+            ExpiresIn=int(expires.total_seconds()),
+        )
+
+    def complete_multipart_upload(self, bucket, key, upload_id, parts):
+        """
+        Args:
+            parts (list): [{"PartNumber": int, "ETag": str}] in part order
+        """
+        return self.client.complete_multipart_upload(
+            Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+        )
+
+    def abort_multipart_upload(self, bucket, key, upload_id):
+        try:
+            self.client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        except ClientError as e:
+            frappe.log_error(f"S3 abort multipart upload error: {str(e)}")
+
+    def remove_object(self, bucket, key):
+        try:
+            self.client.delete_object(Bucket=bucket, Key=key)
+            return True
+        except ClientError as e:
+            frappe.log_error(f"S3 delete error: {str(e)}")
+            return False
+
+    def can_copy_from(self, other):
+        "Objects of the other connection can be copied server side by this one"
+        return (
+            isinstance(other, S3Connection)
+            and self.endpoint_url == other.endpoint_url
+            and self.access_key == other.access_key
+        )
+
+    def copy_object(self, src_bucket, src_key, bucket, key, length=-1):
+        """
+        Server side copy, object content never leaves the provider
+
+        boto3 managed copy uses CopyObject up to 5GB and UploadPartCopy parts
+        above it.
+
+        Returns:
+            bool: True if copy succeeded
+        """
+        try:
+            self.client.copy(
+                {"Bucket": src_bucket, "Key": src_key},
+                bucket,
+                key,
+                Config=self.transfer_config(length, MAX_SINGLE_COPY_SIZE),
+            )
+            return True
+        except ClientError as e:
+            frappe.log_error(f"S3 copy error: {str(e)}")
+            return False
+
+    def list_objects_page(self, bucket, prefix="", cursor=None, page_size=200):
+        """
+        One page of objects under a key prefix, in key order
+
+        Args:
+            bucket (str): Bucket name
+            prefix (str): Key prefix
+            cursor (str): Continuation token returned by previous page
+            page_size (int): Max objects per page
+
+        Returns:
+            tuple: (list of object metadata dicts, next cursor or None)
+        """
+        params = {"Bucket": bucket, "Prefix": prefix or "", "MaxKeys": page_size}
+        if cursor:
+            params["ContinuationToken"] = cursor
+        response = self.client.list_objects_v2(**params)
+        items = [
+            {
+                "key": obj["Key"],
+                "object_name": obj["Key"],
+                "size": obj.get("Size", 0),
+                "etag": obj.get("ETag", "").strip('"'),
+                "last_modified": obj.get("LastModified"),
+                "is_dir": False,
+                "storage_class": obj.get("StorageClass", ""),
+                "metadata": {},
+            }
+            for obj in response.get("Contents", [])
+        ]
+        return items, response.get("NextContinuationToken") if response.get("IsTruncated") else None
+
+    def presigned_get_object(self, bucket, key, expires=timedelta(hours=3), response_headers=None):
+        """
+        Create a presigned download url
+
+        Args:
+            bucket (str): Bucket name
+            key (str): Object key
+            expires (timedelta): How long the url should be valid
+            response_headers (dict): Response overrides, e.g.
+                {"ResponseContentDisposition": "attachment"}
+
+        Returns:
+            str: Presigned url
+        """
+        try:
+            params = {"Bucket": bucket, "Key": key}
+            params.update(response_headers or {})
+            return self.client.generate_presigned_url(
+                "get_object",
+                Params=params,
+                ExpiresIn=int(expires.total_seconds()) if expires else 3600,
+            )
+        except Exception as e:
+            frappe.log_error(f"S3 presigned URL error: {str(e)}")
+            return None
+
+    def direct_download_url(self, bucket, key, expires=timedelta(minutes=5), file_name=None):
+        """
+        Short lived presigned url serving object content
+
+        Args:
+            file_name (str): Served as inline Content-Disposition file name
+        """
+        response_headers = {}
+        if file_name:
+            response_headers["ResponseContentDisposition"] = (
+                f"inline; filename*=UTF-8''{quote(file_name)}"
+            )
+        return self.presigned_get_object(bucket, key, expires, response_headers)
@@ -0,0 +1,370 @@
+"""
+Storage type dispatch for DFP External Storage
+
+Connectors (S3, Dropbox, Google Drive, OneDrive) share the same method names
+(`get_object`, `read_range`, `stat_object`, ...) taking a folder/bucket first
+argument and the remote key. This module builds the right connection for a
+"DFP External Storage" and normalizes the few things that differ between
+them, so callers can work with any storage type.
+
+Connections are reused per process until the storage settings change: creating
+them means OAuth token refreshes and API discovery calls.
+"""
+
+from urllib.parse import quote
+
+import frappe
+from frappe.utils import cint
+
+from dfp_external_storage import disk_cache
+from dfp_external_storage.file_proxy import open_range_proxy
+from dfp_external_storage.storage_settings import get_storage_settings
+
+# {(site, storage name): (settings version, connection)}
+_connections = {}
+
+
+def _s3_transfer_setting(settings, name):
+    "Storage field, else `dfp_external_storage_s3_<name>` site config"
+    return cint(settings.get(name)) or cint(frappe.conf.get(f"dfp_external_storage_s3_{name}"))
+
+
+def _s3_connection(settings):
+    from dfp_external_storage.s3_integration import S3Connection
+
+    return S3Connection(
+        endpoint=settings.get("endpoint"),
+        access_key=settings.get("access_key"),
+        secret_key=settings.credentials.get("secret_key"),
+        region=settings.get("region"),
+        secure=bool(settings.get("secure", 1)),
+        multipart_threshold=_s3_transfer_setting(settings, "multipart_threshold"),
+        multipart_chunksize=_s3_transfer_setting(settings, "multipart_chunksize"),
+        max_concurrency=_s3_transfer_setting(settings, "max_concurrency"),
+    )
+
+
+def _dropbox_connection(settings):
+    from dfp_external_storage.dropbox_integration import DropboxConnection
+
+    return DropboxConnection(
+        app_key=settings.get("dropbox_app_key"),
+        app_secret=settings.credentials.get("dropbox_app_secret"),
+        refresh_token=settings.credentials.get("dropbox_refresh_token"),
+    )
+
+
+def _google_drive_connection(settings):
+    from dfp_external_storage.gdrive_integration import GoogleDriveConnection
+
+    return GoogleDriveConnection(
+        client_id=settings.get("google_client_id"),
+        client_secret=settings.credentials.get("google_client_secret"),
+        refresh_token=settings.credentials.get("google_refresh_token"),
+    )
+
+
+def _onedrive_connection(settings):
+    from dfp_external_storage.onedrive_integration import OneDriveConnection
+
+    return OneDriveConnection(
+        client_id=settings.get("onedrive_client_id"),
+        client_secret=settings.credentials.get("onedrive_client_secret"),
+        tenant=settings.get("onedrive_tenant", "common"),
+        refresh_token=settings.credentials.get("onedrive_refresh_token"),
+    )
+
+
+CONNECTION_FACTORIES = {
+    "AWS S3": _s3_connection,
+    "S3 Compatible": _s3_connection,
+    "Dropbox": _dropbox_connection,
+    "Google Drive": _google_drive_connection,
+    "OneDrive": _onedrive_connection,
+}
+
+# Field holding the connector "folder_path" / "folder_id" first argument
+FOLDER_FIELDS = {
+    "AWS S3": "bucket_name",
+    "S3 Compatible": "bucket_name",
+    "Dropbox": "dropbox_folder_path",
+    "Google Drive": "google_folder_id",
+    "OneDrive": "onedrive_folder_id",
+}
+
+
+# Storage types whose connector has `direct_download_url()`
+DIRECT_DOWNLOAD_TYPES = ("AWS S3", "S3 Compatible", "Dropbox", "OneDrive")
+
+
+def _s3_stat(metadata):
+    return int(metadata.get("ContentLength") or 0), (metadata.get("ETag") or "").strip('"')
+
+
+def _dropbox_stat(metadata):
+    return metadata.size, metadata.content_hash or metadata.rev
+
+
+def _google_drive_stat(metadata):
+    return int(metadata.get("size") or 0), metadata.get("md5Checksum") or ""
+
+
+def _onedrive_stat(metadata):
+    return int(metadata.get("size") or 0), metadata.get("eTag") or ""
+
+
+STAT_NORMALIZERS = {
+    "AWS S3": _s3_stat,
+    "S3 Compatible": _s3_stat,
+    "Dropbox": _dropbox_stat,
+    "Google Drive": _google_drive_stat,
+    "OneDrive": _onedrive_stat,
+}
+
+
+def get_connection(storage):
+    """
+    Get connection for a "DFP External Storage"
+
+    Args:
+        storage (str): DFP External Storage name
+
+    Returns:
+        Connection object of the storage type
+    """
+    settings = get_storage_settings(storage)
+    factory = CONNECTION_FACTORIES.get(settings.type)
+    if not factory:
+        frappe.throw(
+            frappe._("Storage type {0} is not supported here").format(settings.type)
+        )
+
+    cache_key = (frappe.local.site, storage)
+    version, connection = _connections.get(cache_key, (None, None))
+    if version != settings.version:
+        connection = factory(settings)
+        _connections[cache_key] = (settings.version, connection)
+    return connection
+
+
+def get_folder(storage):
+    "Folder / bucket argument expected by the storage connector"
+    settings = get_storage_settings(storage)
+    return settings.get(FOLDER_FIELDS.get(settings.type))
+
+
+def remote_stat(storage, key, connection=None):
+    """
+    Size and etag of a remote object
+
+    Returns:
+        tuple: (size in bytes, etag string)
+    """
+    settings = get_storage_settings(storage)
+    connection = connection or get_connection(storage)
+    metadata = connection.stat_object(get_folder(storage), key)
+    return STAT_NORMALIZERS[settings.type](metadata)
+
+
+def supports_direct_download(storage):
+    "Storage connector can hand out short lived urls serving file content"
+    return get_storage_settings(storage).type in DIRECT_DOWNLOAD_TYPES
+
+
+def get_direct_download_url(file_doc, expires, connection=None):
+    """
+    Short lived url the browser can download File content from
+
+    S3 presigned urls, Dropbox temporary links and OneDrive download urls are
+    used. Google Drive has no pre-authenticated content urls, so None is
+    returned for it (as for any failure) and callers must stream the file.
+
+    Args:
+        file_doc: File doc within an external storage
+        expires (timedelta): Wanted validity (S3 only, others have fixed ones)
+        connection: Connection to reuse (optional)
+
+    Returns:
+        str: Url or None
+    """
+    storage = file_doc.dfp_external_storage
+    if not supports_direct_download(storage):
+        return None
+    connection = connection or get_connection(storage)
+    kwargs = {"expires": expires}
+    if get_storage_settings(storage).type in ("AWS S3", "S3 Compatible"):
+        kwargs["file_name"] = file_doc.file_name
+    try:
+        return connection.direct_download_url(
+            get_folder(storage), file_doc.dfp_external_storage_s3_key, **kwargs
+        )
+    except Exception as e:
+        frappe.log_error(f"Direct download url error: {str(e)}")
+        return None
+
+
+def get_presigned_url(file_doc, expires, disposition="inline", connection=None):
+    """
+    Mint a presigned (or provider shareable) url for a File
+
+    Args:
+        file_doc: File doc within an external storage
+        expires (timedelta): Url validity
+        disposition (str): "inline" or "attachment" (S3 only)
+        connection: Connection to reuse (optional)
+
+    Returns:
+        str: Url or None
+    """
+    storage = file_doc.dfp_external_storage
+    key = file_doc.dfp_external_storage_s3_key
+    connection = connection or get_connection(storage)
+    if get_storage_settings(storage).type in ("AWS S3", "S3 Compatible"):
+        return connection.presigned_get_object(
+            get_folder(storage),
+            key,
+            expires,
+            response_headers={
+                "ResponseContentDisposition": (
+                    f"{disposition}; filename*=UTF-8''{quote(file_doc.file_name or key)}"
+                )
+            },
+        )
+    return connection.presigned_get_object(get_folder(storage), key, expires)
+
+
+def get_presigned_urls(storage, file_docs, expires, disposition="inline"):
+    """
+    Mint presigned urls for many Files of the same storage
+
+    Connectors having `presigned_get_objects()` (OneDrive JSON batching) sign
+    all of them in a few requests, others reuse one connection for all files.
+
+    Returns:
+        dict: {File name: url or None}
+    """
+    connection = get_connection(storage)
+    if hasattr(connection, "presigned_get_objects"):
+        keys = [d.dfp_external_storage_s3_key for d in file_docs]
+        links = connection.presigned_get_objects(get_folder(storage), keys, expires)
+        return {d.name: links.get(d.dfp_external_storage_s3_key) for d in file_docs}
+
+    urls = {}
+    for file_doc in file_docs:
+        try:
+            urls[file_doc.name] = get_presigned_url(file_doc, expires, disposition, connection)
+        except Exception as e:
+            frappe.log_error(f"Presigned url error: {str(e)}")
+            urls[file_doc.name] = None
+    return urls
+
+
+def default_list_prefixes(storage):
+    "Prefixes holding this site files: site folders on S3, storage folder elsewhere"
+    if get_storage_settings(storage).type in ("AWS S3", "S3 Compatible"):
+        return [f"{frappe.local.site}/", "Home/"]
+    return [""]
+
+
+def list_objects_page(storage, prefix="", cursor=None, page_size=200):
+    """
+    One page of remote objects of a storage under a prefix
+
+    The prefix is pushed down to the provider: S3 key `Prefix`, or a
+    subfolder path of the storage folder for Dropbox, Google Drive and
+    OneDrive. Listings are recursive on every storage type (files of nested
+    subfolders included, folders themselves left out) and come in the
+    provider order.
+
+    Returns:
+        tuple: (list of object dicts with key (as stored in File
+            `dfp_external_storage_s3_key`), object_name, size, etag,
+            last_modified, is_dir, storage_class and metadata, next cursor
+            or None)
+    """
+    connection = get_connection(storage)
+    return connection.list_objects_page(get_folder(storage), prefix, cursor, page_size)
+
+
+def _remote_file(file_doc, connection=None):
+    "(storage, key, connection, folder) of a remote File"
+    storage = file_doc.dfp_external_storage
+    key = file_doc.dfp_external_storage_s3_key
+    if not storage or not key:
+        frappe.throw(frappe._("File is not within an external storage"))
+    return storage, key, connection or get_connection(storage), get_folder(storage)
+
+
+def open_cached_file(file_doc, connection=None):
+    """
+    Open a remote File from the local disk cache, downloading it there first
+    on a miss (see `disk_cache`)
+
+    Returns:
+        file: Opened binary local file, or None when the File is not
+            cacheable (too big, or cache disabled)
+    """
+    _storage, key, connection, folder = _remote_file(file_doc, connection)
+    return disk_cache.open_file(
+        file_doc, lambda local_path: connection.fget_object(folder, key, local_path)
+    )
+
+
+def fill_disk_cache(file_name):
+    "Background job: download a File into the local disk cache"
+    cached = open_cached_file(frappe.get_doc("File", file_name))
+    if cached:
+        cached.close()
+
+
+def enqueue_fill_disk_cache(file_doc):
+    "Fill the local disk cache with a File in background, one job per content"
+    frappe.enqueue(
+        "dfp_external_storage.storage_backends.fill_disk_cache",
+        queue="long",
+        job_id=f"dfp_disk_cache_fill:{disk_cache.cache_id_for(file_doc)}",
+        deduplicate=True,
+        file_name=file_doc.name,
+    )
+
+
+def open_file(file_doc, connection=None):
+    """
+    Full content of a remote File as a file-like object, read through the
+    local disk cache when the File is cacheable, any storage type
+
+    Returns:
+        file: Local cached file or remote content
+    """
+    _storage, key, connection, folder = _remote_file(file_doc, connection)
+    return open_cached_file(file_doc, connection) or connection.get_object(folder, key)
+
+
+def get_file_proxy(file_doc, connection=None, **kwargs):
+    """
+    Seekable, lazy, read only file-like object over a remote File
+
+    Files within the local disk cache budget are opened from it (downloaded
+    there first on a miss). Bigger ones are read by ranges through a block
+    cache (see `file_proxy`), so zipfile, media probing or partial reads do
+    not download the whole object.
+
+    Args:
+        file_doc: File doc within an external storage
+        connection: Connection to reuse (optional)
+        **kwargs: Extra `file_proxy.RangeFileProxy` arguments
+
+    Returns:
+        io.BufferedReader
+    """
+    storage, key, connection, folder = _remote_file(file_doc, connection)
+    cached = open_cached_file(file_doc, connection)
+    if cached:
+        return cached
+
+    size, etag = remote_stat(storage, key, connection)
+
+    def read_range(offset, length):
+        return connection.read_range(folder, key, offset, length)
+
+    return open_range_proxy(read_range, size, source_id=f"{storage}:{key}:{etag}", **kwargs)
@@ -0,0 +1,141 @@
+"""
+Settings snapshots for DFP External Storage
+
+Hot paths (presigned urls, file rendering, connectors) need the settings of a
+"DFP External Storage" on every call. Loading the doc, parsing its text
+settings and decrypting its secrets each time is wasteful, so this module
+builds an immutable snapshot per storage and keeps it in process memory.
+
+Each snapshot carries the version stamp it was built with. The stamp lives in
+Redis and is replaced every time a save of the storage doc commits, so all
+workers rebuild their snapshot on next use (never from the uncommitted row).
+"""
+
+from dataclasses import dataclass, field
+from types import MappingProxyType
+
+import frappe
+
+DFP_SETTINGS_VERSION_CACHE_PREFIX = "dfp_external_storage_settings_version:"
+
+# Secret fields decrypted into snapshot, per storage type
+CREDENTIAL_FIELDS = {
+    "AWS S3": ("secret_key",),
+    "S3 Compatible": ("secret_key",),
+    "Google Drive": ("google_client_secret", "google_refresh_token"),
+    "OneDrive": ("onedrive_client_secret", "onedrive_refresh_token"),
+    "Dropbox": ("dropbox_app_secret", "dropbox_refresh_token"),
+}
+
+# {(site, storage name): StorageSettings}
+_snapshots = {}
+
+
+@dataclass(frozen=True)
+class StorageSettings:
+    name: str
+    version: str
+    type: str
+    enabled: bool
+    presigned_urls: bool
+    presigned_mimetypes_starting: tuple
+    presigned_url_expiration: int
+    stream_buffer_size: int
+    cache_files_smaller_than: int
+    cache_expiration_secs: int
+    credentials: MappingProxyType = field(repr=False)
+    values: MappingProxyType = field(repr=False)
+
+    def get(self, fieldname, default=None):
+        "Any other (non secret) field of the storage doc"
+        value = self.values.get(fieldname)
+        return default if value is None else value
+
+    def presigned_url_allowed(self, mimetype):
+        "Presigned urls enabled and allowed for given mimetype"
+        if not self.presigned_urls:
+            return False
+        if not self.presigned_mimetypes_starting or not mimetype:
+            return True
+        return mimetype.startswith(self.presigned_mimetypes_starting)
+
+
+def _version_cache_key(storage):
+    return f"{DFP_SETTINGS_VERSION_CACHE_PREFIX}{storage}"
+
+
+def get_settings_version(storage):
+    version = frappe.cache().get_value(_version_cache_key(storage))
+    if not version:
+        # First use or Redis flushed: any new stamp invalidates older snapshots
+        version = bump_settings_version(storage)
+    return version
+
+
+def bump_settings_version(storage):
+    version = frappe.generate_hash(length=12)
+    frappe.cache().set_value(_version_cache_key(storage), version)
+    return version
+
+
+def build_storage_settings(storage, version):
+    doc = frappe.get_doc("DFP External Storage", storage)
+
+    credentials = {
+        fieldname: doc.get_password(fieldname, raise_exception=False)
+        for fieldname in CREDENTIAL_FIELDS.get(doc.type, ())
+    }
+    password_fields = {df.fieldname for df in doc.meta.get("fields", {"fieldtype": "Password"})}
+    values = {
+        k: v
+        for k, v in doc.as_dict(no_default_fields=True).items()
+        if k not in password_fields and not isinstance(v, list)
+    }
+    mimetypes = tuple(
+        i.strip() for i in (doc.get("presigned_mimetypes_starting") or "").split("\n") if i.strip()
+    )
+
+    return StorageSettings(
+        name=doc.name,
+        version=version,
+        type=doc.type,
+        enabled=bool(doc.enabled),
+        presigned_urls=bool(doc.get("presigned_urls")),
+        presigned_mimetypes_starting=mimetypes,
+        presigned_url_expiration=int(doc.get("setting_presigned_url_expiration") or 0),
+        stream_buffer_size=int(doc.get("setting_stream_buffer_size") or 0),
+        cache_files_smaller_than=int(doc.get("setting_cache_files_smaller_than") or 0),
+        cache_expiration_secs=int(doc.get("setting_cache_expiration_secs") or 0),
+        credentials=MappingProxyType(credentials),
+        values=MappingProxyType(values),
+    )
+
+
+def get_storage_settings(storage):
+    """
+    Get settings snapshot of a "DFP External Storage"
+
+    Args:
+        storage (str): DFP External Storage name
+
+    Returns:
+        StorageSettings: Immutable snapshot, rebuilt only after the doc changes
+    """
+    version = get_settings_version(storage)
+    cache_key = (frappe.local.site, storage)
+    snapshot = _snapshots.get(cache_key)
+    if not snapshot or snapshot.version != version:
+        snapshot = build_storage_settings(storage, version)
+        _snapshots[cache_key] = snapshot
+    return snapshot
+
+
+def _invalidate(site, storage):
+    bump_settings_version(storage)
+    _snapshots.pop((site, storage), None)
+
+
+def hook_storage_changed(doc, method=None):
+    "Invalidate snapshots in all workers once the change is committed"
+    site, storage = frappe.local.site, doc.name
+    frappe.db.after_commit.add(lambda: _invalidate(site, storage))
@@ -0,0 +1,135 @@
+import io
+import os
+import unittest
+
+from dfp_external_storage.file_proxy import BlockCache, RangeFileProxy, open_range_proxy
+
+BLOCK_SIZE = 16
+
+
+class RemoteObject:
+    "In memory object answering ranged reads, recording them"
+
+    def __init__(self, data):
+        self.data = data
+        self.reads = []
+
+    def read_range(self, offset, length):
+        self.reads.append((offset, length))
+        return self.data[offset : offset + length]
+
+
+def make_proxy(remote, **kwargs):
+    kwargs.setdefault("block_size", BLOCK_SIZE)
+    return RangeFileProxy(remote.read_range, len(remote.data), **kwargs)
+
+
+class TestRangeFileProxy(unittest.TestCase):
+    def setUp(self):
+        self.data = os.urandom(10 * BLOCK_SIZE + 5)
+        self.remote = RemoteObject(self.data)
+
+    def test_random_reads_match_content(self):
+        proxy = open_range_proxy(self.remote.read_range, len(self.data), block_size=BLOCK_SIZE)
+        for offset, length in ((0, 3), (15, 2), (40, 50), (len(self.data) - 7, 100), (5, 0)):
+            proxy.seek(offset)
+            self.assertEqual(proxy.read(length), self.data[offset : offset + length])
+        proxy.seek(0)
+        self.assertEqual(proxy.read(), self.data)
+
+    def test_reads_are_block_aligned_and_cached(self):
+        proxy = make_proxy(self.remote, readahead_max_blocks=0)
+        proxy.seek(20)
+        proxy.read(4)
+        proxy.seek(18)
+        proxy.read(10)
+        self.assertEqual(self.remote.reads, [(BLOCK_SIZE, BLOCK_SIZE)])
+
+    def test_missing_blocks_fetched_in_one_read(self):
+        proxy = make_proxy(self.remote, readahead_max_blocks=0)
+        proxy.seek(BLOCK_SIZE)
+        proxy.read(BLOCK_SIZE)
+        proxy.seek(0)
+        proxy.read(4 * BLOCK_SIZE)
+        self.assertEqual(
+            self.remote.reads,
+            [(BLOCK_SIZE, BLOCK_SIZE), (0, BLOCK_SIZE), (2 * BLOCK_SIZE, 2 * BLOCK_SIZE)],
+        )
+
+    def test_sequential_reads_grow_readahead(self):
+        proxy = make_proxy(self.remote, readahead_max_blocks=4)
+        for _ in range(4):
+            self.assertEqual(len(proxy.read(BLOCK_SIZE)), BLOCK_SIZE)
+        # Readahead 0, then 1 block, 2 blocks (already cached), 4 blocks
+        lengths = [length for _offset, length in self.remote.reads]
+        self.assertEqual(lengths, [BLOCK_SIZE, 2 * BLOCK_SIZE, 5 * BLOCK_SIZE])
+
+    def test_seek_resets_readahead(self):
+        proxy = make_proxy(self.remote, readahead_max_blocks=4)
+        proxy.read(BLOCK_SIZE)
+        proxy.read(BLOCK_SIZE)
+        proxy.seek(8 * BLOCK_SIZE)
+        proxy.read(BLOCK_SIZE)
+        self.assertEqual(self.remote.reads[-1], (8 * BLOCK_SIZE, BLOCK_SIZE))
+
+    def test_reads_past_end(self):
+        proxy = make_proxy(self.remote)
+        self.assertEqual(proxy.seek(0, io.SEEK_END), len(self.data))
+        self.assertEqual(proxy.read(10), b"")
+        proxy.seek(len(self.data) + 10)
+        self.assertEqual(proxy.read(10), b"")
+        self.assertEqual(self.remote.reads, [])
+
+    def test_invalid_seeks(self):
+        proxy = make_proxy(self.remote)
+        with self.assertRaises(ValueError):
+            proxy.seek(-1)
+        with self.assertRaises(ValueError):
+            proxy.seek(0, 5)
+
+    def test_short_read_raises_and_is_not_cached(self):
+        truncated = RemoteObject(self.data)
+        truncated.read_range = lambda offset, length: self.data[offset : offset + length - 1]
+        shared = BlockCache(16)
+        proxy = RangeFileProxy(
+            truncated.read_range,
+            len(self.data),
+            block_size=BLOCK_SIZE,
+            shared_cache=shared,
+            source_id="object",
+        )
+        with self.assertRaises(IOError):
+            proxy.read(4)
+        self.assertEqual(len(shared), 0)
+
+        # Same cache, correct reads: nothing truncated is served
+        proxy = RangeFileProxy(
+            self.remote.read_range,
+            len(self.data),
+            block_size=BLOCK_SIZE,
+            shared_cache=shared,
+            source_id="object",
+        )
+        self.assertEqual(proxy.read(4), self.data[:4])
+
+    def test_shared_cache_between_proxies(self):
+        shared = BlockCache(16)
+        first = make_proxy(self.remote, shared_cache=shared, source_id="a", readahead_max_blocks=0)
+        first.read(BLOCK_SIZE)
+        second = make_proxy(self.remote, shared_cache=shared, source_id="a", readahead_max_blocks=0)
+        self.assertEqual(second.read(BLOCK_SIZE), self.data[:BLOCK_SIZE])
+        self.assertEqual(len(self.remote.reads), 1)
+
+        other = make_proxy(self.remote, shared_cache=shared, source_id="b", readahead_max_blocks=0)
+        other.read(BLOCK_SIZE)
+        self.assertEqual(len(self.remote.reads), 2)
+
+    def test_block_cache_lru(self):
+        cache = BlockCache(2)
+        cache.put("a", b"1")
+        cache.put("b", b"2")
+        cache.get("a")
+        cache.put("c", b"3")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), b"1")
+        self.assertEqual(cache.get("c"), b"3")
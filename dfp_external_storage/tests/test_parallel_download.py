@@ -0,0 +1,125 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from unittest.mock import patch
+
+from frappe.tests.utils import FrappeTestCase
+
+from dfp_external_storage import parallel_download
+from dfp_external_storage.parallel_download import PARTIAL_SUFFIX, download_ranges_to_file
+
+PART_SIZE = 10
+
+
+class RemoteObject:
+    "In memory object answering ranged reads, failing the ones asked to"
+
+    def __init__(self, data):
+        self.data = data
+        self.reads = []
+        self.failing_offsets = set()
+        self.short_reads = 0
+        self._lock = threading.Lock()
+
+    def read_range(self, offset, length):
+        with self._lock:
+            self.reads.append(offset)
+            if offset in self.failing_offsets:
+                raise ConnectionError(f"Read failed at {offset}")
+            if self.short_reads:
+                self.short_reads -= 1
+                return self.data[offset : offset + length - 1]
+        return self.data[offset : offset + length]
+
+
+@patch.object(parallel_download, "RETRY_BACKOFF", 0)
+class TestDownloadRangesToFile(FrappeTestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "object")
+        self.data = os.urandom(9 * PART_SIZE + 3)
+        self.remote = RemoteObject(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def download(self, etag="v1", concurrency=1):
+        return download_ranges_to_file(
+            self.remote.read_range,
+            len(self.data),
+            self.path,
+            etag=etag,
+            part_size=PART_SIZE,
+            concurrency=concurrency,
+        )
+
+    def assert_downloaded(self):
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(os.path.exists(self.path + PARTIAL_SUFFIX))
+        self.assertFalse(os.path.exists(self.path + PARTIAL_SUFFIX + ".json"))
+
+    def test_download(self):
+        self.assertEqual(self.download(), len(self.data))
+        self.assert_downloaded()
+        self.assertEqual(len(self.remote.reads), 10)
+
+    def test_parallel_download(self):
+        with patch.object(parallel_download, "DEFAULT_PARALLEL_THRESHOLD", 1):
+            self.download(concurrency=4)
+        self.assert_downloaded()
+
+    def test_empty_object(self):
+        self.data = b""
+        self.remote = RemoteObject(self.data)
+        self.assertEqual(self.download(), 0)
+        self.assert_downloaded()
+
+    def test_short_reads_are_retried(self):
+        self.remote.short_reads = 2
+        self.download()
+        self.assert_downloaded()
+
+    def test_failure_keeps_partial_download(self):
+        self.remote.failing_offsets = {5 * PART_SIZE}
+        with self.assertRaises(ConnectionError):
+            self.download()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertTrue(os.path.exists(self.path + PARTIAL_SUFFIX))
+        with open(self.path + PARTIAL_SUFFIX + ".json") as f:
+            self.assertEqual(json.load(f)["done"], [0, 1, 2, 3, 4])
+
+    def test_resume_reads_missing_parts_only(self):
+        self.remote.failing_offsets = {5 * PART_SIZE}
+        with self.assertRaises(ConnectionError):
+            self.download()
+
+        self.remote.failing_offsets = set()
+        self.remote.reads = []
+        self.download()
+        self.assert_downloaded()
+        self.assertEqual(self.remote.reads, [offset * PART_SIZE for offset in range(5, 10)])
+
+    def test_changed_object_is_downloaded_from_scratch(self):
+        self.remote.failing_offsets = {5 * PART_SIZE}
+        with self.assertRaises(ConnectionError):
+            self.download(etag="v1")
+
+        self.data = os.urandom(len(self.data))
+        self.remote = RemoteObject(self.data)
+        self.download(etag="v2")
+        self.assert_downloaded()
+        self.assertEqual(len(self.remote.reads), 10)
+
+    def test_no_resume_without_etag(self):
+        self.remote.failing_offsets = {5 * PART_SIZE}
+        with self.assertRaises(ConnectionError):
+            self.download(etag=None)
+
+        self.remote.failing_offsets = set()
+        self.remote.reads = []
+        self.download(etag=None)
+        self.assert_downloaded()
+        self.assertEqual(len(self.remote.reads), 10)
@@ -0,0 +1,65 @@
+import io
+import os
+import queue
+
+from frappe.tests.utils import FrappeTestCase
+
+from dfp_external_storage.transfer import _END, PipeReader
+
+
+def pipe(chunks, size=None):
+    q = queue.Queue()
+    for chunk in chunks:
+        q.put(chunk)
+    if size is None:
+        size = sum(len(c) for c in chunks if isinstance(c, bytes))
+    return PipeReader(q, size)
+
+
+class TestPipeReader(FrappeTestCase):
+    def test_reads_across_chunks(self):
+        reader = pipe([b"abc", b"defg", b"h", _END])
+        self.assertEqual(reader.read(2), b"ab")
+        self.assertEqual(reader.read(4), b"cdef")
+        self.assertEqual(reader.tell(), 6)
+        self.assertEqual(reader.read(10), b"gh")
+        self.assertEqual(reader.read(10), b"")
+
+    def test_read_all(self):
+        reader = pipe([b"abc", b"def", _END])
+        self.assertEqual(reader.read(), b"abcdef")
+        self.assertEqual(reader.read(), b"")
+
+    def test_readinto(self):
+        reader = pipe([b"abc", b"def", _END])
+        buffer = bytearray(4)
+        self.assertEqual(reader.readinto(buffer), 4)
+        self.assertEqual(bytes(buffer), b"abcd")
+
+    def test_buffered_reader(self):
+        reader = io.BufferedReader(pipe([b"x" * 5000, b"y" * 5000, _END]), buffer_size=1024)
+        self.assertEqual(reader.read(), b"x" * 5000 + b"y" * 5000)
+
+    def test_virtual_seeks(self):
+        reader = pipe([b"abc", b"def", _END])
+        # Size probing: seek to end and back to the current position
+        self.assertEqual(reader.seek(0, os.SEEK_END), 6)
+        self.assertEqual(reader.seek(0), 0)
+        self.assertEqual(reader.read(2), b"ab")
+        self.assertEqual(reader.seek(0, os.SEEK_CUR), 2)
+        self.assertEqual(reader.read(), b"cdef")
+
+    def test_random_seeks_are_refused(self):
+        reader = pipe([b"abc", b"def", _END])
+        reader.read(2)
+        with self.assertRaises(io.UnsupportedOperation):
+            reader.seek(1)
+        with self.assertRaises(io.UnsupportedOperation):
+            reader.seek(4)
+        self.assertFalse(reader.seekable())
+
+    def test_reader_error_is_raised(self):
+        reader = pipe([b"abc", ConnectionError("download failed")], size=6)
+        self.assertEqual(reader.read(3), b"abc")
+        with self.assertRaises(ConnectionError):
+            reader.read(3)
@@ -0,0 +1,213 @@
+"""
+Pipelined transfer of remote objects between DFP External Storages
+
+Moving an object between providers used to load it fully in memory (or
+download it to a local file) before uploading it again. Here a reader thread
+downloads the source by ranges into a bounded queue of chunks while the
+destination connector uploads from a file-like object fed by that queue
+(multipart / upload session / resumable upload, depending on the provider), so:
+
+- download and upload overlap in time,
+- memory is bounded to the queued chunks plus what the uploader buffers,
+- no temporary file is written.
+
+Any pair of S3 (AWS / compatible), Dropbox, Google Drive and OneDrive storages
+is supported.
+"""
+
+import contextvars
+import io
+import mimetypes
+import os
+import queue
+import threading
+
+import frappe
+
+from dfp_external_storage.storage_backends import get_connection, get_folder, remote_stat
+from dfp_external_storage.storage_settings import get_storage_settings
+
+S3_TYPES = ("AWS S3", "S3 Compatible")
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+# Chunks downloaded ahead of the uploader
+DEFAULT_QUEUE_CHUNKS = 4
+# Seconds between checks of a stopped consumer while the queue is full
+PUT_POLL_INTERVAL = 1
+
+_END = object()
+
+
+class PipeReader(io.RawIOBase):
+    """
+    Read only file-like object over a queue of chunks of known total size
+
+    Only sequential reads are possible. Seeking is virtual: uploaders seeking
+    to the end to learn the size, or back to the current position, work;
+    anything else raises `io.UnsupportedOperation`.
+    """
+
+    def __init__(self, chunks, size):
+        self._chunks = chunks
+        self._size = size
+        self._buffer = b""
+        self._consumed = 0
+        self._position = 0
+        self._ended = False
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        # Streaming aware uploaders (boto3) must not rely on seeking
+        return False
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_END:
+            offset += self._size
+        elif whence == os.SEEK_CUR:
+            offset += self._position
+        if offset not in (self._consumed, self._size):
+            raise io.UnsupportedOperation("PipeReader only reads sequentially")
+        self._position = offset
+        return offset
+
+    def _next_chunk(self):
+        chunk = self._chunks.get()
+        if chunk is _END:
+            self._ended = True
+            return b""
+        if isinstance(chunk, BaseException):
+            self._ended = True
+            raise chunk
+        return chunk
+
+    def read(self, size=-1):
+        if self._position != self._consumed:
+            raise io.UnsupportedOperation("PipeReader only reads sequentially")
+        while not self._ended and (size is None or size < 0 or len(self._buffer) < size):
+            chunk = self._next_chunk()
+            if not chunk:
+                break
+            self._buffer += chunk
+        if size is None or size < 0:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        self._consumed += len(data)
+        self._position = self._consumed
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+
+def _produce(read_range, size, chunk_size, chunks, stopped):
+    "Reader thread: download ranges into the queue, waiting while it is full"
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                chunks.put(item, timeout=PUT_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for offset in range(0, size, chunk_size):
+            if not put(read_range(offset, min(chunk_size, size - offset))):
+                return
+        put(_END)
+    except Exception as e:
+        put(e)
+
+
+def _content_type(file_name):
+    return mimetypes.guess_type(file_name or "")[0] or "application/octet-stream"
+
+
+def _upload_s3(connection, folder, file_doc, data, size, key_hint):
+    key = key_hint or f"{frappe.local.site}/{file_doc.name}/{file_doc.file_name}"
+    connection.put_object(
+        folder, key, data, metadata={"Content-Type": _content_type(file_doc.file_name)}, length=size
+    )
+    return key
+
+
+def _upload_dropbox(connection, folder, file_doc, data, size, key_hint):
+    # Path unique per File: Dropbox uploads overwrite
+    name = f"{file_doc.name}/{file_doc.file_name}"
+    return connection.put_object(folder, name, data, length=size).path_display
+
+
+def _upload_google_drive(connection, folder, file_doc, data, size, key_hint):
+    metadata = {"Content-Type": _content_type(file_doc.file_name)}
+    return connection.put_object(folder, file_doc.file_name, data, metadata, size)["id"]
+
+
+def _upload_onedrive(connection, folder, file_doc, data, size, key_hint):
+    return connection.put_object(folder, file_doc.file_name, data, length=size)["id"]
+
+
+# Upload from a stream, returning the remote key stored in the File. Key hint
+# is the source key when it is an S3 one too (S3 keys are chosen by us)
+UPLOADERS = {
+    "AWS S3": _upload_s3,
+    "S3 Compatible": _upload_s3,
+    "Dropbox": _upload_dropbox,
+    "Google Drive": _upload_google_drive,
+    "OneDrive": _upload_onedrive,
+}
+
+
+def transfer_object(file_doc, target, chunk_size=None, queue_chunks=None):
+    """
+    Copy the remote object of a File to another storage
+
+    Args:
+        file_doc: File doc within an external storage
+        target (str): Target DFP External Storage name
+        chunk_size (int): Download range size
+        queue_chunks (int): Chunks buffered ahead of the uploader
+
+    Returns:
+        str: Remote key of the copy in target storage
+    """
+    source = file_doc.dfp_external_storage
+    source_key = file_doc.dfp_external_storage_s3_key
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    source_connection = get_connection(source)
+    source_folder = get_folder(source)
+    size, _etag = remote_stat(source, source_key, source_connection)
+
+    def read_range(offset, length):
+        return source_connection.read_range(source_folder, source_key, offset, length)
+
+    chunks = queue.Queue(maxsize=queue_chunks or DEFAULT_QUEUE_CHUNKS)
+    stopped = threading.Event()
+    # Context copy keeps `frappe.local` available to connectors in the thread
+    reader = threading.Thread(
+        target=contextvars.copy_context().run,
+        args=(_produce, read_range, size, chunk_size, chunks, stopped),
+        daemon=True,
+    )
+    reader.start()
+    try:
+        upload = UPLOADERS[get_storage_settings(target).type]
+        key_hint = source_key if get_storage_settings(source).type in S3_TYPES else None
+        return upload(
+            get_connection(target),
+            get_folder(target),
+            file_doc,
+            PipeReader(chunks, size),
+            size,
+            key_hint,
+        )
+    finally:
+        stopped.set()
+        reader.join()
@@ -149,6 +149,11 @@ def reconnect_files(report_data, storage_configs, storage_types):
     except ImportError:
         DFP_EXTERNAL_STORAGE_URL_SEGMENT_FOR_FILE_LOAD = "file"  # Default value
 
+    # `db_update` skips File hooks, so keep remote key references in sync here
+    from dfp_external_storage.dfp_external_storage.doctype.dfp_external_storage_key_ref.dfp_external_storage_key_ref import (
+        increment as increment_key_ref,
+    )
+
     updated_count = 0
     skipped_count = 0
     error_count = 0
@@ -202,6 +207,9 @@ def reconnect_files(report_data, storage_configs, storage_types):
 
                 # Save document
                 file_doc.db_update()
+                increment_key_ref(
+                    file_doc.dfp_external_storage, file_doc.dfp_external_storage_s3_key
+                )
                 updated_count += 1
 
             except Exception as e: